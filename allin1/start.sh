@@ -16,18 +16,36 @@ echo "[1/4] Starting supervisor (manages all services)..."
 /usr/bin/supervisord -c /etc/supervisor/supervisord.conf &
 SUPERVISOR_PID=$!
 
-# Give MariaDB time to initialize
-echo "[2/4] Waiting for MariaDB..."
-sleep 20
+# Readiness comes from the web UI's /api/ready: it re-probes the requested
+# components quickly and answers as soon as they are up
+READY_URL="http://localhost:9000/api/ready"
+
+# wait_ready <components> <seconds>: block until the web UI reports them up
+wait_ready() {
+    local deadline=$((SECONDS + $2))
+    while [ $SECONDS -lt $deadline ]; do
+        if curl -fs --max-time $(($2 + 5)) "$READY_URL?require=$1&wait=$((deadline - SECONDS))" >/dev/null 2>&1; then
+            return 0
+        fi
+        # Web UI not listening yet (or not ready when the wait ran out)
+        sleep 1
+    done
+    return 1
+}
 
-# Check MySQL connectivity
-for i in {1..60}; do
-    if mysql -u root -e "SELECT 1" >/dev/null 2>&1; then
-        echo "✓ MySQL ready"
-        break
-    fi
-    sleep 1
-done
+echo "[2/4] Waiting for MariaDB..."
+if wait_ready mariadb 90; then
+    echo "✓ MySQL ready"
+else
+    # Fall back to asking MariaDB directly
+    for i in {1..60}; do
+        if mysql -u root -e "SELECT 1" >/dev/null 2>&1; then
+            echo "✓ MySQL ready"
+            break
+        fi
+        sleep 1
+    done
+fi
 
 # Initialize Guacamole database if needed
 echo "[3/4] Setting up Guacamole database..."
@@ -113,7 +131,6 @@ SQLEOF
         # Restart Tomcat/Guacamole to clear permission caches
         echo "  Restarting Guacamole to apply permissions..."
         supervisorctl -c /etc/supervisor/supervisord.conf restart tomcat 2>/dev/null || true
-        sleep 3
     fi
 else
     echo "  Database already initialized"
@@ -133,23 +150,26 @@ EOF
 # Now that database is ready, start Tomcat/Guacamole
 echo "Starting Guacamole (Tomcat)..."
 supervisorctl -c /etc/supervisor/supervisord.conf start tomcat
-sleep 5
 
 # Wait for Guacamole to be available
 echo "Waiting for Guacamole to become available..."
 GUAC_READY=0
-for i in {1..120}; do
-    if curl -s http://localhost:8080/guacamole/ >/dev/null 2>&1; then
-        echo "✓ Guacamole ready"
-        GUAC_READY=1
-        break
-    fi
-    [ $((i % 30)) -eq 0 ] && echo "  Still starting... ($i/120s)"
-    sleep 1
-done
+if wait_ready guacamole 120; then
+    echo "✓ Guacamole ready"
+    GUAC_READY=1
+else
+    for i in {1..30}; do
+        if curl -s http://localhost:8080/guacamole/ >/dev/null 2>&1; then
+            echo "✓ Guacamole ready"
+            GUAC_READY=1
+            break
+        fi
+        sleep 1
+    done
+fi
 
 if [ $GUAC_READY -eq 0 ]; then
-    echo "✗ Guacamole failed to start after 120 seconds"
+    echo "✗ Guacamole failed to start after 150 seconds"
     echo "Checking supervisord status..."
     supervisorctl -c /etc/supervisor/supervisord.conf status
 fi
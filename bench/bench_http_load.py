@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+HTTP load test: latency and throughput of the control API under concurrency
+
+Starts openconnect-web.py as a real server in a sandbox: stub `ip` and
+`supervisorctl` on PATH, a fake supervisord XML-RPC endpoint, a stub
+resolv.conf, synthetic supervisor logs and a fake Guacamole HTTP endpoint.
+Keep-alive clients then drive the chosen endpoints at each concurrency
+level and report throughput plus p50/p95/p99 latency per endpoint. Every
+process the server forks is counted (via an audit hook and the stubs), and
+the server's RSS is sampled before and after the load.
+
+Usage: python3 bench/bench_http_load.py [--concurrency 1,8,32] [--duration 10]
+       [--endpoints /api/status,/api/logs,/api/,POST:/api/connect]
+       [--server gunicorn|waitress|dev] [--interface lo] [--no-rpc] [--json]
+"""
+
+import argparse
+import http.client
+import http.server
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import xmlrpc.server
+
+from common import WEB_SCRIPT, emit, summarize
+
+DEFAULT_ENDPOINTS = '/api/status,/api/logs,/api/,POST:/api/connect'
+
+# Installed in the server process before the app loads: every subprocess,
+# fork or exec is appended to FORK_LOG as "<pid> <event> <program>"
+LAUNCHER = '''
+import os, runpy, sys
+FORK_LOG = os.environ['BENCH_FORK_LOG']
+def hook(event, args):
+    if event in ('subprocess.Popen', 'os.posix_spawn', 'os.fork', 'os.exec', 'os.system'):
+        if event == 'os.fork':
+            program = 'fork'
+        else:
+            program = args[1] if event == 'subprocess.Popen' else args[0]
+        if isinstance(program, (list, tuple)):
+            program = program[0] if program else ''
+        with open(FORK_LOG, 'a') as f:
+            f.write(f'{os.getpid()} {event} {os.path.basename(str(program))}\\n')
+sys.addaudithook(hook)
+runpy.run_path(sys.argv[1], run_name='__main__')
+'''
+
+STUB_IP = '''#!/bin/sh
+echo "ip $*" >> "$BENCH_STUB_LOG"
+exec {real_ip} "$@"
+'''
+
+STUB_SUPERVISORCTL = '''#!/bin/sh
+echo "supervisorctl $*" >> "$BENCH_STUB_LOG"
+echo "$2: $1ed"
+'''
+
+LOG_LINES = [
+    'POST https://vpn.example.edu/',
+    'Connected to 192.0.2.10:443',
+    'Got CONNECT response: HTTP/1.1 200 OK',
+    'CSTP connected. DPD 30, Keepalive 20',
+    'Established DTLS connection (using GnuTLS).',
+    'WARNING: DTLS handshake timed out',
+    'Password:',
+]
+
+class FakeSupervisor:
+    """Just enough of supervisord's XML-RPC API for the web UI"""
+
+    def __init__(self):
+        self.state = 'RUNNING'
+        self.started = int(time.time())
+
+    def info(self, name):
+        return {'name': name, 'statename': self.state, 'pid': 4242 if self.state == 'RUNNING' else 0,
+                'start': self.started, 'now': int(time.time()), 'exitstatus': 0,
+                'spawnerr': '', 'description': 'bench stub'}
+
+    def startProcess(self, name, wait=True):
+        self.state, self.started = 'RUNNING', int(time.time())
+        return True
+
+    def stopProcess(self, name, wait=True):
+        self.state = 'STOPPED'
+        return True
+
+    def getProcessInfo(self, name):
+        return self.info(name)
+
+    def getAllProcessInfo(self):
+        return [self.info('openconnect-vpn')]
+
+class _Namespace:
+    pass
+
+class FakeGuacamole(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'<html>Guacamole</html>'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_HEAD = do_GET
+
+    def log_message(self, *args):
+        pass
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def serve_in_thread(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def build_sandbox(tmp, log_lines):
+    """Stub binaries, resolv.conf and supervisor logs under `tmp`"""
+    bin_dir = os.path.join(tmp, 'bin')
+    log_dir = os.path.join(tmp, 'log')
+    os.makedirs(bin_dir)
+    os.makedirs(log_dir)
+    real_ip = subprocess.run(['sh', '-c', 'command -v ip || echo false'], capture_output=True, text=True).stdout.strip()
+    for name, body in (('ip', STUB_IP.format(real_ip=real_ip)), ('supervisorctl', STUB_SUPERVISORCTL)):
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w') as f:
+            f.write(body)
+        os.chmod(path, 0o755)
+    resolv = os.path.join(tmp, 'resolv.conf')
+    with open(resolv, 'w') as f:
+        f.write('search example.edu\nnameserver 192.0.2.53\nnameserver 192.0.2.54\n')
+    for stream in ('out', 'err'):
+        with open(os.path.join(log_dir, f'openconnect-vpn.{stream}.log'), 'w') as f:
+            for i in range(log_lines):
+                f.write(f'2026-01-01 00:00:{i % 60:02d} {LOG_LINES[i % len(LOG_LINES)]} [{i}]\n')
+    return bin_dir, log_dir, resolv
+
+def process_tree(pid):
+    """pid plus all of its descendants"""
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+def memory_kb(pid):
+    """Summed VmRSS and VmHWM (peak) of a process tree, in kB"""
+    totals = {'rss_kb': 0, 'peak_rss_kb': 0}
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        totals['rss_kb'] += int(line.split()[1])
+                    elif line.startswith('VmHWM:'):
+                        totals['peak_rss_kb'] += int(line.split()[1])
+        except OSError:
+            pass
+    return totals
+
+def count_lines(path):
+    try:
+        with open(path) as f:
+            return sum(1 for _ in f)
+    except OSError:
+        return 0
+
+def fork_counts(fork_log, stub_log):
+    """Forks seen by the audit hook, by program, plus stub invocations"""
+    by_program = {}
+    try:
+        with open(fork_log) as f:
+            for line in f:
+                program = line.split()[-1]
+                by_program[program] = by_program.get(program, 0) + 1
+    except OSError:
+        pass
+    return {'total': sum(by_program.values()), 'by_program': by_program,
+            'stub_invocations': count_lines(stub_log)}
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/status')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def parse_endpoints(spec):
+    endpoints = []
+    for item in spec.split(','):
+        method, _, path = item.rpartition(':')
+        endpoints.append((method or 'GET', path))
+    return endpoints
+
+def run_level(port, endpoints, concurrency, duration):
+    """Each client cycles through the endpoints on its own keep-alive connection"""
+    results = {endpoint: {'durations': [], 'errors': 0, 'status': {}} for endpoint in endpoints}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = {endpoint: ([], [0], {}) for endpoint in endpoints}
+        i = offset
+        while time.perf_counter() < deadline:
+            endpoint = endpoints[i % len(endpoints)]
+            i += 1
+            durations, errors, statuses = local[endpoint]
+            method, path = endpoint
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=b'' if method == 'POST' else None)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            durations.append(time.perf_counter() - start)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+            if response.getheader('Connection', '').lower() == 'close':
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.close()
+        with lock:
+            for endpoint, (durations, errors, statuses) in local.items():
+                results[endpoint]['durations'].extend(durations)
+                results[endpoint]['errors'] += errors[0]
+                for status, count in statuses.items():
+                    results[endpoint]['status'][status] = results[endpoint]['status'].get(status, 0) + count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    cases = {}
+    for (method, path), result in results.items():
+        summary = summarize(result['durations'])
+        summary['rps'] = round(len(result['durations']) / elapsed, 1)
+        summary['errors'] = result['errors']
+        summary['status'] = {str(status): count for status, count in sorted(result['status'].items())}
+        cases[f'{method} {path} c={concurrency}'] = summary
+    return cases, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', default='1,8,32', help='comma separated client counts')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per concurrency level')
+    parser.add_argument('--endpoints', default=DEFAULT_ENDPOINTS, help='comma separated [METHOD:]path list')
+    parser.add_argument('--server', default='gunicorn', choices=('gunicorn', 'waitress', 'dev'))
+    parser.add_argument('--threads', type=int, default=16, help='WEB_THREADS for the server')
+    parser.add_argument('--interface', default='lo', help='interface standing in for tun0')
+    parser.add_argument('--log-lines', type=int, default=20000, help='lines per synthetic log')
+    parser.add_argument('--no-rpc', action='store_true', help='no supervisord RPC: exercise the supervisorctl fallback')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    endpoints = parse_endpoints(args.endpoints)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_dir, log_dir, resolv = build_sandbox(tmp, args.log_lines)
+        fork_log = os.path.join(tmp, 'forks.log')
+        stub_log = os.path.join(tmp, 'stubs.log')
+
+        guacamole = serve_in_thread(http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeGuacamole))
+        supervisor_port = free_port()
+        if not args.no_rpc:
+            rpc = xmlrpc.server.SimpleXMLRPCServer(('127.0.0.1', supervisor_port), logRequests=False, allow_none=True)
+            namespace = _Namespace()
+            namespace.supervisor = FakeSupervisor()
+            rpc.register_instance(namespace, allow_dotted_names=True)
+            serve_in_thread(rpc)
+
+        web_port = free_port()
+        env = dict(os.environ,
+                   PATH=f'{bin_dir}:{os.environ.get("PATH", "")}',
+                   BENCH_FORK_LOG=fork_log, BENCH_STUB_LOG=stub_log,
+                   WEB_SERVER=args.server, WEB_HOST='127.0.0.1', WEB_PORT=str(web_port),
+                   WEB_THREADS=str(args.threads),
+                   VPN_INTERFACE=args.interface, LOG_DIR=log_dir, RESOLV_CONF=resolv,
+                   GUACAMOLE_HOST='127.0.0.1', GUACAMOLE_PORT=str(guacamole.server_address[1]),
+                   SUPERVISOR_URL=f'http://127.0.0.1:{supervisor_port}/RPC2',
+                   VPN_PROFILES_FILE=os.path.join(tmp, 'profiles.json'),
+                   HEALTH_TARGETS='', JOB_WAIT_TIMEOUT='5')
+        env.pop('DNS_SERVERS', None)
+        server = subprocess.Popen([sys.executable, '-c', LAUNCHER, WEB_SCRIPT], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_for_server(web_port):
+                raise SystemExit('server did not come up')
+            idle = memory_kb(server.pid)
+            forks_before = fork_counts(fork_log, stub_log)
+            cases, levels_run = {}, []
+            for level in levels:
+                level_cases, elapsed = run_level(web_port, endpoints, level, args.duration)
+                cases.update(level_cases)
+                total = sum(case['count'] for case in level_cases.values())
+                levels_run.append({'concurrency': level, 'requests': total,
+                                   'rps': round(total / elapsed, 1), 'memory': memory_kb(server.pid)})
+            loaded = memory_kb(server.pid)
+            forks_after = fork_counts(fork_log, stub_log)
+        finally:
+            server.terminate()
+            try:
+                server.wait(15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        guacamole.shutdown()
+
+    total_requests = sum(level['requests'] for level in levels_run)
+    results = {
+        'server': args.server,
+        'threads': args.threads,
+        'duration_s': args.duration,
+        'supervisor': 'supervisorctl' if args.no_rpc else 'xmlrpc',
+        'levels': levels_run,
+        'memory': {'idle': idle, 'loaded': loaded},
+        'forks': {
+            'startup': forks_before,
+            'under_load': forks_after['total'] - forks_before['total'],
+            'per_1k_requests': round((forks_after['total'] - forks_before['total']) * 1000 / max(1, total_requests), 2),
+            'by_program': forks_after['by_program'],
+            'stub_invocations': forks_after['stub_invocations'],
+        },
+        'cases': cases,
+    }
+    emit(results, args.json)
+    if not args.json:
+        for level in levels_run:
+            print(f"c={level['concurrency']:<4} {level['rps']} req/s  rss={level['memory']['rss_kb']} kB")
+        print(f"forks under load: {results['forks']['under_load']} "
+              f"({results['forks']['per_1k_requests']} per 1k requests) {results['forks']['by_program']}")
+        print(f"rss idle={idle['rss_kb']} kB loaded={loaded['rss_kb']} kB peak={loaded['peak_rss_kb']} kB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tail-based log reading vs reading whole supervisor logs
+
+Writes a synthetic openconnect log (100 MB by default) and compares the
+original readlines() approach with LogTail: a cold read (backwards seek
+from EOF), a warm read with nothing appended, and an incremental read
+after a small append. Peak Python memory is reported per case.
+
+Usage: python3 bench/bench_log_tail.py [--size-mb 100] [--lines 100] [--iterations 20] [--json]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common import emit, load_web_module, summarize
+
+SAMPLE_LINES = [
+    'POST https://vpn.example.edu/',
+    'Connected to 192.0.2.10:443',
+    'SSL negotiation with vpn.example.edu',
+    'Connected to HTTPS on vpn.example.edu with ciphersuite (TLS1.2)-(ECDHE-RSA)-(AES-256-GCM)',
+    'Got CONNECT response: HTTP/1.1 200 OK',
+    'CSTP connected. DPD 30, Keepalive 20',
+    'Established DTLS connection (using GnuTLS). Ciphersuite (DTLS1.2)-(ECDHE-RSA)-(AES-256-GCM).',
+    'DTLS Dead Peer Detection detected dead peer!',
+]
+
+def write_synthetic_log(path, size_mb):
+    """Write roughly `size_mb` MB of openconnect-looking lines"""
+    target = size_mb * 1024 * 1024
+    block = ''.join(f'{SAMPLE_LINES[i % len(SAMPLE_LINES)]} [{i}]\n' for i in range(10000)).encode()
+    written = 0
+    with open(path, 'wb') as f:
+        while written < target:
+            f.write(block)
+            written += len(block)
+    return written
+
+def legacy_tail(path, lines):
+    """The original get_logs() read: whole file via readlines(), keep the end"""
+    with open(path, 'r') as f:
+        return f.readlines()[-lines:]
+
+def measure(func, iterations):
+    """Durations plus peak traced memory for repeated calls of `func`"""
+    durations = []
+    tracemalloc.start()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    summary = summarize(durations)
+    summary['peak_mem_kb'] = round(peak / 1024, 1)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=100)
+    parser.add_argument('--lines', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    web = load_web_module()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'openconnect-vpn.out.log')
+        size = write_synthetic_log(path, args.size_mb)
+
+        def cold():
+            tail = web.LogTail(path)
+            tail.lines(args.lines)
+            tail.close()
+
+        warm_tail = web.LogTail(path)
+        warm_tail.lines(args.lines)
+
+        incremental_tail = web.LogTail(path)
+        incremental_tail.lines(args.lines)
+
+        def incremental():
+            with open(path, 'a') as f:
+                f.write(''.join(f'{line}\n' for line in SAMPLE_LINES))
+            incremental_tail.lines(args.lines)
+
+        results = {
+            'file_bytes': size,
+            'lines': args.lines,
+            'iterations': args.iterations,
+            'cases': {
+                'readlines (legacy)': measure(lambda: legacy_tail(path, args.lines), args.iterations),
+                'LogTail cold': measure(cold, args.iterations),
+                'LogTail warm': measure(lambda: warm_tail.lines(args.lines), args.iterations),
+                'LogTail incremental': measure(incremental, args.iterations),
+            },
+        }
+        warm_tail.close()
+        incremental_tail.close()
+    emit(results, args.json)
+
+if __name__ == '__main__':
+    main()
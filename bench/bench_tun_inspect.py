@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: native tunnel inspection vs forking `ip`
+
+Compares the rtnetlink + sysfs inspector used by the status probes with the
+`ip -o addr show` fallback and with the original `ip addr show <iface>`
+fork-and-parse approach.
+
+Usage: python3 bench/bench_tun_inspect.py [--interface tun0] [--iterations 500] [--json]
+"""
+
+import argparse
+import os
+import subprocess
+
+from common import emit, load_web_module, summarize, time_calls
+
+def legacy_ip_addr_show(interface):
+    """The pre-inspector implementation: fork `ip addr show` and scan the text twice"""
+    result = subprocess.run(['ip', 'addr', 'show', interface], capture_output=True, text=True)
+    if result.returncode == 0 and 'inet' in result.stdout:
+        for line in result.stdout.split('\n'):
+            if 'inet ' in line and interface not in line:
+                return line.strip().split()[1].split('/')[0]
+        for line in result.stdout.split('\n'):
+            if 'inet6' in line and interface not in line:
+                return line.strip().split()[1].split('/')[0]
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    default_iface = 'tun0' if os.path.isdir('/sys/class/net/tun0') else 'lo'
+    parser.add_argument('--interface', default=default_iface)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    web = load_web_module()
+    iface = args.interface
+    cases = {
+        'netlink+sysfs': lambda: web.inspect_interface(iface),
+        'ip -o addr show (fallback)': lambda: web._ip_addresses([iface]),
+        'ip addr show (legacy)': lambda: legacy_ip_addr_show(iface),
+    }
+    results = {
+        'interface': iface,
+        'iterations': args.iterations,
+        'cases': {name: summarize(time_calls(func, args.iterations)) for name, func in cases.items()},
+    }
+    emit(results, args.json)
+
+if __name__ == '__main__':
+    main()
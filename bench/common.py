@@ -0,0 +1,64 @@
+"""
+Shared helpers for the openconnect-web benchmarks
+"""
+
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+
+WEB_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'openconnect-web.py')
+
+def load_web_module():
+    """Import openconnect-web.py (not importable by name because of the dash)"""
+    if 'openconnect_web' in sys.modules:
+        return sys.modules['openconnect_web']
+    spec = importlib.util.spec_from_file_location('openconnect_web', WEB_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['openconnect_web'] = module
+    spec.loader.exec_module(module)
+    return module
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def summarize(samples):
+    """Latency summary (milliseconds) of a list of durations in seconds"""
+    ms = [sample * 1000.0 for sample in samples]
+    return {
+        'count': len(ms),
+        'mean_ms': round(statistics.fmean(ms), 4) if ms else None,
+        'p50_ms': round(percentile(ms, 50), 4) if ms else None,
+        'p95_ms': round(percentile(ms, 95), 4) if ms else None,
+        'p99_ms': round(percentile(ms, 99), 4) if ms else None,
+        'max_ms': round(max(ms), 4) if ms else None,
+    }
+
+def time_calls(func, iterations, warmup=10):
+    """Call `func` repeatedly and return the per-call durations in seconds"""
+    for _ in range(warmup):
+        func()
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+def emit(results, as_json):
+    """Print benchmark results as JSON or a simple table"""
+    if as_json:
+        print(json.dumps(results, indent=2))
+        return
+    standard = ('count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+    for name, summary in results['cases'].items():
+        extra = ' '.join(f'{key}={value}' for key, value in summary.items() if key not in standard)
+        print(f"{name:<28} n={summary['count']:<6} mean={summary['mean_ms']:.4f}ms "
+              f"p50={summary['p50_ms']:.4f}ms p95={summary['p95_ms']:.4f}ms p99={summary['p99_ms']:.4f}ms {extra}".rstrip())
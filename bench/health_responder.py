@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Stand-in DNS responder for exercising the tunnel health watchdog
+
+Answers every UDP DNS query with an empty REFUSED reply after an optional
+delay, and drops a configurable share of queries. Point the watchdog at it
+without a real tunnel:
+
+    python3 bench/health_responder.py --port 5353 --delay-ms 20 --loss 0.3
+    VPN_INTERFACE=lo HEALTH_TARGETS=127.0.0.1:5353 python3 openconnect-web.py
+
+Send SIGUSR1 to toggle a total blackout (every query dropped), which should
+drive the watchdog to `dead` and a reconnect job.
+
+Usage: python3 bench/health_responder.py [--host 127.0.0.1] [--port 5353]
+       [--delay-ms 0] [--jitter-ms 0] [--loss 0.0]
+"""
+
+import argparse
+import random
+import signal
+import socket
+import struct
+import threading
+import time
+
+def reply_for(query):
+    """Echo the question back with QR set and RCODE=REFUSED"""
+    if len(query) < 12:
+        return None
+    txid, flags = struct.unpack('!HH', query[:4])
+    return struct.pack('!HHHHHH', txid, 0x8000 | (flags & 0x0100) | 5, 1, 0, 0, 0) + query[12:]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5353)
+    parser.add_argument('--delay-ms', type=float, default=0.0, help='added latency per reply')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='random extra latency (0..n)')
+    parser.add_argument('--loss', type=float, default=0.0, help='share of queries to drop (0..1)')
+    args = parser.parse_args()
+
+    blackout = threading.Event()
+
+    def toggle_blackout(signum, frame):
+        if blackout.is_set():
+            blackout.clear()
+        else:
+            blackout.set()
+        print('blackout on' if blackout.is_set() else 'blackout off', flush=True)
+
+    signal.signal(signal.SIGUSR1, toggle_blackout)
+
+    sock = socket.socket(socket.AF_INET6 if ':' in args.host else socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((args.host, args.port))
+    print(f'answering DNS on {args.host}:{args.port} (delay {args.delay_ms} ms, '
+          f'jitter {args.jitter_ms} ms, loss {args.loss:.0%})', flush=True)
+
+    def answer(reply, peer, delay):
+        time.sleep(delay)
+        sock.sendto(reply, peer)
+
+    while True:
+        try:
+            query, peer = sock.recvfrom(512)
+        except InterruptedError:
+            continue
+        reply = reply_for(query)
+        if reply is None or blackout.is_set() or random.random() < args.loss:
+            continue
+        delay = (args.delay_ms + random.uniform(0, args.jitter_ms)) / 1000.0
+        if delay > 0:
+            threading.Thread(target=answer, args=(reply, peer, delay), daemon=True).start()
+        else:
+            sock.sendto(reply, peer)
+
+if __name__ == '__main__':
+    main()
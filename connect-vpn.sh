@@ -6,6 +6,33 @@ set +H
 # Enable debugging for troubleshooting
 set -x
 
+# A named profile (VPN_PROFILE) takes its settings from VPN_PROFILES_FILE, the
+# same file the web UI reads, so both always agree on what this tunnel is.
+# Fields the profile leaves out keep the environment's values; the password
+# always comes from the environment.
+VPN_PROFILES_FILE="${VPN_PROFILES_FILE:-/etc/openconnect/profiles.json}"
+if [ -n "$VPN_PROFILE" ] && [ "$VPN_PROFILE" != "default" ]; then
+  if ! PROFILE_ENV=$(python3 - "$VPN_PROFILES_FILE" "$VPN_PROFILE" <<'PROFILE_EOF'
+import json, shlex, sys
+path, name = sys.argv[1:3]
+with open(path) as f:
+    profile = json.load(f).get(name)
+if not isinstance(profile, dict):
+    sys.exit(f'Error: profile {name!r} not found in {path}')
+if not profile.get('interface'):
+    sys.exit(f'Error: profile {name!r} needs its own interface')
+fields = {'server': 'VPN_SERVER', 'authgroup': 'VPN_AUTHGROUP', 'user': 'VPN_USER',
+          'duo_method': 'DUO_METHOD', 'dns_servers': 'DNS_SERVERS', 'interface': 'VPN_INTERFACE'}
+for key, var in fields.items():
+    if profile.get(key) is not None:
+        print(f'{var}={shlex.quote(str(profile[key]))}')
+PROFILE_EOF
+  ); then
+    exit 1
+  fi
+  eval "$PROFILE_ENV"
+fi
+
 # Ensure required environment variables are set
 if [ -z "$VPN_USER" ] || [ -z "$VPN_PASS" ]; then
   echo "Error: VPN_USER and VPN_PASS environment variables must be set."
@@ -16,6 +43,7 @@ fi
 VPN_SERVER="${VPN_SERVER:-vpn.illinois.edu}"
 VPN_AUTHGROUP="${VPN_AUTHGROUP:-OpenConnect1 (Split)}"
 DUO_METHOD="${DUO_METHOD:-push}"
+VPN_INTERFACE="${VPN_INTERFACE:-tun0}"
 DEBUG="${DEBUG:-false}"
 
 # Disable debug output if not needed (cleaner logs)
@@ -26,10 +54,12 @@ fi
 echo "=========================================="
 echo "OpenConnect VPN Client"
 echo "=========================================="
+echo "Profile: ${VPN_PROFILE:-default}"
 echo "Server: $VPN_SERVER"
 echo "Auth Group: $VPN_AUTHGROUP"
 echo "Duo Method: $DUO_METHOD"
 echo "User: $VPN_USER"
+echo "Interface: $VPN_INTERFACE"
 echo "=========================================="
 
 # Configure DNS servers if specified
@@ -39,13 +69,19 @@ if [ -n "$DNS_SERVERS" ]; then
   cp /etc/resolv.conf /etc/resolv.conf.bak
   # Clear and add new DNS servers
   > /etc/resolv.conf
+  # The web UI's caching forwarder goes first; the servers behind it stay
+  # listed so lookups still work if it is not running
+  if [ "$DNS_CACHE" = "true" ]; then
+    echo "nameserver 127.0.0.1" >> /etc/resolv.conf
+  fi
   for dns in $DNS_SERVERS; do
     echo "nameserver $dns" >> /etc/resolv.conf
   done
 fi
 
 # Create an expect script to handle interactive prompts
-EXPECT_SCRIPT="/tmp/vpn_expect_script.exp"
+# One script per interface so several profiles can connect side by side
+EXPECT_SCRIPT="/tmp/vpn_expect_script_${VPN_INTERFACE}.exp"
 cat > "$EXPECT_SCRIPT" <<EXPECT_EOF
 #!/usr/bin/expect -f
 
@@ -55,8 +91,9 @@ set user "$VPN_USER"
 set server "$VPN_SERVER"
 set authgroup "$VPN_AUTHGROUP"
 set duo_method "$DUO_METHOD"
+set interface "$VPN_INTERFACE"
 
-spawn openconnect --user \$user --authgroup \$authgroup \$server
+spawn openconnect --interface \$interface --user \$user --authgroup \$authgroup \$server
 
 # Counter to track which password prompt we're on
 set prompt_count 0
@@ -3,134 +3,3105 @@
 OpenConnect Web UI - Simple web interface to control VPN connection
 """
 
-from flask import Flask, render_template, jsonify, request, redirect
+import time
+
+# Cold start timing, reported by /api/ready and at startup
+STARTUP_TIMING = {'started': time.time()}
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, g, jsonify, request, redirect
 import subprocess
+import http.client
+import queue
+import xmlrpc.client
 import os
 import json
+import hashlib
+import mmap
+import re
+import uuid
 import signal
-import time
+import sys
+import atexit
+import socket
+import struct
+import threading
+from collections import OrderedDict, deque, namedtuple
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 from threading import Thread
+from types import MappingProxyType
+
+# The WSGI servers and the asset compressors are only needed by one code path
+# each and are imported there
+STARTUP_TIMING['imports_ms'] = round((time.perf_counter() - _import_started) * 1000, 1)
+
+app = Flask(__name__)
+
+# Configuration
+CONFIG_FILE = '/tmp/openconnect_config.json'
+VPN_PID_FILE = '/tmp/openconnect.pid'
+LOG_DIR = os.environ.get('LOG_DIR', '/var/log/supervisor')
+RESOLV_CONF = os.environ.get('RESOLV_CONF', '/etc/resolv.conf')
+
+# Serving: embedded production server (gunicorn gthread or waitress); `dev`
+# runs the Flask development server
+WEB_SERVER = os.environ.get('WEB_SERVER', 'gunicorn')
+WEB_HOST = os.environ.get('WEB_HOST', '0.0.0.0')
+WEB_THREADS = int(os.environ.get('WEB_THREADS', '16'))
+# Streams and readiness waits each hold a request thread for as long as they
+# run, so both are capped to leave threads for ordinary requests
+SSE_MAX_CLIENTS = int(os.environ.get('SSE_MAX_CLIENTS', str(max(1, WEB_THREADS // 2))))
+READY_MAX_WAITERS = int(os.environ.get('READY_MAX_WAITERS', str(max(1, WEB_THREADS // 8))))
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '10'))
+
+# Dashboard assets are hashed and precompressed at startup; API JSON carries
+# ETags so unchanged polls get an empty 304
+ASSET_MAX_AGE = 31536000
+SETTINGS_MAX_AGE = int(os.environ.get('SETTINGS_MAX_AGE', '300'))
+# Keys left out of the ETag: ages and probe/round timestamps move on every pass
+API_VOLATILE_KEYS = frozenset({'age', 'ages', 'timestamp', 'uptime', 'last_round', 'last_reconnect'})
+# Probe measurements drift on every round, so the ETag only sees which bucket
+# they fall in; exact values still reach the dashboard over /api/events
+API_ETAG_BUCKETS = {'rtt_ms': 25, 'avg_rtt_ms': 25, 'max_rtt_ms': 25, 'jitter_ms': 25, 'loss': 0.05}
+
+# Status sampling: one background thread refreshes every probe and publishes
+# an immutable snapshot; endpoints only ever read the latest snapshot.
+STATUS_INTERVAL = float(os.environ.get('STATUS_INTERVAL', '1.0'))
+STATUS_TTL_VPN = float(os.environ.get('STATUS_TTL_VPN', '2'))
+STATUS_TTL_DNS = float(os.environ.get('STATUS_TTL_DNS', '10'))
+STATUS_TTL_GUACAMOLE = float(os.environ.get('STATUS_TTL_GUACAMOLE', '10'))
+STATUS_FAST_INTERVAL = float(os.environ.get('STATUS_FAST_INTERVAL', '0.5'))
+STATUS_FAST_DURATION = float(os.environ.get('STATUS_FAST_DURATION', '60'))
+
+# Tunnel interface inspection (rtnetlink + sysfs, `ip` only as a fallback)
+VPN_INTERFACE = os.environ.get('VPN_INTERFACE', 'tun0')
+SYS_CLASS_NET = '/sys/class/net'
+INTERFACE_STATS = ('rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets',
+                   'rx_errors', 'tx_errors', 'rx_dropped', 'tx_dropped')
+IFF_UP = 0x1
+NETLINK_ROUTE = 0
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+RT_SCOPE_NAMES = {0: 'global', 253: 'link', 254: 'host'}
+
+# Guacamole probing: candidate ports are probed concurrently over keep-alive
+# connections under one deadline, with backoff while Guacamole is down
+GUACAMOLE_HOST = os.environ.get('GUACAMOLE_HOST', 'localhost')
+GUACAMOLE_PORT = int(os.environ.get('GUACAMOLE_PORT', '8080'))
+WEB_PORT = int(os.environ.get('WEB_PORT', '9000'))
+GUAC_PROBE_DEADLINE = float(os.environ.get('GUAC_PROBE_DEADLINE', '2'))
+GUAC_BACKOFF_MAX = float(os.environ.get('GUAC_BACKOFF_MAX', '30'))
+
+# Readiness (/api/ready): MariaDB counts as up once it sends its handshake;
+# the unix socket is preferred so probes never touch the TCP host cache
+MARIADB_SOCKET = os.environ.get('MARIADB_SOCKET', '/var/run/mysqld/mysqld.sock')
+MARIADB_HOST = os.environ.get('MARIADB_HOST', '127.0.0.1')
+MARIADB_PORT = int(os.environ.get('MARIADB_PORT', '3306'))
+STATUS_TTL_MARIADB = float(os.environ.get('STATUS_TTL_MARIADB', '10'))
+READY_COMPONENTS = ('web', 'mariadb', 'guacamole', 'vpn')
+READY_REQUIRE = os.environ.get('READY_REQUIRE', 'web,mariadb,guacamole')
+READY_WAIT_MAX = float(os.environ.get('READY_WAIT_MAX', '300'))
+
+# Log tailing: keep the last LOG_TAIL_LINES lines of each log in memory and
+# only read bytes appended since the previous call
+LOG_TAIL_LINES = int(os.environ.get('LOG_TAIL_LINES', '2000'))
+LOG_TAIL_BLOCK = 64 * 1024
+
+# Server-Sent Events: one follower thread tails the logs and fans new lines
+# out to every connected client
+LOG_STREAM_POLL = float(os.environ.get('LOG_STREAM_POLL', '0.5'))
+LOG_STREAM_BACKLOG = int(os.environ.get('LOG_STREAM_BACKLOG', '1000'))
+LOG_STREAM_DEDUP_WINDOW = 256
+LOG_INDEX_SIZE = int(os.environ.get('LOG_INDEX_SIZE', '5000'))
+# /api/logs?grep= is a plain substring unless regex=1; a regex can backtrack
+# without bound, so it is kept short and only sees the start of each line
+LOG_GREP_MAX_LENGTH = 100
+LOG_GREP_REGEX_SPAN = 512
+# Connect timeline: finished attempts kept, and how long one may stay open
+TIMELINE_HISTORY = int(os.environ.get('TIMELINE_HISTORY', '50'))
+TIMELINE_ATTEMPT_TIMEOUT = float(os.environ.get('TIMELINE_ATTEMPT_TIMEOUT', '600'))
+TIMELINE_DTLS_GRACE = float(os.environ.get('TIMELINE_DTLS_GRACE', '10'))
+SSE_CLIENT_BUFFER = int(os.environ.get('SSE_CLIENT_BUFFER', '500'))
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', '15'))
+SSE_BUSY_RETRY = 30
+
+# Control jobs: connect/disconnect/reconnect run off the request thread
+VPN_PROGRAM = 'openconnect-vpn'
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_HISTORY = int(os.environ.get('JOB_HISTORY', '100'))
+JOB_WAIT_TIMEOUT = float(os.environ.get('JOB_WAIT_TIMEOUT', '60'))
+
+# supervisord XML-RPC (inet_http_server or unix:// socket); supervisorctl is
+# only forked when the RPC endpoint refuses connections. Stopping waits for
+# the program to exit, so it gets a timeout above supervisord's stopwaitsecs
+SUPERVISOR_URL = os.environ.get('SUPERVISOR_URL', 'http://127.0.0.1:9001/RPC2')
+SUPERVISOR_TIMEOUT = float(os.environ.get('SUPERVISOR_TIMEOUT', '5'))
+SUPERVISOR_STOP_TIMEOUT = float(os.environ.get('SUPERVISOR_STOP_TIMEOUT', '15'))
+SUPERVISOR_POOL_SIZE = int(os.environ.get('SUPERVISOR_POOL_SIZE', '2'))
+STATUS_TTL_SUPERVISOR = float(os.environ.get('STATUS_TTL_SUPERVISOR', '2'))
+VPN_PROFILES_FILE = os.environ.get('VPN_PROFILES_FILE', '/etc/openconnect/profiles.json')
+DEFAULT_PROFILE = 'default'
+SUPERVISOR_FAULT_ALREADY_STARTED = 60
+SUPERVISOR_FAULT_NOT_RUNNING = 70
+SUPERVISOR_FAILED_STATES = ('FATAL', 'EXITED')
+
+# Tunnel health watchdog: RTT probes through the tunnel to the DNS servers
+# (tiny UDP DNS queries or TCP connects); a tunnel that stops answering for
+# HEALTH_DEAD_ROUNDS probes in a row is reconnected
+HEALTH_TARGETS = os.environ.get('HEALTH_TARGETS', os.environ.get('DNS_SERVERS', '')).split()
+HEALTH_MODE = os.environ.get('HEALTH_MODE', 'udp')
+HEALTH_PORT = int(os.environ.get('HEALTH_PORT', '53'))
+HEALTH_INTERVAL = float(os.environ.get('HEALTH_INTERVAL', '5'))
+HEALTH_TIMEOUT = float(os.environ.get('HEALTH_TIMEOUT', '2'))
+HEALTH_WINDOW = int(os.environ.get('HEALTH_WINDOW', '20'))
+HEALTH_RTT_DEGRADED_MS = float(os.environ.get('HEALTH_RTT_DEGRADED_MS', '500'))
+HEALTH_LOSS_DEGRADED = float(os.environ.get('HEALTH_LOSS_DEGRADED', '0.2'))
+HEALTH_DEAD_ROUNDS = int(os.environ.get('HEALTH_DEAD_ROUNDS', '3'))
+HEALTH_RECONNECT = os.environ.get('HEALTH_RECONNECT', 'true').lower() == 'true'
+HEALTH_RECONNECT_COOLDOWN = float(os.environ.get('HEALTH_RECONNECT_COOLDOWN', '120'))
+HEALTH_MIN_SAMPLES = 3
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25)
+
+# Status history: fixed-size ring of binary records in a memory-mapped file
+# (7 days at one record per 10 s is ~2.4 MB); queries are downsampled
+HISTORY_FILE = os.environ.get('HISTORY_FILE', '/var/lib/openconnect-web/history.bin')
+HISTORY_INTERVAL = float(os.environ.get('HISTORY_INTERVAL', '10'))
+HISTORY_CAPACITY = int(os.environ.get('HISTORY_CAPACITY', '60480'))
+HISTORY_MAX_POINTS = int(os.environ.get('HISTORY_MAX_POINTS', '1000'))
+HISTORY_MAGIC = b'OCWHIST1'
+# time, connected, state, guacamole, pad, ipv4, rx_bytes, tx_bytes, rtt_ms, loss
+HISTORY_RECORD = struct.Struct('<dBBBxIQQff')
+
+# DNS: resolv.conf is re-parsed only when it changes, every upstream
+# nameserver's query latency is measured in the background, and an optional
+# caching forwarder answers repeated lookups from memory
+DNS_SERVERS = os.environ.get('DNS_SERVERS', '').split()
+DNS_PROBE_NAME = os.environ.get('DNS_PROBE_NAME', '.')
+DNS_PROBE_INTERVAL = float(os.environ.get('DNS_PROBE_INTERVAL', '30'))
+DNS_PROBE_TIMEOUT = float(os.environ.get('DNS_PROBE_TIMEOUT', '2'))
+DNS_PROBE_WINDOW = int(os.environ.get('DNS_PROBE_WINDOW', '10'))
+DNS_CACHE = os.environ.get('DNS_CACHE', 'false').lower() == 'true'
+DNS_CACHE_LISTEN = os.environ.get('DNS_CACHE_LISTEN', '127.0.0.1:53')
+DNS_CACHE_SIZE = int(os.environ.get('DNS_CACHE_SIZE', '2048'))
+DNS_CACHE_MIN_TTL = int(os.environ.get('DNS_CACHE_MIN_TTL', '0'))
+DNS_CACHE_MAX_TTL = int(os.environ.get('DNS_CACHE_MAX_TTL', '3600'))
+DNS_CACHE_NEGATIVE_TTL = int(os.environ.get('DNS_CACHE_NEGATIVE_TTL', '30'))
+DNS_CACHE_WORKERS = int(os.environ.get('DNS_CACHE_WORKERS', '4'))
+DNS_MAX_UDP = 4096
+DNS_MIN_UDP = 512
+DNS_TCP_IDLE = 10
+DNS_FLAG_TC = 0x0200
+DNS_TYPE_A = 1
+DNS_TYPE_NS = 2
+DNS_TYPE_SOA = 6
+DNS_TYPE_OPT = 41
+DNS_RCODES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP', 5: 'REFUSED'}
+
+def _read_sysfs(name, attr):
+    """Read one /sys/class/net attribute, None if unavailable"""
+    try:
+        with open(f'{SYS_CLASS_NET}/{name}/{attr}', 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _interface_index(name):
+    """Kernel ifindex of an interface, None if it does not exist"""
+    value = _read_sysfs(name, 'ifindex')
+    return int(value) if value else None
+
+def _parse_rtattrs(data, offset, end):
+    """Parse a run of netlink route attributes into {type: payload}"""
+    attrs = {}
+    end = min(end, len(data))
+    while offset + 4 <= end:
+        length, kind = struct.unpack_from('=HH', data, offset)
+        if length < 4 or offset + length > end:
+            break
+        attrs[kind] = data[offset + 4:offset + length]
+        offset += (length + 3) & ~3
+    return attrs
+
+def parse_netlink_addresses(data, seq, indexes, addresses):
+    """Add the RTM_NEWADDR entries of one netlink recv() buffer to `addresses`
+
+    Only replies to request `seq` for interfaces in `indexes` (ifindex ->
+    name) are used. Returns True once the dump is complete. Raises OSError
+    for a netlink error reply and ValueError for a truncated message.
+    """
+    offset = 0
+    while offset + 16 <= len(data):
+        msg_len, msg_type, _flags, msg_seq, _pid = struct.unpack_from('=IHHII', data, offset)
+        if msg_len < 16 or msg_type == NLMSG_DONE:
+            return True
+        if offset + msg_len > len(data):
+            raise ValueError('truncated netlink message')
+        if msg_type == NLMSG_ERROR:
+            if msg_len < 20:
+                raise ValueError('truncated netlink error')
+            error = struct.unpack_from('=i', data, offset + 16)[0]
+            if error:
+                raise OSError(-error, os.strerror(-error))
+            return True
+        if msg_type == RTM_NEWADDR and msg_seq == seq and msg_len >= 24:
+            family, prefixlen, _ifa_flags, scope, index = struct.unpack_from('=BBBBI', data, offset + 16)
+            name = indexes.get(index)
+            if name is not None:
+                attrs = _parse_rtattrs(data, offset + 24, offset + msg_len)
+                raw = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+                size = {socket.AF_INET: 4, socket.AF_INET6: 16}.get(family)
+                if raw and len(raw) == size:
+                    key = 'inet' if family == socket.AF_INET else 'inet6'
+                    addresses[name][key].append({
+                        'address': socket.inet_ntop(family, raw),
+                        'prefixlen': prefixlen,
+                        'scope': RT_SCOPE_NAMES.get(scope, str(scope))
+                    })
+        offset += (msg_len + 3) & ~3
+    return False
+
+def _netlink_addresses(indexes):
+    """Dump interface addresses with a single RTM_GETADDR request
+
+    `indexes` maps ifindex to interface name; addresses of other interfaces
+    are skipped. Returns {name: {'inet': [...], 'inet6': [...]}}.
+    """
+    addresses = {name: {'inet': [], 'inet6': []} for name in indexes.values()}
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    try:
+        sock.bind((0, 0))
+        seq = int(time.time() * 1000) & 0xffffffff
+        header = struct.pack('=IHHII', 24, RTM_GETADDR, NLM_F_REQUEST | NLM_F_DUMP, seq, 0)
+        sock.send(header + struct.pack('=BBBBI', socket.AF_UNSPEC, 0, 0, 0, 0))
+        while not parse_netlink_addresses(sock.recv(65536), seq, indexes, addresses):
+            pass
+    finally:
+        sock.close()
+    return addresses
+
+def parse_ip_addr_output(text, names):
+    """Addresses of `names` from `ip -o addr show` output; unparseable lines are skipped"""
+    addresses = {name: {'inet': [], 'inet6': []} for name in names}
+    for line in text.splitlines():
+        # "5: tun0    inet 10.1.2.3/32 scope global tun0\ ..." or "... inet 10.1.2.3 peer 10.1.2.4/32 ..."
+        fields = line.split()
+        if len(fields) < 4 or fields[2] not in ('inet', 'inet6'):
+            continue
+        name = fields[1].split('@')[0]
+        if name not in addresses:
+            continue
+        address, _, prefix = fields[3].partition('/')
+        if prefix and not prefix.isdigit():
+            continue
+        scope_at = fields.index('scope') + 1 if 'scope' in fields else None
+        addresses[name][fields[2]].append({
+            'address': address,
+            'prefixlen': int(prefix) if prefix else (32 if fields[2] == 'inet' else 128),
+            'scope': fields[scope_at] if scope_at is not None and scope_at < len(fields) else 'global'
+        })
+    return addresses
+
+def _ip_addresses(names):
+    """Fallback address lookup: one `ip -o addr show` fork for all interfaces"""
+    result = subprocess.run(['ip', '-o', 'addr', 'show'], capture_output=True, text=True)
+    return parse_ip_addr_output(result.stdout, names)
+
+def read_interface_stats(name):
+    """Read link flags and traffic counters for an interface straight from sysfs"""
+    stats = {}
+    for counter in INTERFACE_STATS:
+        value = _read_sysfs(name, f'statistics/{counter}')
+        stats[counter] = int(value) if value else 0
+    flags = int(_read_sysfs(name, 'flags') or '0', 16)
+    return {
+        'operstate': _read_sysfs(name, 'operstate') or 'unknown',
+        'up': bool(flags & IFF_UP),
+        'carrier': _read_sysfs(name, 'carrier') == '1',
+        'mtu': int(_read_sysfs(name, 'mtu') or 0),
+        'stats': stats
+    }
+
+def inspect_interfaces(names):
+    """Inspect several interfaces with one kernel address query
+
+    Returns {name: info} where info has 'exists', link state, 'stats' and the
+    'inet'/'inet6' address lists. Uses rtnetlink when available and falls
+    back to a single `ip` fork otherwise.
+    """
+    indexes = {}
+    for name in names:
+        index = _interface_index(name)
+        if index is not None:
+            indexes[index] = name
+    present = list(indexes.values())
+    if present:
+        try:
+            addresses, source = _netlink_addresses(indexes), 'netlink'
+        except (OSError, ValueError, AttributeError):
+            addresses, source = _ip_addresses(present), 'ip'
+    else:
+        addresses, source = {}, 'sysfs'
+
+    result = {}
+    for name in names:
+        if name not in addresses:
+            result[name] = {'exists': False, 'inet': [], 'inet6': [], 'source': source}
+            continue
+        info = read_interface_stats(name)
+        info.update(addresses[name])
+        info['exists'] = True
+        info['source'] = source
+        result[name] = info
+    return result
+
+def inspect_interface(name):
+    """Inspect a single interface (see inspect_interfaces)"""
+    return inspect_interfaces([name])[name]
+
+def primary_address(info):
+    """Preferred address of an inspected interface: IPv4, then global IPv6, then any IPv6"""
+    if info['inet']:
+        return info['inet'][0]['address']
+    for entry in info['inet6']:
+        if entry['scope'] != 'link':
+            return entry['address']
+    if info['inet6']:
+        return info['inet6'][0]['address']
+    return None
+
+def vpn_status_from_interface(interface, info):
+    """VPN status of one tunnel (the `vpn` sample) from an inspected interface"""
+    ip = primary_address(info) if info['exists'] else None
+    if not ip:
+        return {'status': 'disconnected', 'interface': interface}
+    return {
+        'status': 'connected',
+        'ip': ip,
+        'interface': interface,
+        'link': info['operstate'],
+        'stats': info['stats'],
+        'timestamp': time.time()
+    }
+
+class ResolvConf:
+    """resolv.conf, parsed again only when its mtime, size or inode changes"""
+
+    def __init__(self, path=RESOLV_CONF):
+        self.path = path
+        self._key = None
+        self._parsed = {'nameservers': [], 'search': [], 'options': []}
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def read(self):
+        try:
+            st = os.stat(self.path)
+            key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            key = None
+        with self._lock:
+            if key == self._key:
+                return self._parsed
+            parsed = {'nameservers': [], 'search': [], 'options': []}
+            try:
+                with open(self.path, 'r') as f:
+                    for line in f:
+                        fields = line.split()
+                        if len(fields) < 2 or fields[0].startswith(('#', ';')):
+                            continue
+                        if fields[0] == 'nameserver':
+                            parsed['nameservers'].append(fields[1])
+                        elif fields[0] in ('search', 'domain'):
+                            parsed['search'] = fields[1:]
+                        elif fields[0] == 'options':
+                            parsed['options'].extend(fields[1:])
+            except OSError:
+                pass
+            self._key, self._parsed = key, parsed
+            self.reloads += 1
+            return parsed
+
+resolv_conf = ResolvConf()
+
+def get_dns_status():
+    """Get current DNS configuration"""
+    return list(resolv_conf.read()['nameservers'])
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                     for k, v in labels)
+    return '{' + pairs + '}'
+
+class Counter:
+    """Prometheus counter with optional labels"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f'{self.name}{_format_labels(key)} {value}')
+        return lines
+
+class Histogram:
+    """Prometheus histogram with fixed buckets and optional labels"""
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{_format_labels(key + (("le", repr(float(bound))),))} {bucket_count}')
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", "+Inf"),))} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+def render_gauge(name, help_text, samples, kind='gauge'):
+    """Render gauge lines from [(labels, value)] computed at scrape time"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(tuple(labels.items()))} {value}')
+    return lines
+
+HTTP_REQUEST_DURATION = Histogram(
+    'openconnect_web_request_duration_seconds', 'Flask request latency by endpoint',
+    (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), ('endpoint', 'method'))
+HTTP_REQUESTS = Counter(
+    'openconnect_web_requests_total', 'Flask requests by endpoint and status', ('endpoint', 'method', 'status'))
+GUAC_PROBE_LATENCY = Histogram(
+    'guacamole_probe_latency_seconds', 'Latency of successful Guacamole HTTP probes',
+    (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2))
+VPN_TIME_TO_CONNECT = Histogram(
+    'openconnect_time_to_connect_seconds', 'Time from a connect/reconnect request to the tunnel coming up',
+    (1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120))
+VPN_SESSION_DURATION = Histogram(
+    'openconnect_session_duration_seconds', 'Length of completed VPN sessions',
+    (60, 300, 900, 1800, 3600, 7200, 14400, 28800, 86400, 259200))
+VPN_RECONNECTS = Counter(
+    'openconnect_reconnects_total', 'VPN reconnects by trigger', ('trigger',))
+VPN_TRANSITIONS = Counter(
+    'openconnect_tunnel_transitions_total', 'Tunnel up/down transitions seen by the status sampler', ('to',))
+
+class GuacamoleProber:
+    """Find a responding Guacamole port without serial timeouts
+
+    The last good port is tried first; otherwise all candidates are probed in
+    parallel and the first success wins, all within one overall deadline.
+    Each port keeps its HTTP connection open between probes. While nothing
+    answers, probes are skipped with exponential backoff and the last result
+    is returned.
+    """
+
+    def __init__(self, ports, host=GUACAMOLE_HOST, deadline=GUAC_PROBE_DEADLINE, backoff_max=GUAC_BACKOFF_MAX):
+        self.host = host
+        self.ports = list(ports)
+        self.deadline = deadline
+        self.backoff_max = backoff_max
+        self.last_good = None
+        self._connections = {}
+        self._port_locks = {port: threading.Lock() for port in self.ports}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.ports)), thread_name_prefix='guac-probe')
+        self._failures = 0
+        self._retry_at = 0
+        self._last_result = None
+
+    def _probe_port(self, port, timeout):
+        """Return the request latency in seconds if the port answers, else None"""
+        lock = self._port_locks[port]
+        if not lock.acquire(blocking=False):
+            return None  # a previous probe of this port is still in flight
+        try:
+            conn = self._connections.get(port)
+            if conn is None:
+                conn = http.client.HTTPConnection(self.host, port, timeout=timeout)
+                self._connections[port] = conn
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            start = time.monotonic()
+            try:
+                conn.request('GET', '/guacamole/')
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                self._connections.pop(port, None)
+                return None
+            if response.will_close:
+                conn.close()
+            return time.monotonic() - start if response.status < 400 else None
+        finally:
+            lock.release()
+
+    def probe(self, force=False):
+        """Probe Guacamole; returns the check_guacamole_status() dict
+
+        `force` ignores the backoff, for callers waiting on Guacamole to come up.
+        """
+        now = time.monotonic()
+        if not force and self._last_result is not None and now < self._retry_at:
+            return dict(self._last_result, retry_in=round(self._retry_at - now, 1))
+        deadline = now + self.deadline
+
+        found = None
+        if self.last_good is not None:
+            latency = self._probe_port(self.last_good, self.deadline)
+            if latency is not None:
+                found = (self.last_good, latency)
+        if found is None:
+            others = [port for port in self.ports if port != self.last_good]
+            remaining = deadline - time.monotonic()
+            if others and remaining > 0:
+                futures = {self._executor.submit(self._probe_port, port, remaining): port for port in others}
+                try:
+                    for future in as_completed(futures, timeout=remaining):
+                        if future.result() is not None:
+                            found = (futures[future], future.result())
+                            break
+                except FutureTimeoutError:
+                    pass
+
+        if found is not None:
+            port, latency = found
+            GUAC_PROBE_LATENCY.observe(latency)
+            self.last_good = port
+            self._failures = 0
+            self._retry_at = 0
+            result = {'status': 'running', 'available': True, 'port': port,
+                      'latency_ms': round(latency * 1000, 2)}
+        else:
+            self.last_good = None
+            self._failures += 1
+            backoff = min(self.backoff_max, 2 ** (self._failures - 1))
+            self._retry_at = time.monotonic() + backoff
+            result = {'status': 'not responding', 'available': False, 'port': GUACAMOLE_PORT}
+        self._last_result = result
+        return result
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for conn in list(self._connections.values()):
+            conn.close()
+
+def guacamole_candidate_ports():
+    """Configured port then the default, deduplicated, never our own port"""
+    ports = []
+    for port in (GUACAMOLE_PORT, 8080):
+        if port not in ports and port != WEB_PORT:
+            ports.append(port)
+    return ports
+
+guacamole_prober = GuacamoleProber(guacamole_candidate_ports())
+
+def check_guacamole_status(force=False):
+    """Check if Guacamole is actually responding and on which port"""
+    return guacamole_prober.probe(force)
+
+def check_mariadb_status(timeout=1.0):
+    """Whether MariaDB accepts connections: it greets with a protocol-10 handshake packet"""
+    use_socket = bool(MARIADB_SOCKET) and os.path.exists(MARIADB_SOCKET)
+    address = MARIADB_SOCKET if use_socket else f'{MARIADB_HOST}:{MARIADB_PORT}'
+    start = time.monotonic()
+    try:
+        if use_socket:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            sock.connect(MARIADB_SOCKET)
+        else:
+            sock = socket.create_connection((MARIADB_HOST, MARIADB_PORT), timeout)
+        with sock:
+            # 3-byte payload length, sequence id, then the protocol version
+            header = sock.recv(5)
+    except OSError as e:
+        return {'up': False, 'address': address, 'error': str(e)}
+    if len(header) == 5 and header[4] == 10:
+        return {'up': True, 'address': address, 'latency_ms': round((time.monotonic() - start) * 1000, 2)}
+    error = 'refused the connection' if len(header) == 5 and header[4] == 0xFF else 'unexpected greeting'
+    return {'up': False, 'address': address, 'error': error}
+
+def get_vpn_settings():
+    """Get VPN configuration from environment"""
+    return {
+        'user': os.environ.get('VPN_USER', 'N/A'),
+        'server': os.environ.get('VPN_SERVER', 'vpn.illinois.edu'),
+        'authgroup': os.environ.get('VPN_AUTHGROUP', 'OpenConnect1 (Split)'),
+        'duo_method': os.environ.get('DUO_METHOD', 'push'),
+        'dns_servers': os.environ.get('DNS_SERVERS', '130.126.2.131'),
+    }
+
+class Subscription:
+    """One client's view of an EventBroker: a bounded queue of pending events"""
+
+    def __init__(self, broker, buffer_size):
+        self.broker = broker
+        self.queue = deque(maxlen=buffer_size)
+        self.dropped = 0
+
+    def push(self, item):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(item)
+
+    def get(self, timeout):
+        """Wait up to `timeout` seconds and return every pending (id, event, data) item"""
+        with self.broker.condition:
+            if not self.queue:
+                self.broker.condition.wait(timeout)
+            items = list(self.queue)
+            self.queue.clear()
+            return items
+
+class EventBroker:
+    """Fan events out to any number of subscribers
+
+    Keeps a bounded backlog so clients can resume from `Last-Event-ID`. Each
+    subscriber has its own bounded buffer; a slow client drops its oldest
+    pending events instead of holding up the publisher or other clients.
+    Event ids are `<boot>-<seq>` so ids from a previous process are
+    recognised as stale.
+    """
+
+    def __init__(self, backlog=LOG_STREAM_BACKLOG, client_buffer=SSE_CLIENT_BUFFER):
+        self.condition = threading.Condition()
+        self.client_buffer = client_buffer
+        self._backlog = deque(maxlen=backlog)
+        self._boot = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._subscribers = set()
+
+    def publish(self, event, data):
+        with self.condition:
+            self._seq += 1
+            item = (f'{self._boot}-{self._seq}', event, data)
+            self._backlog.append(item)
+            for subscriber in self._subscribers:
+                subscriber.push(item)
+            self.condition.notify_all()
+
+    def subscribe(self, last_event_id=None, replay=0):
+        """Register a subscriber, pre-filled with events after `last_event_id`
+
+        Without a usable `last_event_id` the last `replay` events are queued.
+        """
+        subscriber = Subscription(self, self.client_buffer)
+        with self.condition:
+            backlog = list(self._backlog)
+            boot, _, seq = (last_event_id or '').partition('-')
+            if boot == self._boot and seq.isdigit() and backlog:
+                first_seq = self._seq - len(backlog) + 1
+                pending = backlog[max(0, int(seq) + 1 - first_seq):]
+            else:
+                pending = backlog[-replay:] if replay else []
+            for item in pending:
+                subscriber.push(item)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.condition:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def backlog_size(self):
+        return self._backlog.maxlen
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+def sse_stream(subscriber, heartbeat=SSE_HEARTBEAT):
+    """Generate Server-Sent Events for a subscriber until the client goes away"""
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            items = subscriber.get(heartbeat)
+            if not items:
+                yield ': keepalive\n\n'
+                continue
+            chunks = []
+            if subscriber.dropped:
+                chunks.append(f'event: dropped\ndata: {json.dumps({"count": subscriber.dropped})}\n\n')
+                subscriber.dropped = 0
+            for event_id, event, data in items:
+                if event_id is not None:
+                    chunks.append(f'id: {event_id}\n')
+                chunks.append(f'event: {event}\ndata: {json.dumps(data)}\n\n')
+            yield ''.join(chunks)
+    finally:
+        subscriber.broker.unsubscribe(subscriber)
+
+# One slot per open stream across /api/events and /api/logs/stream
+sse_slots = threading.BoundedSemaphore(SSE_MAX_CLIENTS)
+
+def sse_busy():
+    """Refuse a stream over SSE_MAX_CLIENTS; the dashboard polls until a retry gets a slot"""
+    return Response(f'retry: {SSE_BUSY_RETRY * 1000}\n\n', status=503, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'Retry-After': str(SSE_BUSY_RETRY)
+    })
+
+def sse_response(generator, subscriber):
+    """Wrap an SSE generator in a non-buffered streaming response holding one of sse_slots
+
+    The slot and subscription are released when the server closes the
+    response, even if the generator never started.
+    """
+    response = Response(generator, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(lambda: subscriber.broker.unsubscribe(subscriber))
+    response.call_on_close(sse_slots.release)
+    return response
+
+ProbeSample = namedtuple('ProbeSample', ['value', 'sampled_at'])
+
+class StatusSampler:
+    """Background sampler that refreshes status probes and publishes immutable snapshots
+
+    Each probe has its own TTL and is only re-run once its last sample is
+    older than that. Readers get a read-only mapping of probe name to
+    ProbeSample that is swapped atomically, so reading it never blocks on a
+    probe and never sees a half-updated state.
+    """
+
+    def __init__(self, interval=STATUS_INTERVAL):
+        self.interval = interval
+        self._probes = {}
+        self._derived = {}
+        self._snapshot = MappingProxyType({})
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._forced = set()
+        self._boosted = {}
+        self._listeners = []
+        self._changed = threading.Condition()
+        self._thread = None
+
+    def add_probe(self, name, func, ttl):
+        """Register a probe function re-run at most every `ttl` seconds"""
+        self._probes[name] = (func, ttl)
+
+    def add_derived(self, name, source, func):
+        """Publish `func(source value)` as `name` whenever probe `source` is re-sampled
+
+        Boosting or refreshing `name` acts on `source`, so a derived entry
+        never costs a probe of its own.
+        """
+        self._derived[name] = (source, func)
+
+    def _source(self, name):
+        return self._derived[name][0] if name in self._derived else name
+
+    def add_listener(self, func):
+        """Call `func(previous, current)` from the sampler thread after every pass"""
+        self._listeners.append(func)
+
+    def start(self):
+        """Start the sampler thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name='status-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the sampler thread and wait for it to exit"""
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def refresh(self, *names):
+        """Ask for the given probes (or all of them) to be re-run right away"""
+        with self._lock:
+            self._forced.update(self._source(name) for name in names or self._probes)
+        self._wake.set()
+
+    def boost(self, name, duration=STATUS_FAST_DURATION):
+        """Sample one probe every STATUS_FAST_INTERVAL for a while (e.g. during a connect)"""
+        name = self._source(name)
+        with self._lock:
+            self._boosted[name] = time.time() + duration
+            self._forced.add(name)
+        self.start()
+        self._wake.set()
+
+    def end_boost(self, name):
+        with self._lock:
+            self._boosted.pop(self._source(name), None)
+
+    def is_boosted(self, name):
+        with self._lock:
+            return self._boosted.get(self._source(name), 0) >= time.time()
+
+    def snapshot(self, timeout=10):
+        """Return the latest snapshot, waiting for the first one if needed"""
+        self.start()
+        self._ready.wait(timeout)
+        return self._snapshot
+
+    def wait_for(self, predicate, timeout):
+        """Block until `predicate(snapshot)` is true or `timeout` expires; returns the outcome"""
+        self.start()
+        deadline = time.time() + timeout
+        with self._changed:
+            while not predicate(self._snapshot):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+        return True
+
+    def wake_waiters(self):
+        """Make wait_for() re-check its predicate, for conditions outside the snapshot"""
+        with self._changed:
+            self._changed.notify_all()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._ready.set()
+            self._wake.wait(STATUS_FAST_INTERVAL if self._boosted else self.interval)
+            self._wake.clear()
+
+    def _sample(self):
+        now = time.time()
+        with self._lock:
+            forced, self._forced = self._forced, set()
+            for name, until in list(self._boosted.items()):
+                if until < now:
+                    del self._boosted[name]
+                else:
+                    forced.add(name)
+        current = self._snapshot
+        updated = dict(current)
+        for name, (func, ttl) in self._probes.items():
+            previous = current.get(name)
+            if name not in forced and previous is not None and now - previous.sampled_at < ttl:
+                continue
+            try:
+                value = func()
+            except Exception as e:
+                value = {'status': 'error', 'error': str(e)}
+            updated[name] = ProbeSample(value, time.time())
+        for name, (source, func) in self._derived.items():
+            sample = updated.get(source)
+            if sample is not None and (name not in updated or sample is not current.get(source)):
+                try:
+                    value = func(sample.value)
+                except Exception as e:
+                    value = {'status': 'error', 'error': str(e)}
+                updated[name] = ProbeSample(value, sample.sampled_at)
+        with self._changed:
+            self._snapshot = MappingProxyType(updated)
+            self._changed.notify_all()
+        for listener in self._listeners:
+            try:
+                listener(current, self._snapshot)
+            except Exception as e:
+                print(f'status listener failed: {e}', flush=True)
+
+status_sampler = StatusSampler()
+status_sampler.add_probe('dns', lambda: get_dns_status(), STATUS_TTL_DNS)
+# While boosted (a readiness wait) every fast sample really probes, skipping the backoff
+status_sampler.add_probe('guacamole', lambda: check_guacamole_status(status_sampler.is_boosted('guacamole')),
+                         STATUS_TTL_GUACAMOLE)
+status_sampler.add_probe('mariadb', lambda: check_mariadb_status(), STATUS_TTL_MARIADB)
+
+def _record_first_snapshot(previous, current):
+    if not previous:
+        STARTUP_TIMING['first_snapshot_ms'] = round((time.perf_counter() - _import_started) * 1000, 1)
+
+status_sampler.add_listener(_record_first_snapshot)
+
+def sample_age(sample, now=None):
+    """Seconds since a probe sample was taken (None if never sampled)"""
+    if sample is None:
+        return None
+    return round((now or time.time()) - sample.sampled_at, 3)
+
+def vpn_connected(snapshot):
+    sample = snapshot.get('vpn')
+    return sample is not None and sample.value.get('status') == 'connected'
+
+def build_status(snapshot):
+    """Build the /api/status payload from a sampler snapshot"""
+    vpn = snapshot.get('vpn')
+    dns = snapshot.get('dns')
+    guac = snapshot.get('guacamole')
+    process = snapshot.get('supervisor')
+    health = snapshot.get('health')
+    resolver = snapshot.get('resolver')
+    vpn_status = vpn.value if vpn else {'status': 'unknown'}
+    guac_status = guac.value if guac else {'status': 'unknown', 'available': False}
+    health_status = health.value if health else {}
+    connected = vpn_status['status'] == 'connected'
+    now = time.time()
+    
+    return {
+        'vpn': {
+            'connected': connected,
+            'state': tunnel_state(connected, health_status),
+            'ip': vpn_status.get('ip', 'N/A'),
+            'rtt_ms': health_status.get('rtt_ms') if connected else None,
+            'health': health_status,
+            'dns': dns.value if dns else [],
+            'timestamp': vpn_status.get('timestamp', 0),
+            'age': sample_age(vpn, now),
+            'process': process_summary(process, now)
+        },
+        'guacamole': {
+            'status': guac_status['status'],
+            'available': guac_status['available'],
+            'port': guac_status.get('port', 8080),
+            'age': sample_age(guac, now)
+        },
+        'resolver': dict(resolver.value, age=sample_age(resolver, now)) if resolver else None,
+        'snapshot': {
+            'ages': {name: sample_age(sample, now) for name, sample in snapshot.items()},
+            'interval': status_sampler.interval
+        }
+    }
+
+def tunnel_state(connected, health):
+    """connected, degraded (up but failing health probes) or disconnected"""
+    if not connected:
+        return 'disconnected'
+    if health.get('state') in ('degraded', 'dead'):
+        return 'degraded'
+    return 'connected'
+
+def process_summary(sample, now):
+    """Supervisor process state for /api/status, with uptime computed at read time"""
+    if sample is None:
+        return None
+    info = dict(sample.value)
+    if info.get('state') == 'RUNNING' and info.get('start'):
+        info['uptime'] = round(now - info['start'], 1)
+    info['age'] = sample_age(sample, now)
+    return info
+
+def status_fields(snapshot):
+    """The parts of a snapshot that status events report changes of"""
+    status = build_status(snapshot)
+    return {
+        'vpn': status['vpn']['connected'],
+        'state': status['vpn']['state'],
+        'ip': status['vpn']['ip'],
+        'dns': status['vpn']['dns'],
+        'guacamole': (status['guacamole']['available'], status['guacamole']['port'])
+    }
+
+status_broker = EventBroker(backlog=100)
+
+def publish_status_changes(previous, current):
+    """Sampler listener: publish an event for every status transition"""
+    if not current:
+        return
+    new = status_fields(current)
+    old = status_fields(previous) if previous else None
+    health = current.get('health')
+    if previous and health is not None and previous.get('health', health).value != health.value:
+        status_broker.publish('health', health.value)
+    if old == new:
+        return
+    status = build_status(current)
+    if old is not None:
+        if old['vpn'] != new['vpn']:
+            status_sampler.end_boost('vpn')
+            status_broker.publish('vpn', {'connected': new['vpn'], 'ip': new['ip']})
+        elif old['ip'] != new['ip']:
+            status_broker.publish('ip', {'ip': new['ip'], 'previous': old['ip']})
+        if old['state'] != new['state']:
+            status_broker.publish('state', {'state': new['state'], 'previous': old['state']})
+        if old['dns'] != new['dns']:
+            status_broker.publish('dns', {'dns': new['dns'], 'previous': old['dns']})
+        if old['guacamole'] != new['guacamole']:
+            status_broker.publish('guacamole', status['guacamole'])
+    status_broker.publish('status', status)
+
+status_sampler.add_listener(publish_status_changes)
+
+vpn_session = {'connected_since': None}
+
+def track_vpn_session(previous, current):
+    """Sampler listener: count tunnel transitions and record session lengths"""
+    was_up = vpn_connected(previous) if previous else None
+    is_up = vpn_connected(current)
+    if was_up == is_up:
+        return
+    now = time.time()
+    if is_up:
+        vpn_session['connected_since'] = now
+        if was_up is not None:
+            VPN_TRANSITIONS.inc(to='up')
+    else:
+        if vpn_session['connected_since'] is not None:
+            VPN_SESSION_DURATION.observe(now - vpn_session['connected_since'])
+        vpn_session['connected_since'] = None
+        if was_up is not None:
+            VPN_TRANSITIONS.inc(to='down')
+
+status_sampler.add_listener(track_vpn_session)
+
+HistoryRecord = namedtuple('HistoryRecord', ['time', 'connected', 'state', 'guacamole', 'ipv4',
+                                             'rx_bytes', 'tx_bytes', 'rtt_ms', 'loss'])
+TUNNEL_STATE_CODES = {'disconnected': 0, 'connected': 1, 'degraded': 2}
+
+class HistoryRing:
+    """Fixed-size ring of binary status records in a memory-mapped file
+
+    The file is a 64-byte header (magic, record size, capacity, next slot,
+    count) followed by `capacity` records of HISTORY_RECORD, so disk and
+    memory use are fixed no matter how long the container runs. A file
+    whose header or size does not match is started over. Appends
+    write one record and then bump the header; records are in time order,
+    so range queries binary-search the ring.
+    """
+
+    HEADER = struct.Struct('<8sIIQQ')
+    HEADER_SIZE = 64
+
+    def __init__(self, path, capacity=HISTORY_CAPACITY, record=HISTORY_RECORD):
+        self.path = path
+        self.capacity = capacity
+        self.record = record
+        self._lock = threading.Lock()
+        self._map = None
+        self._file = None
+        self.error = None
+
+    def open(self):
+        """Map the file, creating (or replacing an incompatible) one; idempotent"""
+        with self._lock:
+            if self._map is not None or self.error:
+                return self._map is not None
+            size = self.HEADER_SIZE + self.capacity * self.record.size
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                f = open(self.path, 'a+b')
+                f.seek(0)
+                header = f.read(self.HEADER.size)
+                fresh = len(header) < self.HEADER.size or os.fstat(f.fileno()).st_size != size
+                if not fresh:
+                    magic, record_size, capacity, head, count = self.HEADER.unpack(header)
+                    fresh = ((magic, record_size, capacity) != (HISTORY_MAGIC, self.record.size, self.capacity)
+                             or not self._valid_position(head, count))
+                if fresh:
+                    f.truncate(0)
+                f.truncate(size)
+                self._map = mmap.mmap(f.fileno(), size)
+                self._file = f
+                if fresh:
+                    self._write_header(0, 0)
+            except OSError as e:
+                self.error = f'{self.path}: {e}'
+                print(f'Status history disabled: {self.error}', flush=True)
+                return False
+            return True
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+                self._map.close()
+                self._file.close()
+                self._map = self._file = None
+
+    def _valid_position(self, head, count):
+        """Until the ring first wraps the next slot is the record count"""
+        return head < self.capacity and (count == self.capacity or head == count)
+
+    def _write_header(self, head, count):
+        self.HEADER.pack_into(self._map, 0, HISTORY_MAGIC, self.record.size, self.capacity, head, count)
+
+    def _header(self):
+        _, _, _, head, count = self.HEADER.unpack_from(self._map, 0)
+        return head, count
+
+    def _slot(self, head, count, index):
+        """Byte offset of the `index`-th oldest record"""
+        return self.HEADER_SIZE + ((head - count + index) % self.capacity) * self.record.size
+
+    def append(self, values):
+        if not self.open():
+            return
+        with self._lock:
+            head, count = self._header()
+            self.record.pack_into(self._map, self.HEADER_SIZE + head * self.record.size, *values)
+            self._write_header((head + 1) % self.capacity, min(count + 1, self.capacity))
+
+    def __len__(self):
+        if not self.open():
+            return 0
+        with self._lock:
+            return self._header()[1]
+
+    def range(self, start, end):
+        """HistoryRecords with start <= time < end, oldest first"""
+        if not self.open():
+            return []
+        with self._lock:
+            head, count = self._header()
+
+            def time_at(index):
+                return struct.unpack_from('<d', self._map, self._slot(head, count, index))[0]
+
+            low, high = 0, count
+            while low < high:
+                middle = (low + high) // 2
+                if time_at(middle) < start:
+                    low = middle + 1
+                else:
+                    high = middle
+            first, high = low, count
+            while low < high:
+                middle = (low + high) // 2
+                if time_at(middle) < end:
+                    low = middle + 1
+                else:
+                    high = middle
+            last = low
+            # At most two contiguous slices (before and after the wrap)
+            chunks = []
+            index = first
+            while index < last:
+                offset = self._slot(head, count, index)
+                run = min(last - index, (self.HEADER_SIZE + self.capacity * self.record.size - offset) // self.record.size)
+                chunks.append(self._map[offset:offset + run * self.record.size])
+                index += run
+        return [HistoryRecord(*values) for chunk in chunks for values in self.record.iter_unpack(chunk)]
+
+def _ipv4_to_int(ip):
+    try:
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+    except (OSError, TypeError):
+        return 0
+
+def _int_to_ipv4(value):
+    return socket.inet_ntoa(struct.pack('!I', value)) if value else None
+
+def history_values(snapshot, now):
+    """One HISTORY_RECORD tuple from a sampler snapshot"""
+    status = build_status(snapshot)
+    vpn = snapshot.get('vpn')
+    stats = (vpn.value.get('stats') or {}) if vpn else {}
+    health = status['vpn']['health']
+    rtt, loss = health.get('rtt_ms'), health.get('loss')
+    return (now, int(status['vpn']['connected']), TUNNEL_STATE_CODES.get(status['vpn']['state'], 0),
+            int(bool(status['guacamole']['available'])), _ipv4_to_int(status['vpn']['ip']),
+            stats.get('rx_bytes', 0), stats.get('tx_bytes', 0),
+            float('nan') if rtt is None else rtt, float('nan') if loss is None else loss)
+
+def _aggregate(values):
+    values = [value for value in values if value == value]  # drop NaN
+    if not values:
+        return None
+    return {'min': round(min(values), 3), 'max': round(max(values), 3), 'avg': round(sum(values) / len(values), 3)}
+
+def downsample(records, start, step):
+    """min/max/avg per `step`-second bucket; empty buckets are left out
+
+    Throughput comes from counter deltas between consecutive records, and a
+    reconnect is an up transition inside the bucket.
+    """
+    buckets = OrderedDict()
+    previous = None
+    for record in records:
+        bucket = buckets.setdefault(int((record.time - start) // step), {
+            'connected': [], 'degraded': [], 'guacamole': [], 'rtt_ms': [], 'loss': [],
+            'rx_bps': [], 'tx_bps': [], 'reconnects': 0, 'ips': []})
+        bucket['connected'].append(record.connected)
+        bucket['degraded'].append(int(record.state == TUNNEL_STATE_CODES['degraded']))
+        bucket['guacamole'].append(record.guacamole)
+        bucket['rtt_ms'].append(record.rtt_ms)
+        bucket['loss'].append(record.loss)
+        if record.ipv4 and (not bucket['ips'] or bucket['ips'][-1] != record.ipv4):
+            bucket['ips'].append(record.ipv4)
+        if previous is not None:
+            elapsed = record.time - previous.time
+            if record.connected and not previous.connected:
+                bucket['reconnects'] += 1
+            # Counters restart with the interface; skip the interval that spans it
+            if 0 < elapsed <= HISTORY_INTERVAL * 3 and record.rx_bytes >= previous.rx_bytes \
+                    and record.tx_bytes >= previous.tx_bytes and record.connected and previous.connected:
+                bucket['rx_bps'].append((record.rx_bytes - previous.rx_bytes) / elapsed)
+                bucket['tx_bps'].append((record.tx_bytes - previous.tx_bytes) / elapsed)
+        previous = record
+    points = []
+    for index, bucket in buckets.items():
+        points.append({
+            't': round(start + index * step, 3),
+            'samples': len(bucket['connected']),
+            'uptime': round(sum(bucket['connected']) / len(bucket['connected']), 3),
+            'degraded': round(sum(bucket['degraded']) / len(bucket['degraded']), 3),
+            'guacamole': round(sum(bucket['guacamole']) / len(bucket['guacamole']), 3),
+            'rtt_ms': _aggregate(bucket['rtt_ms']),
+            'loss': _aggregate(bucket['loss']),
+            'rx_bps': _aggregate(bucket['rx_bps']),
+            'tx_bps': _aggregate(bucket['tx_bps']),
+            'reconnects': bucket['reconnects'],
+            'ips': [_int_to_ipv4(ip) for ip in bucket['ips']]
+        })
+    return points
+
+history = HistoryRing(HISTORY_FILE)
+_history_state = {'last': 0}
+
+def record_history(previous, current):
+    """Sampler listener: append one record every HISTORY_INTERVAL seconds"""
+    now = time.time()
+    if not current or now - _history_state['last'] < HISTORY_INTERVAL:
+        return
+    _history_state['last'] = now
+    history.append(history_values(current, now))
+
+status_sampler.add_listener(record_history)
+
+def read_last_lines(f, size, count, block_size=LOG_TAIL_BLOCK):
+    """Read the last `count` complete lines of an open binary file by seeking back from `size`
+
+    Returns (lines, partial) where `partial` is any unterminated text after
+    the last newline.
+    """
+    pos = size
+    chunks = []
+    newlines = 0
+    while pos > 0 and newlines <= count:
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        chunk = f.read(step)
+        chunks.append(chunk)
+        newlines += chunk.count(b'\n')
+    data = b''.join(reversed(chunks))
+    if pos > 0:
+        # The first line may have started before the oldest block we read
+        data = data[data.find(b'\n') + 1:]
+    parts = data.split(b'\n')
+    partial = parts.pop()
+    return parts[-count:] if count else [], partial
+
+class LogTail:
+    """Incremental tail of one log file
+
+    The first read seeks backwards from EOF; later reads only parse bytes
+    appended since the previous one. The file is kept open so rotation
+    (new inode at the same path) drains the old file before switching, and
+    truncation restarts from the tail of the new contents.
+    """
+
+    def __init__(self, path, capacity=LOG_TAIL_LINES):
+        self.path = path
+        self.capacity = capacity
+        self._lines = deque(maxlen=capacity)
+        self.total = 0
+        self._file = None
+        self._inode = None
+        self._offset = 0
+        self._partial = b''
+        self._lock = threading.Lock()
+
+    def poll(self):
+        """Read anything appended since the last poll; returns the new complete lines"""
+        with self._lock:
+            return self._poll()
+
+    def lines(self, count):
+        """Return up to the last `count` lines of the file"""
+        with self._lock:
+            self._poll()
+            if count <= self.capacity or self._file is None:
+                return list(self._lines)[-count:] if count else []
+            lines, _ = read_last_lines(self._file, self._offset, count)
+        return [line.decode('utf-8', 'replace') for line in lines]
+
+    def since(self, cursor):
+        """Return (lines, cursor) for lines ingested after `cursor`
+
+        Lets several readers consume the same tail independently; `cursor`
+        is the `total` value returned by the previous call.
+        """
+        with self._lock:
+            self._poll()
+            first = self.total - len(self._lines)
+            start = max(cursor, first)
+            return list(self._lines)[start - first:], self.total
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._inode = None
+        self._offset = 0
+        self._partial = b''
+
+    def _poll(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._close()
+            self._lines.clear()
+            return []
+        inode = (st.st_dev, st.st_ino)
+        new = []
+        if self._file is not None and inode != self._inode:
+            # Rotated: drain whatever was appended to the old file first
+            new.extend(self._read_appended(os.fstat(self._file.fileno()).st_size))
+            self._close()
+        if self._file is None:
+            try:
+                self._file = open(self.path, 'rb')
+            except OSError:
+                return new
+            self._inode = inode
+            return new + self._reset(st.st_size)
+        if st.st_size < self._offset:
+            # Truncated in place (copytruncate or `> file`)
+            self._lines.clear()
+            return new + self._reset(st.st_size)
+        return new + self._read_appended(st.st_size)
+
+    def _reset(self, size):
+        lines, self._partial = read_last_lines(self._file, size, self.capacity)
+        self._offset = size
+        lines = [line.decode('utf-8', 'replace') for line in lines]
+        self._lines.extend(lines)
+        self.total += len(lines)
+        return lines
+
+    def _read_appended(self, size):
+        if size <= self._offset:
+            return []
+        self._file.seek(self._offset)
+        data = self._file.read(size - self._offset)
+        self._offset += len(data)
+        parts = (self._partial + data).split(b'\n')
+        self._partial = parts.pop()
+        lines = [line.decode('utf-8', 'replace') for line in parts]
+        self._lines.extend(lines)
+        self.total += len(lines)
+        return lines
+
+log_tails = {
+    'stdout': LogTail(f'{LOG_DIR}/openconnect-vpn.out.log'),
+    'stderr': LogTail(f'{LOG_DIR}/openconnect-vpn.err.log'),
+}
+
+def _compile_log_filters():
+    """Build the redaction/filter regexes once; the environment does not change at runtime"""
+    secrets = [os.environ.get('VPN_PASS') or 'REDACTED']
+    return (
+        re.compile(r'^={18}|Configuring DNS'),
+        re.compile(r'password', re.IGNORECASE),
+        re.compile('|'.join(re.escape(secret) for secret in sorted(secrets, key=len, reverse=True)))
+    )
+
+LOG_SKIP_RE, LOG_REDACT_LINE_RE, LOG_SECRET_RE = _compile_log_filters()
+LOG_LEVEL_RE = re.compile(
+    r'(?P<error>\b(?:error|errors|fail(?:ed|ure)?|fatal|denied|refused|unauthorized)\b)'
+    r'|(?P<warning>\b(?:warn(?:ing)?|dead peer|timeout|timed out|retry(?:ing)?|reconnect(?:ing)?)\b)',
+    re.IGNORECASE)
+LOG_TIMESTAMP_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})')
+LOG_LEVELS = {'info': 0, 'warning': 1, 'error': 2}
+
+LogRecord = namedtuple('LogRecord', ['seq', 'time', 'stream', 'level', 'text'])
+
+def clean_log_line(line):
+    """Filter and redact one raw log line; returns None for lines to skip"""
+    line = line.rstrip()
+    
+    # Skip unimportant lines
+    if not line or LOG_SKIP_RE.search(line):
+        return None
+    
+    # Redact passwords and sensitive info
+    if LOG_REDACT_LINE_RE.search(line):
+        return '[REDACTED - password/auth info]'
+    return LOG_SECRET_RE.sub('***REDACTED***', line)
+
+def classify_log_line(line):
+    """Severity of a cleaned log line: 'error', 'warning' or 'info'"""
+    match = LOG_LEVEL_RE.search(line)
+    if match is None:
+        return 'info'
+    return 'error' if match.group('error') else 'warning'
+
+def log_line_time(line, default):
+    """Timestamp embedded at the start of a line, else `default` (ingest time)"""
+    match = LOG_TIMESTAMP_RE.match(line)
+    if match is None:
+        return default
+    try:
+        return time.mktime(time.strptime(f'{match.group(1)} {match.group(2)}', '%Y-%m-%d %H:%M:%S'))
+    except ValueError:
+        return default
+
+@lru_cache(maxsize=64)
+def _compile_grep(pattern, regex=False):
+    if len(pattern) > LOG_GREP_MAX_LENGTH:
+        raise re.error(f'longer than {LOG_GREP_MAX_LENGTH} characters')
+    return re.compile(pattern if regex else re.escape(pattern), re.IGNORECASE)
+
+class LogIndex:
+    """Bounded in-memory index of structured log records
+
+    Records arrive already filtered and redacted, so queries never touch the
+    log files.
+    """
+
+    def __init__(self, size=LOG_INDEX_SIZE):
+        self._records = deque(maxlen=size)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def add(self, stream, text, timestamp):
+        with self._lock:
+            self._seq += 1
+            record = LogRecord(self._seq, timestamp, stream, classify_log_line(text), text)
+            self._records.append(record)
+            return record
+
+    def query(self, since=None, level=None, grep=None, limit=50, regex=False):
+        """Newest `limit` records matching every given filter, oldest first
+
+        `since` is a unix timestamp, `level` a minimum severity and `grep` a
+        case-insensitive substring, or with `regex` a regex matched against
+        the first LOG_GREP_REGEX_SPAN characters of each line; raises
+        re.error for an invalid or overlong pattern.
+        """
+        min_level = LOG_LEVELS.get(level, 0) if level else 0
+        pattern = _compile_grep(grep, regex) if grep else None
+        span = LOG_GREP_REGEX_SPAN if regex else None
+        with self._lock:
+            records = list(self._records)
+        matched = []
+        for record in reversed(records):
+            if since is not None and record.time <= since:
+                continue
+            if LOG_LEVELS[record.level] < min_level:
+                continue
+            if pattern is not None and not pattern.search(record.text[:span]):
+                continue
+            matched.append(record)
+            if len(matched) >= limit:
+                break
+        matched.reverse()
+        return matched
+
+    def __len__(self):
+        return len(self._records)
+
+log_index = LogIndex()
+
+def get_logs(lines=50):
+    """Get recent logs from supervisor output and error logs, formatted and filtered"""
+    try:
+        log_follower.start()
+        records = log_index.query(limit=lines)
+        
+        # Return formatted logs (last N unique lines)
+        if records:
+            return '\n'.join(record.text for record in records)
+        else:
+            return "No logs available yet. Start VPN connection to generate logs."
+    except Exception as e:
+        return f"Error reading logs: {str(e)}"
+
+# Phase markers in openconnect/connect-vpn.sh output, in the order they normally appear
+TIMELINE_MARKERS = (
+    ('start', re.compile(r'OpenConnect VPN Client')),
+    ('request', re.compile(r'^POST https?://')),
+    ('tcp', re.compile(r'^Connected to \[?[0-9A-Fa-f.:]+\]?:\d+')),
+    ('tls', re.compile(r'^Connected to HTTPS on ')),
+    ('prompt', re.compile(r'Password:')),
+    ('connect_response', re.compile(r'^Got CONNECT response: HTTP/\S+ 200')),
+    ('cstp', re.compile(r'^CSTP connected')),
+    ('dtls', re.compile(r'^Established DTLS connection')),
+    ('dtls_failed', re.compile(r'DTLS handshake (?:failed|timed out)|Failed to (?:set up|connect) DTLS', re.IGNORECASE)),
+    ('tunnel', re.compile(r'^(?:Connected as|Configured as) ')),
+)
+TIMELINE_FAILURE_RE = re.compile(
+    r'Login failed|Failed to (?:obtain WebVPN cookie|connect to host|open HTTPS connection|complete authentication)'
+    r'|authentication failed|Creating SSL connection failed|getaddrinfo failed|Unknown host', re.IGNORECASE)
+# (phase, start marks, end marks): the first mark present on each side is used
+TIMELINE_PHASES = (
+    ('dns_tcp', ('start', 'request'), ('tcp',)),
+    ('tls', ('tcp',), ('tls',)),
+    ('credentials', ('tls',), ('duo_prompt', 'connect_response')),
+    ('duo', ('duo_prompt',), ('connect_response',)),
+    ('cstp', ('connect_response',), ('cstp',)),
+    ('dtls', ('cstp',), ('dtls',)),
+    ('tunnel_setup', ('cstp',), ('tunnel', 'interface_up')),
+    ('total', ('start', 'request'), ('tunnel', 'interface_up')),
+)
+VPN_CONNECT_PHASE = Histogram(
+    'openconnect_connect_phase_seconds', 'Duration of each phase of successful connect attempts',
+    (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120), labelnames=('phase',))
+
+def nearest_rank(values, pct):
+    """Nearest-rank percentile of an already sorted, non-empty list"""
+    return values[max(0, -(-len(values) * pct // 100) - 1)]
+
+class ConnectAttempt:
+    """Timestamps of the phase markers seen during one connect attempt"""
+
+    def __init__(self, attempt_id, started):
+        self.id = attempt_id
+        self.started = started
+        self.marks = {}
+        self.prompts = 0
+        self.outcome = 'in_progress'
+        self.error = None
+        self.finished = None
+
+    def mark(self, name, when):
+        """Record a marker once; later repeats keep the first time"""
+        self.marks.setdefault(name, when)
+
+    @property
+    def tunnel_at(self):
+        """When the tunnel came up ('Connected as', or the interface after CSTP), else None"""
+        if 'tunnel' in self.marks:
+            return self.marks['tunnel']
+        if 'cstp' in self.marks:
+            return self.marks.get('interface_up')
+        return None
+
+    def phases(self):
+        """Seconds spent in each phase whose start and end marks were both seen"""
+        result = {}
+        for phase, starts, ends in TIMELINE_PHASES:
+            start = next((self.marks[mark] for mark in starts if mark in self.marks), None)
+            end = next((self.marks[mark] for mark in ends if mark in self.marks), None)
+            if start is not None and end is not None and end >= start:
+                result[phase] = round(end - start, 3)
+        return result
+
+    def to_dict(self, now=None):
+        return {
+            'id': self.id,
+            'started': self.started,
+            'finished': self.finished,
+            'outcome': self.outcome,
+            'error': self.error,
+            'elapsed': round((self.finished or now or time.time()) - self.started, 3),
+            'marks': {name: round(when - self.started, 3) for name, when in
+                      sorted(self.marks.items(), key=lambda item: item[1])},
+            'phases': self.phases()
+        }
+
+class ConnectTimeline:
+    """Incremental parser turning VPN log lines into per-attempt phase timelines
+
+    Fed by the LogFollower with only the lines appended since its last poll
+    (LogTail offsets, never a reread), so timestamps are the line's own when
+    it has one and otherwise its ingest time, accurate to LOG_STREAM_POLL.
+    Each attempt moves through the TIMELINE_MARKERS; the second password
+    prompt is the Duo prompt. openconnect reports the tunnel up before DTLS
+    is established, so a connected attempt stays open until DTLS is up or
+    has failed, another line reports a failure, or TIMELINE_DTLS_GRACE
+    passes. Otherwise an attempt ends on a failure line, when a new attempt
+    starts, or after TIMELINE_ATTEMPT_TIMEOUT.
+    """
+
+    def __init__(self, history=TIMELINE_HISTORY, attempt_timeout=TIMELINE_ATTEMPT_TIMEOUT,
+                 dtls_grace=TIMELINE_DTLS_GRACE):
+        self.attempt_timeout = attempt_timeout
+        self.dtls_grace = dtls_grace
+        self._attempts = deque(maxlen=history)
+        self._current = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def feed(self, lines, now):
+        """Consume newly appended raw log lines (possibly none, to close attempts that ran out of time)"""
+        with self._lock:
+            for line in lines:
+                self._consume(LOG_TIMESTAMP_RE.sub('', line).lstrip(' ]:').strip(), log_line_time(line, now))
+            self._expire(now)
+
+    def _consume(self, line, when):
+        if not line:
+            return
+        for name, pattern in TIMELINE_MARKERS:
+            if pattern.search(line):
+                break
+        else:
+            name = None
+        attempt = self._current
+        if name == 'start' or (attempt is None and name == 'request'):
+            if attempt is not None and attempt.tunnel_at is not None:
+                self._finish('connected', when)
+            elif attempt is not None:
+                self._finish('abandoned', when, 'superseded by a new attempt')
+            self._seq += 1
+            attempt = self._current = ConnectAttempt(self._seq, when)
+        if attempt is None:
+            return
+        if name == 'prompt':
+            attempt.prompts += 1
+            attempt.mark('password_prompt' if attempt.prompts == 1 else 'duo_prompt', when)
+        elif name is not None:
+            attempt.mark(name, when)
+        if name is None and TIMELINE_FAILURE_RE.search(line):
+            if attempt.tunnel_at is not None:
+                self._finish('connected', when)
+            else:
+                self._finish('failed', when, clean_log_line(line))
+        else:
+            self._settle(when)
+
+    def _settle(self, when):
+        """Close the current attempt once the tunnel is up and DTLS has settled either way"""
+        attempt = self._current
+        if attempt.tunnel_at is not None and ('dtls' in attempt.marks or 'dtls_failed' in attempt.marks):
+            self._finish('connected', when)
+
+    def _finish(self, outcome, when, error=None):
+        attempt, self._current = self._current, None
+        attempt.outcome = outcome
+        attempt.error = error
+        attempt.finished = when
+        self._attempts.append(attempt)
+        if outcome == 'connected':
+            for phase, seconds in attempt.phases().items():
+                VPN_CONNECT_PHASE.observe(seconds, phase=phase)
+
+    def _expire(self, now):
+        attempt = self._current
+        if attempt is None:
+            return
+        if attempt.tunnel_at is not None:
+            # Connected but DTLS never reported back: CSTP only
+            if now - attempt.tunnel_at > self.dtls_grace:
+                self._finish('connected', attempt.tunnel_at)
+        elif now - attempt.started > self.attempt_timeout:
+            self._finish('timeout', now, f'no tunnel after {self.attempt_timeout:.0f}s')
+
+    def interface_up(self, when):
+        """The sampler saw the tunnel interface come up: counts as connected after CSTP with no 'Connected as' line"""
+        with self._lock:
+            if self._current is not None:
+                self._current.mark('interface_up', when)
+                self._settle(when)
+
+    def current(self, now=None):
+        with self._lock:
+            if self._current is not None:
+                self._expire(now or time.time())
+            return self._current.to_dict(now) if self._current is not None else None
+
+    def recent(self, limit=10):
+        """Finished attempts, newest first"""
+        with self._lock:
+            attempts = list(self._attempts)[-limit:] if limit > 0 else []
+        return [attempt.to_dict() for attempt in reversed(attempts)]
+
+    def percentiles(self):
+        """p50/p90/p95/max of each phase across successful attempts"""
+        with self._lock:
+            samples = {}
+            for attempt in self._attempts:
+                if attempt.outcome == 'connected':
+                    for phase, seconds in attempt.phases().items():
+                        samples.setdefault(phase, []).append(seconds)
+        result = {}
+        for phase, _, _ in TIMELINE_PHASES:
+            values = sorted(samples.get(phase, []))
+            if values:
+                result[phase] = {'count': len(values), 'p50': nearest_rank(values, 50),
+                                 'p90': nearest_rank(values, 90), 'p95': nearest_rank(values, 95),
+                                 'max': values[-1]}
+        return result
+
+class LogFollower:
+    """Single thread that ingests the VPN logs as they are appended
+
+    Work scales with newly appended bytes: each poll only reads what the
+    LogTails have not seen yet, and every line is filtered, redacted and
+    deduplicated once, stored in the LogIndex and fanned out by the broker.
+    """
+
+    def __init__(self, tails, index, broker, timeline=None, interval=LOG_STREAM_POLL):
+        self.tails = tails
+        self.index = index
+        self.broker = broker
+        self.timeline = timeline
+        self.interval = interval
+        self._cursors = {}
+        self._recent = deque(maxlen=LOG_STREAM_DEDUP_WINDOW)
+        self._recent_set = set()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start following (idempotent); seeds the backlog from the current tails"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            for stream, tail in self.tails.items():
+                lines, self._cursors[stream] = tail.since(0)
+                self._publish(stream, lines)
+            self._thread = Thread(target=self._run, name='log-follower', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for stream, tail in self.tails.items():
+                try:
+                    lines, self._cursors[stream] = tail.since(self._cursors.get(stream, 0))
+                except Exception:
+                    continue
+                if self.timeline is not None:
+                    # Raw lines: filtering and dedup would drop the repeated password prompt
+                    self.timeline.feed(lines, time.time())
+                self._publish(stream, lines)
+
+    def _publish(self, stream, lines):
+        now = time.time()
+        for line in lines:
+            line = clean_log_line(line)
+            if line is None or line in self._recent_set:
+                continue
+            if len(self._recent) == self._recent.maxlen:
+                self._recent_set.discard(self._recent[0])
+            self._recent.append(line)
+            self._recent_set.add(line)
+            record = self.index.add(stream, line, log_line_time(line, now))
+            self.broker.publish('log', log_record_dict(record))
+
+def log_record_dict(record):
+    return {'seq': record.seq, 'time': record.time, 'stream': record.stream,
+            'level': record.level, 'line': record.text}
+
+log_broker = EventBroker()
+connect_timeline = ConnectTimeline()
+log_follower = LogFollower(log_tails, log_index, log_broker, connect_timeline)
+
+def mark_interface_up(previous, current):
+    """Sampler listener: the tunnel interface coming up ends a connect attempt's timeline"""
+    if previous and current and vpn_connected(current) and not vpn_connected(previous):
+        connect_timeline.interface_up(current['vpn'].sampled_at)
+
+status_sampler.add_listener(mark_interface_up)
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a unix socket (supervisord's unix_http_server)"""
+
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+class _SupervisorTransport(xmlrpc.client.Transport):
+    """Keep-alive XML-RPC transport with a timeout and optional unix socket"""
+
+    def __init__(self, timeout, socket_path=None):
+        super().__init__()
+        self.timeout = timeout
+        self.socket_path = socket_path
+
+    def make_connection(self, host):
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+        if self.socket_path:
+            conn = _UnixHTTPConnection(self.socket_path, self.timeout)
+        else:
+            conn = http.client.HTTPConnection(host, timeout=self.timeout)
+        self._connection = host, conn
+        return conn
+
+    def request(self, host, handler, request_body, verbose=False):
+        # Only a pooled connection the server closed while idle is retried.
+        # Anything else, notably a timeout after the request went out, is
+        # raised: the call may already be running on the server
+        reused = self._connection[1] is not None
+        try:
+            return self.single_request(host, handler, request_body, verbose)
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            if not reused:
+                raise
+        return self.single_request(host, handler, request_body, verbose)
+
+class SupervisorClient:
+    """supervisord XML-RPC client with a small pool of persistent connections
+
+    Each pooled ServerProxy keeps its HTTP connection open between calls, so
+    a control action or status probe costs one request instead of a
+    supervisorctl interpreter start-up.
+    """
+
+    def __init__(self, url=SUPERVISOR_URL, pool_size=SUPERVISOR_POOL_SIZE, timeout=SUPERVISOR_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _new_proxy(self, timeout):
+        if self.url.startswith('unix://'):
+            transport = _SupervisorTransport(timeout, self.url[len('unix://'):])
+            return xmlrpc.client.ServerProxy('http://localhost/RPC2', transport=transport, allow_none=True)
+        return xmlrpc.client.ServerProxy(self.url, transport=_SupervisorTransport(timeout), allow_none=True)
+
+    def call(self, method, *args, timeout=None):
+        """Call `supervisor.<method>`
+
+        The transport retries a stale pooled connection once; other failures
+        are raised without a second call. A call with its own `timeout` uses
+        a one-off connection so the pooled sockets keep the short one.
+        """
+        if timeout is not None:
+            proxy = self._new_proxy(timeout)
+            try:
+                return getattr(proxy.supervisor, method)(*args)
+            finally:
+                proxy('close')()
+        try:
+            proxy = self._pool.get_nowait()
+        except queue.Empty:
+            proxy = self._new_proxy(self.timeout)
+        try:
+            result = getattr(proxy.supervisor, method)(*args)
+        except xmlrpc.client.Fault:
+            self._release(proxy)
+            raise
+        except (OSError, http.client.HTTPException, xmlrpc.client.ProtocolError):
+            proxy('close')()
+            raise
+        self._release(proxy)
+        return result
+
+    def _release(self, proxy):
+        try:
+            self._pool.put_nowait(proxy)
+        except queue.Full:
+            proxy('close')()
+
+    def start(self, name):
+        """Start a program without waiting for startsecs; True if it was already running"""
+        try:
+            self.call('startProcess', name, False)
+        except xmlrpc.client.Fault as e:
+            if e.faultCode != SUPERVISOR_FAULT_ALREADY_STARTED:
+                raise
+            return True
+        return False
+
+    def stop(self, name):
+        """Stop a program and wait for it to exit; True if it was not running"""
+        try:
+            self.call('stopProcess', name, True, timeout=SUPERVISOR_STOP_TIMEOUT)
+        except xmlrpc.client.Fault as e:
+            if e.faultCode != SUPERVISOR_FAULT_NOT_RUNNING:
+                raise
+            return True
+        return False
+
+    def process_info(self, name):
+        return self.call('getProcessInfo', name)
+
+    def all_process_info(self):
+        return self.call('getAllProcessInfo')
+
+supervisor_client = SupervisorClient()
+
+def supervisorctl(command, program=VPN_PROGRAM):
+    """Run `supervisorctl <command> <program>`; returns (ok, message)"""
+    result = subprocess.run(['supervisorctl', command, program], capture_output=True, text=True)
+    output = (result.stderr or result.stdout or '').strip()
+    if result.returncode == 0:
+        return True, output
+    # Exit code 7 with "already started" / "not running" means nothing to do
+    if result.returncode == 7 and ('already' in output.lower() or 'not running' in output.lower()):
+        return True, output
+    return False, output or f'Exit code: {result.returncode}'
+
+def supervisor_command(command, program=VPN_PROGRAM):
+    """Start/stop/restart a program over XML-RPC, forking supervisorctl only if RPC is down
+
+    supervisorctl is only tried when the RPC endpoint could not be reached
+    at all. After a timeout or a dropped response the command may already
+    be running, so it is reported as failed rather than issued again.
+    Returns (ok, message) like supervisorctl().
+    """
+    if command not in ('start', 'stop', 'restart'):
+        raise ValueError(f'Unknown supervisor command: {command}')
+    remaining = command
+    try:
+        if command in ('stop', 'restart'):
+            already = supervisor_client.stop(program)
+            if command == 'stop':
+                return True, f'{program}: not running' if already else f'{program}: stopped'
+            remaining = 'start'
+        already = supervisor_client.start(program)
+        if command == 'restart':
+            return True, f'{program}: restarting'
+        return True, f'{program}: already started' if already else f'{program}: starting'
+    except xmlrpc.client.Fault as e:
+        return False, f'{program}: {e.faultString}'
+    except (ConnectionRefusedError, FileNotFoundError):
+        return supervisorctl(remaining, program)
+    except (OSError, http.client.HTTPException, xmlrpc.client.ProtocolError) as e:
+        return False, f'{program}: supervisor did not answer {remaining}: {e}'
+
+def process_status(info):
+    """Summarize a supervisor getProcessInfo() dict"""
+    return {
+        'available': True,
+        'name': info['name'],
+        'state': info['statename'],
+        'pid': info['pid'] or None,
+        'start': info['start'] or None,
+        'exitstatus': info['exitstatus'],
+        'spawnerr': info.get('spawnerr') or None,
+        'description': info.get('description', '')
+    }
+
+
+class Job:
+    """A control action queued on the JobRunner"""
+
+    def __init__(self, action, target, func):
+        self.id = uuid.uuid4().hex[:12]
+        self.action = action
+        self.target = target
+        self.func = func
+        self.state = 'queued'
+        self.progress = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.superseded_by = None
+        self.release = lambda: None
+
+    @property
+    def done(self):
+        return self.state in ('succeeded', 'failed')
+
+    def supersede(self, other):
+        """A conflicting action for the same target was queued: stop waiting on this one"""
+        self.superseded_by = other.id
+        status_sampler.wake_waiters()
+
+    def report(self, message):
+        """Record a progress step and notify /api/events listeners"""
+        self.progress.append({'time': time.time(), 'message': message})
+        status_broker.publish('job', self.to_dict())
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'action': self.action,
+            'target': self.target,
+            'state': self.state,
+            'progress': list(self.progress),
+            'result': self.result,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'superseded_by': self.superseded_by
+        }
+
+class JobRunner:
+    """Small executor for control actions
+
+    Jobs for the same target issue their commands one at a time in
+    submission order, so conflicting actions (connect then disconnect) reach
+    supervisord in the order they were clicked. A job calls `job.release()`
+    once its command is out; the next job for the target starts then, while
+    the first is still waiting for the transition, and a conflicting action
+    supersedes that wait. Submitting the same action as the newest pending
+    or waiting job for the target returns that job instead of a duplicate.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, history=JOB_HISTORY):
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._queues = {}
+        self._waiting = {}
+        self._lock = threading.Lock()
+
+    def submit(self, action, target, func):
+        """Queue `func(job)`; returns (job, created)"""
+        with self._lock:
+            queue = self._queues.setdefault(target, deque())
+            waiting = self._waiting.setdefault(target, [])
+            newest = queue[-1] if queue else (waiting[-1] if waiting else None)
+            if newest is not None and newest.action == action and newest.superseded_by is None:
+                return newest, False
+            job = Job(action, target, func)
+            for pending in waiting:
+                if pending.superseded_by is None:
+                    pending.supersede(job)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.done:
+                    break
+                self._jobs.popitem(last=False)
+            job.release = lambda: self._release(job)
+            queue.append(job)
+            if len(queue) == 1:
+                self._executor.submit(self._run, job)
+        status_broker.publish('job', job.to_dict())
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def recent(self):
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job):
+        job.state = 'running'
+        job.started = time.time()
+        try:
+            job.result = job.func(job)
+            job.state = 'succeeded'
+        except Exception as e:
+            job.error = str(e)
+            job.state = 'failed'
+        job.finished = time.time()
+        status_broker.publish('job', job.to_dict())
+        self._release(job)
+        with self._lock:
+            self._waiting[job.target].remove(job)
+
+    def _release(self, job):
+        """Move `job` from the command queue to the waiting list and start the next one (idempotent)"""
+        with self._lock:
+            queue = self._queues[job.target]
+            if not queue or queue[0] is not job:
+                return
+            queue.popleft()
+            self._waiting[job.target].append(job)
+            # A conflicting action queued while this one was issuing its command runs next
+            conflicting = next((later for later in queue if later.action != job.action), None)
+            if conflicting is not None and job.superseded_by is None:
+                job.supersede(conflicting)
+            if queue:
+                self._executor.submit(self._run, queue[0])
+
+job_runner = JobRunner()
+
+VpnProfile = namedtuple('VpnProfile', ['name', 'server', 'authgroup', 'user', 'duo_method',
+                                       'dns_servers', 'interface', 'program'])
+PROFILE_NAME_RE = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+def default_profile():
+    """The single tunnel configured through the container environment"""
+    settings = get_vpn_settings()
+    return VpnProfile(DEFAULT_PROFILE, settings['server'], settings['authgroup'], settings['user'],
+                      settings['duo_method'], settings['dns_servers'], VPN_INTERFACE, VPN_PROGRAM)
+
+def load_profiles(path=VPN_PROFILES_FILE):
+    """Load VPN profiles: the environment's default plus any from the JSON profiles file
+
+    The file maps profile names to objects with `server`, `authgroup`,
+    `user`, `duo_method`, `dns_servers`, `interface` and `program` (the
+    supervisor program running connect-vpn.sh for that tunnel). Passwords
+    stay in each program's environment, never in this file.
+    """
+    profiles = OrderedDict([(DEFAULT_PROFILE, default_profile())])
+    if not os.path.exists(path):
+        return profiles
+    with open(path, 'r') as f:
+        entries = json.load(f)
+    base = profiles[DEFAULT_PROFILE]._asdict()
+    for name, entry in entries.items():
+        if not PROFILE_NAME_RE.match(name):
+            raise ValueError(f'Invalid profile name: {name!r}')
+        fields = dict(base, name=name, program=f'openconnect-vpn-{name}')
+        fields.update({key: value for key, value in entry.items() if key in VpnProfile._fields and key != 'name'})
+        if 'interface' not in entry and name != DEFAULT_PROFILE:
+            raise ValueError(f'Profile {name!r} needs its own interface')
+        profiles[name] = VpnProfile(**fields)
+    interfaces = [profile.interface for profile in profiles.values()]
+    if len(set(interfaces)) != len(interfaces):
+        raise ValueError('Each profile needs a distinct interface')
+    return profiles
+
+class ProfileRegistry:
+    """Named VPN profiles, each with its own interface and supervisor program"""
+
+    def __init__(self, path=VPN_PROFILES_FILE):
+        self.path = path
+        self.error = None
+        try:
+            self._profiles = load_profiles(path)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            # A broken profiles file must not take the default tunnel down with it
+            self.error = f'{path}: {e}'
+            print(f'Ignoring VPN profiles: {self.error}', flush=True)
+            self._profiles = OrderedDict([(DEFAULT_PROFILE, default_profile())])
+
+    def get(self, name):
+        return self._profiles.get(name)
+
+    def names(self):
+        return list(self._profiles)
+
+    def all(self):
+        return list(self._profiles.values())
+
+profile_registry = ProfileRegistry()
+
+def get_profiles_status():
+    """Status of every profile from one rtnetlink dump and one getAllProcessInfo call"""
+    profiles = profile_registry.all()
+    interfaces = inspect_interfaces([profile.interface for profile in profiles])
+    try:
+        processes = {info['name']: process_status(info) for info in supervisor_client.all_process_info()}
+        process_error = None
+    except (xmlrpc.client.Fault, OSError, http.client.HTTPException, xmlrpc.client.ProtocolError) as e:
+        processes, process_error = {}, str(e)
+    result = {}
+    for profile in profiles:
+        process = processes.get(profile.program)
+        if process is None:
+            process = {'available': False, 'error': process_error or f'No supervisor program {profile.program}'}
+        result[profile.name] = {
+            'vpn': vpn_status_from_interface(profile.interface, interfaces[profile.interface]),
+            'process': process
+        }
+    return result
+
+def default_profile_state(profiles, part):
+    """The default tunnel's `vpn` or `process` entry of a profiles sample"""
+    state = profiles.get(DEFAULT_PROFILE)
+    if state is not None:
+        return state[part]
+    error = profiles.get('error', 'no status for the default profile')
+    return {'status': 'error', 'error': error} if part == 'vpn' else {'available': False, 'error': error}
+
+# One batched probe for every tunnel; the legacy `vpn` and `supervisor` keys
+# are the default profile's part of it
+status_sampler.add_probe('profiles', lambda: get_profiles_status(), min(STATUS_TTL_VPN, STATUS_TTL_SUPERVISOR))
+status_sampler.add_derived('vpn', 'profiles', lambda profiles: default_profile_state(profiles, 'vpn'))
+status_sampler.add_derived('supervisor', 'profiles', lambda profiles: default_profile_state(profiles, 'process'))
+
+def profile_state(snapshot, name):
+    """(vpn status, process info, sampled_at) of one profile from the batched probe"""
+    sample = snapshot.get('profiles')
+    if sample is None or name not in sample.value:
+        return {'status': 'unknown'}, None, 0
+    state = sample.value[name]
+    return state['vpn'], state['process'], sample.sampled_at
+
+def profile_connected(snapshot, name):
+    return profile_state(snapshot, name)[0].get('status') == 'connected'
+
+def profile_failed(snapshot, name, since=0):
+    """True if a sample taken after `since` shows the profile's program died"""
+    _, process, sampled_at = profile_state(snapshot, name)
+    return sampled_at > since and process is not None and process.get('state') in SUPERVISOR_FAILED_STATES
+
+def profile_status(snapshot, profile, now=None):
+    """Status payload for /api/profiles"""
+    vpn, process, sampled_at = profile_state(snapshot, profile.name)
+    now = now or time.time()
+    if process is not None and process.get('state') == 'RUNNING' and process.get('start'):
+        process = dict(process, uptime=round(now - process['start'], 1))
+    return {
+        'name': profile.name,
+        'server': profile.server,
+        'authgroup': profile.authgroup,
+        'user': profile.user,
+        'interface': profile.interface,
+        'program': profile.program,
+        'connected': vpn.get('status') == 'connected',
+        'ip': vpn.get('ip', 'N/A'),
+        'link': vpn.get('link'),
+        'process': process,
+        'age': round(now - sampled_at, 3) if sampled_at else None
+    }
+
+def run_vpn_action(job, command, want_connected, profile, trigger='api'):
+    """Job body: issue a supervisor command, then wait for the tunnel transition"""
+    job.report(f'{command} {job.target}')
+    connected_before = command != 'restart' and profile_connected(status_sampler.snapshot(), profile.name)
+    if command == 'restart':
+        VPN_RECONNECTS.inc(trigger=trigger)
+    issued = time.time()
+    ok, message = supervisor_command(command, job.target)
+    # Later actions for this program may issue their commands while this one waits
+    job.release()
+    if not ok:
+        raise RuntimeError(message)
+    status_sampler.boost('profiles')
+    job.report('waiting for tunnel to come up' if want_connected else 'waiting for tunnel to go down')
+    # A process that dies, or a conflicting action, ends the wait early instead of timing out
+    status_sampler.wait_for(
+        lambda snap: (profile_connected(snap, profile.name) == want_connected
+                      or (want_connected and profile_failed(snap, profile.name, issued))
+                      or job.superseded_by is not None),
+        JOB_WAIT_TIMEOUT)
+    snapshot = status_sampler.snapshot()
+    if job.superseded_by is not None:
+        job.report(f'superseded by job {job.superseded_by}')
+    vpn, process, _ = profile_state(snapshot, profile.name)
+    connected = profile_connected(snapshot, profile.name)
+    if want_connected and connected and not connected_before:
+        VPN_TIME_TO_CONNECT.observe(time.time() - issued)
+    if (want_connected and not connected and job.superseded_by is None
+            and profile_failed(snapshot, profile.name, issued)):
+        raise RuntimeError(f"{job.target} entered {process['state']}: {process.get('spawnerr') or process.get('description')}")
+    return {
+        'profile': profile.name,
+        'connected': connected,
+        'ip': vpn.get('ip'),
+        'transition_seen': connected == want_connected,
+        'process': process,
+        'message': message
+    }
+
+VPN_ACTIONS = {
+    'connect': ('start', True, 'VPN connection starting'),
+    'disconnect': ('stop', False, 'VPN connection stopping'),
+    'reconnect': ('restart', True, 'VPN connection restarting'),
+}
+
+def queue_vpn_action(action, profile, trigger='api'):
+    """Queue a VPN control job for a profile; returns (job, created)"""
+    command, want_connected, _ = VPN_ACTIONS[action]
+    return job_runner.submit(action, profile.program,
+                             lambda job: run_vpn_action(job, command, want_connected, profile, trigger))
+
+def submit_vpn_action(action, profile_name=DEFAULT_PROFILE):
+    """Queue a VPN control action for a profile and build the 202 response"""
+    profile = profile_registry.get(profile_name)
+    if profile is None:
+        return jsonify({'success': False, 'error': f'Unknown profile: {profile_name}'}), 404
+    message = VPN_ACTIONS[action][2]
+    job, created = queue_vpn_action(action, profile)
+    response = jsonify({
+        'success': True,
+        'message': message if created else f'{message} (already queued)',
+        'profile': profile.name,
+        'job_id': job.id,
+        'state': job.state,
+        'location': f'/api/jobs/{job.id}'
+    })
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response
+
+def parse_health_target(target, default_port=HEALTH_PORT):
+    """Split `host`, `host:port` or `[v6]:port` into (host, port)"""
+    if target.startswith('['):
+        host, _, port = target[1:].partition(']')
+        return host, int(port.lstrip(':') or default_port)
+    if target.count(':') == 1:
+        host, port = target.split(':')
+        return host, int(port)
+    return target, default_port
+
+# Interfaces probe sockets could not be bound to, with the first error
+probe_bind_errors = {}
+
+def _probe_socket(host, kind, interface, timeout):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, kind)
+    sock.settimeout(timeout)
+    if interface:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, interface.encode())
+        except OSError as e:
+            # The probe still goes out, but along the routing table, which may not be the tunnel
+            error = str(e)
+            if probe_bind_errors.setdefault(interface, error) is error:
+                print(f'Cannot bind probes to {interface} ({error}); they follow the routing table '
+                      f'and the watchdog will not reconnect', flush=True)
+    return sock
+
+def build_dns_query(name='.', qtype=None):
+    """A recursive DNS query for `name` (root NS by default, otherwise A)"""
+    txid = int.from_bytes(os.urandom(2), 'big')
+    labels = [label.encode('idna') for label in name.strip('.').split('.') if label]
+    qname = b''.join(bytes([len(label)]) + label for label in labels) + b'\x00'
+    if qtype is None:
+        qtype = DNS_TYPE_A if labels else DNS_TYPE_NS
+    # Header: RD set, one question; then QNAME, QTYPE, QCLASS=IN
+    return struct.pack('!HHHHHH', txid, 0x0100, 1, 0, 0, 0) + qname + struct.pack('!HH', qtype, 1)
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError('connection closed')
+        data += chunk
+    return data
+
+def dns_reply_matches(query, reply, question=None):
+    """Whether `reply` carries the id of `query` and, given its question key, the same question"""
+    if reply[:2] != query[:2]:
+        return False
+    if question is None:
+        return True
+    try:
+        return parse_dns_message(reply).key == question
+    except ValueError:
+        return False
+
+def dns_exchange_tcp(host, port, query, timeout, interface=None, question=None):
+    """Send one DNS query over TCP; returns the reply or None if there was no matching one"""
+    try:
+        with _probe_socket(host, socket.SOCK_STREAM, interface, timeout) as sock:
+            sock.connect((host, port))
+            sock.sendall(struct.pack('!H', len(query)) + query)
+            reply = _recv_exact(sock, struct.unpack('!H', _recv_exact(sock, 2))[0])
+            return reply if dns_reply_matches(query, reply, question) else None
+    except (OSError, EOFError):
+        return None
+
+def dns_exchange(host, port, query, timeout, interface=None, question=None):
+    """Send one UDP DNS query; returns (rtt seconds, reply) or (None, None) if it was lost
+
+    Datagrams with another id, or another question when `question` (the
+    query's parse_dns_message key) is given, are ignored while waiting.
+    """
+    try:
+        with _probe_socket(host, socket.SOCK_DGRAM, interface, timeout) as sock:
+            started = time.perf_counter()
+            sock.connect((host, port))
+            sock.send(query)
+            while True:
+                remaining = timeout - (time.perf_counter() - started)
+                if remaining <= 0:
+                    return None, None
+                sock.settimeout(remaining)
+                reply = sock.recv(DNS_MAX_UDP)
+                if dns_reply_matches(query, reply, question):
+                    return time.perf_counter() - started, reply
+    except OSError:
+        return None, None
+
+def probe_dns_rtt(host, port=53, timeout=HEALTH_TIMEOUT, interface=None):
+    """Round trip (s) of one small UDP DNS query, or None if it was lost
 
-app = Flask(__name__)
+    Any reply carrying our transaction id counts, even REFUSED: the point is
+    that a packet made it through the tunnel and back.
+    """
+    return dns_exchange(host, port, build_dns_query(), timeout, interface)[0]
 
-# Configuration
-CONFIG_FILE = '/tmp/openconnect_config.json'
-VPN_PID_FILE = '/tmp/openconnect.pid'
-LOG_DIR = '/var/log/supervisor'
+def probe_tcp_rtt(host, port=53, timeout=HEALTH_TIMEOUT, interface=None):
+    """Round trip (s) of a TCP handshake, or None on timeout
 
-def get_vpn_status():
-    """Check if VPN is connected"""
+    A refused connection still proves the tunnel carried the SYN and the RST.
+    """
     try:
-        result = subprocess.run(['ip', 'addr', 'show', 'tun0'], 
-                              capture_output=True, text=True)
-        if result.returncode == 0 and 'inet' in result.stdout:
-            # Extract IPv4 first (prefer IPv4 over IPv6)
-            for line in result.stdout.split('\n'):
-                if 'inet ' in line and 'tun0' not in line:  # 'inet ' with space = IPv4
-                    ip = line.strip().split()[1].split('/')[0]
-                    return {
-                        'status': 'connected',
-                        'ip': ip,
-                        'timestamp': time.time()
-                    }
-            # Fallback to IPv6 if no IPv4 found
-            for line in result.stdout.split('\n'):
-                if 'inet6' in line and 'tun0' not in line:
-                    ip = line.strip().split()[1].split('/')[0]
-                    return {
-                        'status': 'connected',
-                        'ip': ip,
-                        'timestamp': time.time()
-                    }
-        return {'status': 'disconnected'}
-    except Exception as e:
-        return {'status': 'error', 'error': str(e)}
+        with _probe_socket(host, socket.SOCK_STREAM, interface, timeout) as sock:
+            started = time.perf_counter()
+            try:
+                sock.connect((host, port))
+            except ConnectionRefusedError:
+                pass
+            return time.perf_counter() - started
+    except OSError:
+        return None
 
-def get_dns_status():
-    """Get current DNS configuration"""
+HEALTH_PROBES = {'udp': probe_dns_rtt, 'tcp': probe_tcp_rtt}
+
+class HealthWindow:
+    """Sliding window of probe rounds: RTT, loss and jitter"""
+
+    def __init__(self, size=HEALTH_WINDOW):
+        self.samples = deque(maxlen=size)
+        self.consecutive_failures = 0
+
+    def add(self, rtt):
+        """Record one round: its RTT in seconds, or None if nothing answered"""
+        self.samples.append(rtt)
+        self.consecutive_failures = self.consecutive_failures + 1 if rtt is None else 0
+
+    def clear(self):
+        self.samples.clear()
+        self.consecutive_failures = 0
+
+    def summary(self):
+        answered = [rtt for rtt in self.samples if rtt is not None]
+        sent = len(self.samples)
+        # Jitter as the mean difference between consecutive RTTs (RFC 3550 style)
+        deltas = [abs(b - a) for a, b in zip(answered, answered[1:])]
+        return {
+            'sent': sent,
+            'lost': sent - len(answered),
+            'loss': round((sent - len(answered)) / sent, 3) if sent else None,
+            'rtt_ms': round(self.samples[-1] * 1000, 2) if sent and self.samples[-1] is not None else None,
+            'avg_rtt_ms': round(sum(answered) / len(answered) * 1000, 2) if answered else None,
+            'max_rtt_ms': round(max(answered) * 1000, 2) if answered else None,
+            'jitter_ms': round(sum(deltas) / len(deltas) * 1000, 2) if deltas else None,
+            'consecutive_failures': self.consecutive_failures
+        }
+
+class TunnelWatchdog:
+    """Probe the tunnel's DNS servers and reconnect a tunnel that stopped passing traffic
+
+    Runs in its own thread because a lost probe blocks for HEALTH_TIMEOUT; the
+    sampler's 'health' probe only copies the current summary. Probing pauses
+    while the tunnel is down, and a reconnect is debounced twice: the tunnel
+    must miss HEALTH_DEAD_ROUNDS rounds in a row, and at most one reconnect
+    is issued per HEALTH_RECONNECT_COOLDOWN. Probes that cannot be bound to
+    the interface may not have crossed the tunnel, so they never trigger a
+    reconnect.
+    """
+
+    def __init__(self, targets, interface=VPN_INTERFACE, mode=HEALTH_MODE, interval=HEALTH_INTERVAL,
+                 timeout=HEALTH_TIMEOUT, window=HEALTH_WINDOW, reconnect=HEALTH_RECONNECT):
+        self.targets = [parse_health_target(target) for target in targets]
+        self.interface = interface
+        self.mode = mode
+        self.probe = HEALTH_PROBES[mode]
+        self.interval = interval
+        self.timeout = timeout
+        self.reconnect = reconnect
+        self.window = HealthWindow(window)
+        self.state = 'idle' if self.targets else 'disabled'
+        self.last_round = None
+        self.last_reconnect = 0
+        self.reconnects = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.targets)),
+                                            thread_name_prefix='health-probe')
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start probing (idempotent; does nothing without targets)"""
+        with self._lock:
+            if not self.targets or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name='tunnel-watchdog', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check(status_sampler.snapshot())
+            except Exception as e:
+                print(f'tunnel watchdog failed: {e}', flush=True)
+            self._stop.wait(self.interval)
+
+    def probe_round(self):
+        """Probe every target concurrently; the round's RTT is the fastest answer"""
+        futures = [self._executor.submit(self.probe, host, port, self.timeout, self.interface)
+                   for host, port in self.targets]
+        rtts = [future.result() for future in futures]
+        answered = [rtt for rtt in rtts if rtt is not None]
+        return min(answered) if answered else None
+
+    def check(self, snapshot):
+        """Run one probe round if the tunnel is up and act on the result"""
+        if not vpn_connected(snapshot):
+            with self._lock:
+                self.window.clear()
+                self.state = 'idle'
+            return self.state
+        rtt = self.probe_round()
+        with self._lock:
+            self.window.add(rtt)
+            self.last_round = time.time()
+            self.state = self.evaluate(self.window.summary())
+        if self.state == 'dead':
+            self.maybe_reconnect()
+        status_sampler.refresh('health')
+        return self.state
+
+    def evaluate(self, summary):
+        """Classify a window summary as ok, degraded or dead"""
+        if summary['consecutive_failures'] >= HEALTH_DEAD_ROUNDS:
+            return 'dead'
+        if summary['sent'] < HEALTH_MIN_SAMPLES:
+            return 'degraded' if summary['consecutive_failures'] else 'ok'
+        if summary['loss'] >= HEALTH_LOSS_DEGRADED:
+            return 'degraded'
+        if summary['avg_rtt_ms'] is not None and summary['avg_rtt_ms'] >= HEALTH_RTT_DEGRADED_MS:
+            return 'degraded'
+        return 'ok'
+
+    @property
+    def bound(self):
+        """False once a probe socket failed to bind to the interface"""
+        return self.interface not in probe_bind_errors
+
+    def maybe_reconnect(self):
+        """Reconnect the default profile through the job runner, at most once per cooldown"""
+        now = time.time()
+        if not self.reconnect or not self.bound or now - self.last_reconnect < HEALTH_RECONNECT_COOLDOWN:
+            return None
+        profile = profile_registry.get(DEFAULT_PROFILE)
+        self.last_reconnect = now
+        self.reconnects += 1
+        with self._lock:
+            self.window.clear()
+        print(f'Tunnel {self.interface} stopped answering probes; reconnecting', flush=True)
+        job, _ = queue_vpn_action('reconnect', profile, trigger='watchdog')
+        return job
+
+    def summary(self):
+        with self._lock:
+            summary = self.window.summary()
+            summary.update({
+                'state': self.state,
+                'mode': self.mode,
+                'targets': [f'{host}:{port}' for host, port in self.targets],
+                'bound': self.bound,
+                'bind_error': probe_bind_errors.get(self.interface),
+                'last_round': self.last_round,
+                'reconnects': self.reconnects,
+                'last_reconnect': self.last_reconnect or None
+            })
+        return summary
+
+tunnel_watchdog = TunnelWatchdog(HEALTH_TARGETS)
+
+def get_health_status():
+    tunnel_watchdog.start()
+    return tunnel_watchdog.summary()
+
+status_sampler.add_probe('health', lambda: get_health_status(), HEALTH_INTERVAL)
+
+def _skip_dns_name(data, offset):
+    """Offset just past a (possibly compressed) name in a DNS message"""
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+DnsMessage = namedtuple('DnsMessage', ['question', 'key', 'rcode', 'truncated', 'ancount', 'ttls',
+                                       'soa_minimum', 'udp_size'])
+
+def parse_dns_message(data):
+    """Parse the parts of a DNS message the cache needs into a DnsMessage
+
+    `question` is the raw question section and `key` its lowercased form.
+    TTL fields are (offset, ttl) pairs so a cached reply can be aged in
+    place. `udp_size` is the EDNS payload size a query advertises (512
+    without EDNS). Raises ValueError on anything malformed.
+    """
     try:
-        with open('/etc/resolv.conf', 'r') as f:
-            content = f.read()
-        dns_servers = [line.split()[1] for line in content.split('\n') 
-                      if line.startswith('nameserver')]
-        return dns_servers
-    except:
-        return []
-
-def check_guacamole_status():
-    """Check if Guacamole is actually responding and on which port"""
-    guac_port = int(os.environ.get('GUACAMOLE_PORT', '8080'))
-    ports_to_check = [guac_port, 8080, 9000]  # Check specified port, default, and fallback
-    
-    for port in ports_to_check:
+        _, flags, qdcount, ancount, nscount, arcount = struct.unpack_from('!HHHHHH', data)
+        offset = 12
+        for _ in range(qdcount):
+            offset = _skip_dns_name(data, offset) + 4
+        if offset > len(data):
+            raise ValueError('truncated DNS message')
+        question = bytes(data[12:offset])
+        ttls, soa_minimum, udp_size = [], None, DNS_MIN_UDP
+        for i in range(ancount + nscount + arcount):
+            offset = _skip_dns_name(data, offset)
+            rtype, rclass, ttl, rdlength = struct.unpack_from('!HHIH', data, offset)
+            if rtype == DNS_TYPE_OPT:
+                udp_size = max(DNS_MIN_UDP, rclass)
+            else:
+                ttls.append((offset + 4, ttl))
+            if rtype == DNS_TYPE_SOA and ancount <= i < ancount + nscount:
+                if rdlength < 22:
+                    raise ValueError('short SOA record')
+                minimum = struct.unpack_from('!I', data, offset + 10 + rdlength - 4)[0]
+                soa_minimum = min(ttl, minimum)
+            offset += 10 + rdlength
+        if offset > len(data):
+            raise ValueError('truncated DNS message')
+    except (IndexError, struct.error) as e:
+        raise ValueError(f'malformed DNS message: {e}')
+    # Names are case-insensitive; label length bytes are all < 64 so lower() leaves them alone
+    return DnsMessage(question, question.lower(), flags & 0xF, bool(flags & DNS_FLAG_TC), ancount, ttls,
+                      soa_minimum, udp_size)
+
+def _question_only_reply(message, flags, qdcount):
+    return message[:2] + struct.pack('!HHHHH', flags, qdcount, 0, 0, 0)
+
+def dns_error_reply(query, rcode=2):
+    """Reply to `query` with just its question and an error rcode (SERVFAIL by default)"""
+    question = parse_dns_message(query).question
+    header_flags, qdcount = struct.unpack_from('!HH', query, 2)
+    flags = 0x8000 | 0x0080 | (header_flags & 0x0100) | rcode
+    return _question_only_reply(query, flags, qdcount) + question
+
+def dns_truncated_reply(reply):
+    """`reply` cut down to its header and question with TC set, so the client retries over TCP"""
+    question = parse_dns_message(reply).question
+    flags, qdcount = struct.unpack_from('!HH', reply, 2)
+    return _question_only_reply(reply, flags | DNS_FLAG_TC, qdcount) + question
+
+CachedReply = namedtuple('CachedReply', ['reply', 'ttls', 'stored_at', 'expires'])
+
+class DnsCache:
+    """LRU cache of DNS replies keyed by question, evicted when their TTL runs out
+
+    A reply lives for the smallest TTL among its records (clamped to
+    DNS_CACHE_MIN_TTL..DNS_CACHE_MAX_TTL); negative answers for the SOA
+    minimum or DNS_CACHE_NEGATIVE_TTL. Hits are served with their TTLs
+    reduced by the time spent in the cache.
+    """
+
+    def __init__(self, size=DNS_CACHE_SIZE, min_ttl=DNS_CACHE_MIN_TTL, max_ttl=DNS_CACHE_MAX_TTL,
+                 negative_ttl=DNS_CACHE_NEGATIVE_TTL):
+        self.size = size
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'expired': 0, 'evicted': 0}
+
+    def get(self, query, now=None):
+        """Cached reply for `query` (with its id and aged TTLs), or None"""
+        key = parse_dns_message(query).key
+        now = now or time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= now:
+                del self._entries[key]
+                self.stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+        reply = bytearray(entry.reply)
+        reply[:2] = query[:2]
+        elapsed = int(now - entry.stored_at)
+        for offset, ttl in entry.ttls:
+            struct.pack_into('!I', reply, offset, max(0, ttl - elapsed))
+        return bytes(reply)
+
+    def put(self, reply, now=None):
+        """Store an upstream reply if it is cacheable; returns the TTL used (0 if not stored)"""
+        message = parse_dns_message(reply)
+        if message.truncated:
+            return 0  # a partial answer; the full one has to come over TCP
+        if message.rcode == 0 and message.ancount:
+            ttl = min(ttl for _, ttl in message.ttls)
+        elif message.rcode == 3 or (message.rcode == 0 and not message.ancount):
+            ttl = message.soa_minimum if message.soa_minimum is not None else self.negative_ttl
+        else:
+            return 0  # SERVFAIL, REFUSED, ...: let the next query try again
+        ttl = max(self.min_ttl, min(self.max_ttl, ttl))
+        if ttl <= 0:
+            return 0
+        now = now or time.time()
+        with self._lock:
+            self._entries[message.key] = CachedReply(reply, message.ttls, now, now + ttl)
+            self._entries.move_to_end(message.key)
+            self.stats['stored'] += 1
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.stats['evicted'] += 1
+        return ttl
+
+    def sweep(self, now=None):
+        """Drop every expired entry"""
+        now = now or time.time()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry.expires <= now]
+            for key in expired:
+                del self._entries[key]
+            self.stats['expired'] += len(expired)
+        return len(expired)
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats, size=len(self._entries), capacity=self.size)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else None
+        return stats
+
+class ResolverMonitor:
+    """Measure query latency and reachability of every upstream nameserver
+
+    Upstreams are DNS_SERVERS when set, otherwise the resolv.conf
+    nameservers (minus our own forwarder). Each gets a HealthWindow of
+    recent queries, probed concurrently every DNS_PROBE_INTERVAL seconds in
+    a thread of its own; the sampler's 'resolver' probe copies the summary.
+    """
+
+    def __init__(self, interval=DNS_PROBE_INTERVAL, timeout=DNS_PROBE_TIMEOUT, window=DNS_PROBE_WINDOW,
+                 probe_name=DNS_PROBE_NAME, port=53):
+        self.interval = interval
+        self.timeout = timeout
+        self.window_size = window
+        self.probe_name = probe_name
+        self.port = port
+        self._windows = {}
+        self._rcodes = {}
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='dns-probe')
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_round = None
+
+    def servers(self):
+        if DNS_SERVERS:
+            return list(DNS_SERVERS)
+        own = parse_health_target(DNS_CACHE_LISTEN)[0] if DNS_CACHE else None
+        return [server for server in resolv_conf.read()['nameservers'] if server != own]
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name='resolver-monitor', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.probe_all()
+                status_sampler.refresh('resolver')
+            except Exception as e:
+                print(f'resolver monitor failed: {e}', flush=True)
+            self._stop.wait(self.interval)
+
+    def probe(self, server):
+        rtt, reply = dns_exchange(server, self.port, build_dns_query(self.probe_name), self.timeout)
+        rcode = DNS_RCODES.get(reply[3] & 0xF, str(reply[3] & 0xF)) if reply and len(reply) >= 4 else None
+        return rtt, rcode
+
+    def probe_all(self):
+        """Query every upstream once, concurrently"""
+        servers = self.servers()
+        results = list(self._executor.map(self.probe, servers))
+        with self._lock:
+            for server in list(self._windows):
+                if server not in servers:
+                    del self._windows[server]
+                    self._rcodes.pop(server, None)
+            for server, (rtt, rcode) in zip(servers, results):
+                self._windows.setdefault(server, HealthWindow(self.window_size)).add(rtt)
+                if rcode is not None:
+                    self._rcodes[server] = rcode
+            self.last_round = time.time()
+
+    def ranked(self):
+        """Upstreams, best first: least loss, then lowest average RTT; unprobed ones keep their order"""
+        servers = self.servers()
+        with self._lock:
+            summaries = {server: window.summary() for server, window in self._windows.items()}
+
+        def score(item):
+            position, server = item
+            summary = summaries.get(server)
+            if summary is None or not summary['sent']:
+                return (0, 0, position)
+            return (summary['loss'], summary['avg_rtt_ms'] if summary['avg_rtt_ms'] is not None else float('inf'), position)
+
+        return [server for _, server in sorted(enumerate(servers), key=score)]
+
+    def summary(self):
+        with self._lock:
+            servers = []
+            for server, window in self._windows.items():
+                info = window.summary()
+                info.update({'server': server, 'rcode': self._rcodes.get(server),
+                             'reachable': info['consecutive_failures'] == 0 and info['sent'] > 0})
+                servers.append(info)
+        return {'servers': servers, 'probe_name': self.probe_name, 'interval': self.interval,
+                'last_round': self.last_round}
+
+class DnsForwarder:
+    """Small caching DNS forwarder in front of the monitored upstreams
+
+    Cache hits are answered from the receiving thread; misses go to a small
+    pool that tries the upstreams best-first and answers SERVFAIL if none of
+    them reply in time. Upstream replies must repeat the query's id and
+    question or they are ignored. An upstream UDP reply with TC set is
+    fetched again over TCP and only the full answer is cached. UDP clients
+    get answers too big for their advertised size as a truncated reply and
+    retry on the TCP listener at the same address.
+    """
+
+    def __init__(self, listen, cache, monitor, workers=DNS_CACHE_WORKERS, timeout=DNS_PROBE_TIMEOUT):
+        self.listen = parse_health_target(listen)
+        self.cache = cache
+        self.monitor = monitor
+        self.timeout = timeout
+        self.workers = workers
+        self.stats = {'queries': 0, 'tcp_queries': 0, 'forwarded': 0, 'tcp_fallbacks': 0, 'truncated': 0,
+                      'upstream_failures': 0, 'malformed': 0}
+        self.error = None
+        self._sock = None
+        self._tcp_sock = None
+        self._executor = None
+        self._tcp_executor = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._tcp_thread = None
+
+    def start(self):
+        """Bind and start answering (idempotent); a bind failure is reported, not raised"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            host, port = self.listen
+            family = socket.AF_INET6 if ':' in host else socket.AF_INET
+            try:
+                sock = socket.socket(family, socket.SOCK_DGRAM)
+                sock.bind((host, port))
+            except OSError as e:
+                self.error = f'cannot listen on {host}:{port}: {e}'
+                print(f'DNS cache disabled: {self.error}', flush=True)
+                return
+            sock.settimeout(1.0)
+            self.error = None
+            try:
+                tcp_sock = socket.socket(family, socket.SOCK_STREAM)
+                tcp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                tcp_sock.bind((host, port))
+                tcp_sock.listen(16)
+                tcp_sock.settimeout(1.0)
+            except OSError as e:
+                # UDP alone still answers everything that fits in a datagram
+                tcp_sock = None
+                self.error = f'no TCP on {host}:{port}: {e}'
+                print(f'DNS cache: {self.error}', flush=True)
+            self._sock = sock
+            self._tcp_sock = tcp_sock
+            self._stop.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='dns-forward')
+            self._thread = Thread(target=self._run, name='dns-forwarder', daemon=True)
+            self._thread.start()
+            if tcp_sock is not None:
+                self._tcp_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='dns-tcp')
+                self._tcp_thread = Thread(target=self._run_tcp, name='dns-forwarder-tcp', daemon=True)
+                self._tcp_thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        for thread in (self._thread, self._tcp_thread):
+            if thread is not None:
+                thread.join(timeout)
+        for executor in (self._executor, self._tcp_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        for sock in (self._sock, self._tcp_sock):
+            if sock is not None:
+                sock.close()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _run(self):
+        last_sweep = time.time()
+        while not self._stop.is_set():
+            try:
+                query, peer = self._sock.recvfrom(DNS_MAX_UDP)
+            except socket.timeout:
+                query = None
+            except OSError:
+                break
+            now = time.time()
+            if now - last_sweep > 60:
+                self.cache.sweep(now)
+                last_sweep = now
+            if query is None:
+                continue
+            self._count('queries')
+            try:
+                reply = self.cache.get(query, now)
+            except ValueError:
+                self._count('malformed')
+                continue
+            if reply is not None:
+                self._send_udp(query, reply, peer)
+            else:
+                self._executor.submit(self._forward, query, peer)
+
+    def _send_udp(self, query, reply, peer):
+        """Answer a UDP client, truncating replies larger than it accepts"""
         try:
-            import urllib.request
-            urllib.request.urlopen(f'http://localhost:{port}/guacamole/', timeout=2)
-            return {'status': 'running', 'available': True, 'port': port}
-        except:
+            if len(reply) > parse_dns_message(query).udp_size:
+                self._count('truncated')
+                reply = dns_truncated_reply(reply)
+            self._sock.sendto(reply, peer)
+        except (ValueError, OSError):
             pass
-    
-    return {'status': 'not responding', 'available': False, 'port': guac_port}
 
-def get_vpn_settings():
-    """Get VPN configuration from environment"""
-    return {
-        'user': os.environ.get('VPN_USER', 'N/A'),
-        'server': os.environ.get('VPN_SERVER', 'vpn.illinois.edu'),
-        'authgroup': os.environ.get('VPN_AUTHGROUP', 'OpenConnect1 (Split)'),
-        'duo_method': os.environ.get('DUO_METHOD', 'push'),
-        'dns_servers': os.environ.get('DNS_SERVERS', '130.126.2.131'),
-    }
+    def _forward(self, query, peer):
+        reply = self.resolve_upstream(query)
+        if reply is None:
+            try:
+                reply = dns_error_reply(query)
+            except ValueError:
+                return
+        self._send_udp(query, reply, peer)
 
-def get_logs(lines=50):
-    """Get recent logs from supervisor output and error logs, formatted and filtered"""
-    try:
-        all_lines = []
-        seen_lines = set()
-        
-        # Read stdout log
-        stdout_log = f'{LOG_DIR}/openconnect-vpn.out.log'
-        if os.path.exists(stdout_log):
+    def resolve_upstream(self, query):
+        """Full reply to `query` from the best upstream that answers it, or None
+
+        Only a reply to the same question is accepted: it is cached under
+        that question, so anything else would poison the cache.
+        """
+        question = parse_dns_message(query).key
+        for server in self.monitor.ranked():
+            _, reply = dns_exchange(server, self.monitor.port, query, self.timeout, question=question)
+            if reply is not None and struct.unpack_from('!H', reply, 2)[0] & DNS_FLAG_TC:
+                self._count('tcp_fallbacks')
+                reply = dns_exchange_tcp(server, self.monitor.port, query, self.timeout, question=question)
+            if reply is None:
+                continue
+            self._count('forwarded')
             try:
-                with open(stdout_log, 'r') as f:
-                    all_lines.extend(f.readlines())
-            except:
+                self.cache.put(reply)
+            except ValueError:
                 pass
-        
-        # Read stderr log
-        stderr_log = f'{LOG_DIR}/openconnect-vpn.err.log'
-        if os.path.exists(stderr_log):
+            return reply
+        self._count('upstream_failures')
+        return None
+
+    def _run_tcp(self):
+        while not self._stop.is_set():
             try:
-                with open(stderr_log, 'r') as f:
-                    all_lines.extend(f.readlines())
-            except:
-                pass
-        
-        # Filter and deduplicate, remove sensitive data
-        filtered_lines = []
-        for line in all_lines[-lines*2:]:  # Get more to filter duplicates
-            line = line.rstrip()
-            
-            # Skip unimportant lines
-            if not line or line.startswith('==================') or 'Configuring DNS' in line:
+                conn, _ = self._tcp_sock.accept()
+            except socket.timeout:
                 continue
-            
-            # Redact passwords and sensitive info
-            line = line.replace(os.environ.get('VPN_PASS', 'REDACTED'), '***REDACTED***')
-            if 'password' in line.lower():
-                line = '[REDACTED - password/auth info]'
-            
-            if line not in seen_lines:
-                seen_lines.add(line)
-                filtered_lines.append(line)
-        
-        # Return formatted logs (last N unique lines)
-        if filtered_lines:
-            return '\n'.join(filtered_lines[-lines:])
-        else:
-            return "No logs available yet. Start VPN connection to generate logs."
-    except Exception as e:
-        return f"Error reading logs: {str(e)}"
+            except OSError:
+                break
+            self._tcp_executor.submit(self._serve_tcp, conn)
+
+    def _serve_tcp(self, conn):
+        """Answer length-prefixed queries on one TCP connection until it goes idle or closes"""
+        with conn:
+            conn.settimeout(DNS_TCP_IDLE)
+            while not self._stop.is_set():
+                try:
+                    query = _recv_exact(conn, struct.unpack('!H', _recv_exact(conn, 2))[0])
+                except (OSError, EOFError):
+                    return
+                self._count('tcp_queries')
+                try:
+                    reply = self.cache.get(query)
+                    if reply is None:
+                        reply = self.resolve_upstream(query) or dns_error_reply(query)
+                except ValueError:
+                    self._count('malformed')
+                    return
+                try:
+                    conn.sendall(struct.pack('!H', len(reply)) + reply)
+                except OSError:
+                    return
+
+    def summary(self):
+        summary = self.cache.summary()
+        with self._stats_lock:
+            summary.update(self.stats)
+        summary.update({'listen': '{}:{}'.format(*self.listen), 'running': self._thread is not None
+                        and self._thread.is_alive(), 'tcp': self._tcp_thread is not None
+                        and self._tcp_thread.is_alive(), 'error': self.error})
+        return summary
+
+resolver_monitor = ResolverMonitor()
+dns_forwarder = DnsForwarder(DNS_CACHE_LISTEN, DnsCache(), resolver_monitor) if DNS_CACHE else None
+
+def get_resolver_status():
+    """resolv.conf contents, per-upstream latency and (if enabled) cache stats"""
+    resolver_monitor.start()
+    if dns_forwarder is not None:
+        dns_forwarder.start()
+    parsed = resolv_conf.read()
+    status = resolver_monitor.summary()
+    status.update({
+        'nameservers': parsed['nameservers'],
+        'search': parsed['search'],
+        'cache': dns_forwarder.summary() if dns_forwarder is not None else None
+    })
+    return status
+
+status_sampler.add_probe('resolver', lambda: get_resolver_status(), STATUS_TTL_DNS)
 
 @app.route('/')
 def index():
@@ -140,349 +3111,920 @@ def index():
 @app.route('/api/')
 def api_index():
     """Main API endpoint - returns status as JSON"""
-    status = get_vpn_status()
-    dns = get_dns_status()
-    return jsonify({
+    snapshot = status_sampler.snapshot()
+    vpn = snapshot.get('vpn')
+    dns = snapshot.get('dns')
+    status = vpn.value if vpn else {'status': 'unknown'}
+    now = time.time()
+    return conditional_json({
         'status': status['status'],
         'ip': status.get('ip', 'N/A'),
-        'dns': dns,
-        'timestamp': time.time()
+        'dns': dns.value if dns else [],
+        'timestamp': now,
+        'age': sample_age(vpn, now)
     })
 
 @app.route('/api/status')
 def api_status():
     """Get current VPN and Guacamole status"""
-    vpn_status = get_vpn_status()
-    dns = get_dns_status()
-    guac_status = check_guacamole_status()
-    
-    return jsonify({
-        'vpn': {
-            'connected': vpn_status['status'] == 'connected',
-            'ip': vpn_status.get('ip', 'N/A'),
-            'dns': dns,
-            'timestamp': vpn_status.get('timestamp', 0)
-        },
-        'guacamole': {
-            'status': guac_status['status'],
-            'available': guac_status['available'],
-            'port': guac_status.get('port', 8080)
-        }
-    })
+    return conditional_json(build_status(status_sampler.snapshot()))
+
+@app.route('/api/events')
+def api_events():
+    """Stream status transitions (vpn, ip, dns, guacamole) as Server-Sent Events"""
+    if not sse_slots.acquire(blocking=False):
+        return sse_busy()
+    snapshot = status_sampler.snapshot()
+    subscriber = status_broker.subscribe(request.headers.get('Last-Event-ID'))
+    # Every new client first gets the current state, then only changes
+    subscriber.push((None, 'status', build_status(snapshot)))
+    return sse_response(sse_stream(subscriber), subscriber)
 
 @app.route('/api/logs')
 def api_logs():
-    """Get recent logs"""
-    lines = request.args.get('lines', 50, type=int)
-    return jsonify({'logs': get_logs(lines)})
+    """Query recent logs: ?lines=|limit=, since=<unix time>, level=info|warning|error, grep=<text>[&regex=1]"""
+    limit = request.args.get('limit', request.args.get('lines', 50, type=int), type=int)
+    since = request.args.get('since', type=float)
+    level = request.args.get('level')
+    grep = request.args.get('grep')
+    regex = request.args.get('regex', '').lower() in ('1', 'true', 'yes')
+    if level and level not in LOG_LEVELS:
+        return jsonify({'success': False, 'error': f'level must be one of {", ".join(LOG_LEVELS)}'}), 400
+    log_follower.start()
+    try:
+        records = log_index.query(since=since, level=level, grep=grep, limit=max(0, limit), regex=regex)
+    except re.error as e:
+        return jsonify({'success': False, 'error': f'Invalid grep pattern: {e}'}), 400
+    logs = '\n'.join(record.text for record in records)
+    return jsonify({
+        'logs': logs or "No logs available yet. Start VPN connection to generate logs.",
+        'records': [log_record_dict(record) for record in records],
+        'count': len(records)
+    })
+
+@app.route('/api/logs/stream')
+def api_logs_stream():
+    """Stream new log lines as Server-Sent Events"""
+    log_follower.start()
+    if not sse_slots.acquire(blocking=False):
+        return sse_busy()
+    backlog = request.args.get('backlog', 50, type=int)
+    subscriber = log_broker.subscribe(request.headers.get('Last-Event-ID'), replay=max(0, backlog))
+    return sse_response(sse_stream(subscriber), subscriber)
 
 @app.route('/api/settings')
 def api_settings():
     """Get VPN settings"""
     settings = get_vpn_settings()
-    return jsonify(settings)
+    response = jsonify(settings)
+    # Settings come from the environment and cannot change while we run
+    response.headers['Cache-Control'] = f'private, max-age={SETTINGS_MAX_AGE}'
+    return response
 
 @app.route('/api/connect', methods=['POST'])
 def api_connect():
     """Start VPN connection"""
-    try:
-        # Start the openconnect-vpn service via supervisor
-        result = subprocess.run(['supervisorctl', 'start', 'openconnect-vpn'], 
-                              capture_output=True, text=True)
-        if result.returncode != 0:
-            error_msg = result.stderr or result.stdout or f'Exit code: {result.returncode}'
-            # Exit code 7 usually means already running, which is okay
-            if result.returncode == 7 and 'already' in error_msg.lower():
-                return jsonify({'success': True, 'message': 'VPN connection already running'})
-            return jsonify({'success': False, 'error': error_msg}), 500
-        time.sleep(2)
-        return jsonify({'success': True, 'message': 'VPN connection starting'})
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return submit_vpn_action('connect')
 
 @app.route('/api/disconnect', methods=['POST'])
 def api_disconnect():
     """Stop VPN connection"""
-    try:
-        # Stop the openconnect-vpn service via supervisor
-        result = subprocess.run(['supervisorctl', 'stop', 'openconnect-vpn'], 
-                              capture_output=True, text=True)
-        if result.returncode != 0:
-            error_msg = result.stderr or result.stdout or f'Exit code: {result.returncode}'
-            return jsonify({'success': False, 'error': error_msg}), 500
-        time.sleep(1)
-        return jsonify({'success': True, 'message': 'VPN connection stopped'})
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return submit_vpn_action('disconnect')
 
 @app.route('/api/reconnect', methods=['POST'])
 def api_reconnect():
     """Reconnect VPN"""
-    try:
-        result = subprocess.run(['supervisorctl', 'restart', 'openconnect-vpn'], 
-                              capture_output=True, text=True)
-        if result.returncode != 0:
-            error_msg = result.stderr or result.stdout or f'Exit code: {result.returncode}'
-            return jsonify({'success': False, 'error': error_msg}), 500
-        time.sleep(2)
-        return jsonify({'success': True, 'message': 'VPN connection restarting'})
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    return submit_vpn_action('reconnect')
 
-@app.route('/dashboard')
-def dashboard():
-    """Web dashboard (HTML)"""
-    return '''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>OpenConnect VPN + Guacamole</title>
-        <style>
-            body { font-family: Arial, sans-serif; margin: 20px; background: #f5f5f5; }
-            .container { max-width: 1400px; margin: 0 auto; }
-            .dashboard { display: grid; grid-template-columns: 1fr 1fr 1fr; gap: 20px; }
-            .panel { background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
-            .panel-full { grid-column: 1 / -1; }
-            .status { font-size: 18px; font-weight: bold; padding: 10px; border-radius: 4px; margin: 10px 0; }
-            .connected { background: #d4edda; color: #155724; }
-            .disconnected { background: #f8d7da; color: #721c24; }
-            button { padding: 10px 20px; margin: 5px; border: none; border-radius: 4px; cursor: pointer; font-size: 14px; }
-            .btn-connect { background: #28a745; color: white; }
-            .btn-connect:hover { background: #218838; }
-            .btn-disconnect { background: #dc3545; color: white; }
-            .btn-disconnect:hover { background: #c82333; }
-            .btn-reconnect { background: #007bff; color: white; }
-            .btn-reconnect:hover { background: #0056b3; }
-            .info { background: #e7f3ff; padding: 10px; margin: 10px 0; border-left: 4px solid #007bff; }
-            .logs { background: #f8f9fa; padding: 10px; border: 1px solid #dee2e6; border-radius: 4px; font-family: monospace; font-size: 12px; max-height: 400px; overflow-y: auto; white-space: pre-wrap; word-wrap: break-word; line-height: 1.4; }
-            .settings { background: #fff3cd; padding: 10px; margin: 10px 0; border-left: 4px solid #ffc107; font-size: 13px; }
-            .setting-row { display: flex; justify-content: space-between; padding: 5px 0; border-bottom: 1px solid #e0e0e0; }
-            .setting-row:last-child { border-bottom: none; }
-            .setting-key { font-weight: bold; color: #555; }
-            .setting-value { color: #333; word-break: break-all; }
-            h2 { color: #333; border-bottom: 2px solid #007bff; padding-bottom: 10px; }
-            a { color: #007bff; text-decoration: none; }
-            a:hover { text-decoration: underline; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>🔒 OpenConnect VPN + Guacamole Dashboard</h1>
-            
-            <div class="dashboard">
-                <!-- VPN Panel -->
-                <div class="panel">
-                    <h2>VPN Connection</h2>
-                    <div id="vpn-status" class="status disconnected">Status: Checking...</div>
-                    <div id="vpn-info" class="info"></div>
-                    <div>
-                        <button class="btn-connect" onclick="connect()">Connect</button>
-                        <button class="btn-disconnect" onclick="disconnect()">Disconnect</button>
-                        <button class="btn-reconnect" onclick="reconnect()">Reconnect</button>
-                    </div>
-                </div>
+@app.route('/api/profiles')
+def api_profiles():
+    """List VPN profiles with their status"""
+    snapshot = status_sampler.snapshot()
+    now = time.time()
+    return conditional_json({
+        'profiles': [profile_status(snapshot, profile, now) for profile in profile_registry.all()],
+        'error': profile_registry.error
+    })
+
+@app.route('/api/profiles/<name>/status')
+def api_profile_status(name):
+    """Status of one VPN profile"""
+    profile = profile_registry.get(name)
+    if profile is None:
+        return jsonify({'success': False, 'error': f'Unknown profile: {name}'}), 404
+    return conditional_json(profile_status(status_sampler.snapshot(), profile))
+
+@app.route('/api/profiles/<name>/<action>', methods=['POST'])
+def api_profile_action(name, action):
+    """Connect, disconnect or reconnect one VPN profile"""
+    if action not in VPN_ACTIONS:
+        return jsonify({'success': False, 'error': f'Unknown action: {action}'}), 404
+    return submit_vpn_action(action, name)
+
+def readiness(snapshot):
+    """Per-component readiness from a sampler snapshot"""
+    now = time.time()
+    mariadb = snapshot.get('mariadb')
+    guac = snapshot.get('guacamole')
+    vpn = snapshot.get('vpn')
+    health = snapshot.get('health')
+    connected = vpn_connected(snapshot)
+    return {
+        'web': {'up': True, 'uptime': round(now - STARTUP_TIMING['started'], 1)},
+        'mariadb': dict(mariadb.value, age=sample_age(mariadb, now)) if mariadb else {'up': False},
+        'guacamole': {'up': bool(guac and guac.value.get('available')),
+                      'port': guac.value.get('port') if guac else None, 'age': sample_age(guac, now)},
+        'vpn': {'up': connected, 'state': tunnel_state(connected, health.value if health else {}),
+                'ip': vpn.value.get('ip') if vpn else None, 'age': sample_age(vpn, now)}
+    }
+
+def components_ready(snapshot, require):
+    components = readiness(snapshot)
+    return all(components[name]['up'] for name in require)
+
+ready_waiters = threading.BoundedSemaphore(READY_MAX_WAITERS)
+
+def wait_until_ready(require, wait):
+    """Re-probe the required components at the fast interval until they are up; returns the last snapshot"""
+    for name in require:
+        if name != 'web':
+            status_sampler.boost(name, wait)
+    status_sampler.wait_for(lambda snap: components_ready(snap, require), wait)
+    # The vpn boost is shared with control jobs and ends on its own transition
+    for name in ('mariadb', 'guacamole'):
+        if name in require:
+            status_sampler.end_boost(name)
+    return status_sampler.snapshot()
+
+@app.route('/api/ready')
+def api_ready():
+    """Readiness: ?require=web,mariadb,guacamole,vpn (default READY_REQUIRE), wait=<seconds>
+
+    200 when every required component is up, 503 otherwise. With `wait` the
+    request blocks until they are (or the wait runs out), re-probing the
+    pending components at the fast interval instead of making callers sleep.
+    """
+    require = [name for name in request.args.get('require', READY_REQUIRE).split(',') if name]
+    unknown = [name for name in require if name not in READY_COMPONENTS]
+    if unknown:
+        return jsonify({'success': False, 'error': f'Unknown components: {", ".join(unknown)}; '
+                                                   f'expected {", ".join(READY_COMPONENTS)}'}), 400
+    wait = min(max(request.args.get('wait', 0, type=float), 0), READY_WAIT_MAX)
+    snapshot = status_sampler.snapshot()
+    # Past READY_MAX_WAITERS blocked requests, answer at once instead of pinning another thread
+    if wait and not components_ready(snapshot, require) and ready_waiters.acquire(blocking=False):
+        try:
+            snapshot = wait_until_ready(require, wait)
+        finally:
+            ready_waiters.release()
+    components = readiness(snapshot)
+    ready = all(components[name]['up'] for name in require)
+    response = jsonify({
+        'ready': ready,
+        'require': require,
+        'components': components,
+        'startup': STARTUP_TIMING
+    })
+    response.status_code = 200 if ready else 503
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/connect/timeline')
+def api_connect_timeline():
+    """Per-phase durations of the current and recent connect attempts: ?limit=10"""
+    log_follower.start()
+    limit = request.args.get('limit', 10, type=int)
+    return jsonify({
+        'current': connect_timeline.current(),
+        'attempts': connect_timeline.recent(limit),
+        'percentiles': connect_timeline.percentiles(),
+        'phases': [phase for phase, _, _ in TIMELINE_PHASES],
+        'resolution': log_follower.interval
+    })
+
+def _history_bound(name, default, now):
+    """A unix time from the query string; negative values count back from now"""
+    value = request.args.get(name, type=float)
+    if value is None:
+        return default
+    return now + value if value < 0 else value
+
+@app.route('/api/history')
+def api_history():
+    """Downsampled status history: ?from=&to= (unix time, or negative = seconds ago), step=<seconds>"""
+    now = time.time()
+    start = _history_bound('from', now - 86400, now)
+    end = _history_bound('to', now, now)
+    if end <= start:
+        return jsonify({'success': False, 'error': '`to` must be after `from`'}), 400
+    records = history.range(start, end)
+    # Never return more than HISTORY_MAX_POINTS buckets, whatever step was asked for; an early
+    # `from` (0 for everything) only stretches the buckets as far as the oldest stored record
+    span = end - max(start, records[0].time) if records else end - start
+    step = max(request.args.get('step', 0, type=float), HISTORY_INTERVAL, span / HISTORY_MAX_POINTS)
+    return jsonify({
+        'from': start,
+        'to': end,
+        'step': step,
+        'interval': HISTORY_INTERVAL,
+        'stored': len(history),
+        'capacity': history.capacity,
+        'error': history.error,
+        'points': downsample(records, start, step)
+    })
+
+@app.route('/api/jobs')
+def api_jobs():
+    """List recent control jobs"""
+    return jsonify({'jobs': job_runner.recent()})
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    """Progress and outcome of one control job"""
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+def render_metrics():
+    """Prometheus exposition built from cached samples only (no probes run per scrape)"""
+    snapshot = status_sampler.snapshot()
+    now = time.time()
+    vpn = snapshot.get('vpn')
+    vpn_status = vpn.value if vpn else {}
+    stats = vpn_status.get('stats') or {}
+    interface = vpn_status.get('interface', VPN_INTERFACE)
+    lines = []
+    lines += render_gauge('openconnect_tunnel_up', 'Whether the tunnel interface has an address',
+                          [({'interface': interface}, int(vpn_connected(snapshot)))])
+    for counter in ('rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets', 'rx_errors', 'tx_errors'):
+        if counter in stats:
+            lines += render_gauge(f'openconnect_tunnel_{counter}_total', f'Tunnel {counter.replace("_", " ")} from sysfs',
+                                  [({'interface': interface}, stats[counter])], kind='counter')
+    health = snapshot.get('health')
+    if health is not None and health.value.get('state') not in (None, 'disabled'):
+        info = health.value
+        lines += render_gauge('openconnect_tunnel_health', 'Watchdog verdict on the tunnel (1 = current)',
+                              [({'interface': interface, 'state': info['state']}, 1)])
+        for key, name, help_text in (('rtt_ms', 'rtt_seconds', 'Last probe round trip through the tunnel'),
+                                     ('jitter_ms', 'jitter_seconds', 'Mean RTT change between probes')):
+            if info.get(key) is not None:
+                lines += render_gauge(f'openconnect_tunnel_{name}', help_text,
+                                      [({'interface': interface}, round(info[key] / 1000.0, 6))])
+        if info.get('loss') is not None:
+            lines += render_gauge('openconnect_tunnel_loss_ratio', 'Lost probes in the watchdog window',
+                                  [({'interface': interface}, info['loss'])])
+    resolver = snapshot.get('resolver')
+    if resolver is not None:
+        servers = resolver.value.get('servers', [])
+        lines += render_gauge('dns_upstream_rtt_seconds', 'Last query latency per upstream nameserver',
+                              [({'server': info['server']}, round(info['rtt_ms'] / 1000.0, 6))
+                               for info in servers if info['rtt_ms'] is not None])
+        lines += render_gauge('dns_upstream_loss_ratio', 'Unanswered probe queries per upstream nameserver',
+                              [({'server': info['server']}, info['loss']) for info in servers if info['loss'] is not None])
+        cache = resolver.value.get('cache')
+        if cache is not None:
+            for key in ('hits', 'misses', 'expired', 'evicted', 'upstream_failures'):
+                lines += render_gauge(f'dns_cache_{key}_total', f'DNS cache {key.replace("_", " ")}',
+                                      [({}, cache[key])], kind='counter')
+            lines += render_gauge('dns_cache_entries', 'Replies held in the DNS cache', [({}, cache['size'])])
+    since = vpn_session['connected_since']
+    lines += render_gauge('openconnect_session_seconds', 'Age of the current VPN session (0 when down)',
+                          [({}, round(now - since, 3) if since else 0)])
+    process = snapshot.get('supervisor')
+    if process is not None and process.value.get('available'):
+        info = process.value
+        lines += render_gauge('openconnect_supervisor_process_state', 'supervisord state of the VPN program (1 = current)',
+                              [({'program': info['name'], 'state': info['state']}, 1)])
+        uptime = now - info['start'] if info['state'] == 'RUNNING' and info['start'] else 0
+        lines += render_gauge('openconnect_supervisor_process_uptime_seconds', 'Uptime of the VPN program',
+                              [({'program': info['name']}, round(uptime, 3))])
+    guac = snapshot.get('guacamole')
+    if guac is not None:
+        lines += render_gauge('guacamole_up', 'Whether Guacamole answered the last probe',
+                              [({'port': guac.value.get('port')}, int(bool(guac.value.get('available'))))])
+    lines += render_gauge('openconnect_status_sample_age_seconds', 'Age of each cached status probe',
+                          [({'probe': name}, sample_age(sample, now)) for name, sample in snapshot.items()])
+    for metric in (VPN_TRANSITIONS, VPN_RECONNECTS, VPN_TIME_TO_CONNECT, VPN_CONNECT_PHASE, VPN_SESSION_DURATION,
+                   GUAC_PROBE_LATENCY, HTTP_REQUESTS, HTTP_REQUEST_DURATION):
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+DASHBOARD_CSS = '''
+body { font-family: Arial, sans-serif; margin: 20px; background: #f5f5f5; }
+.container { max-width: 1400px; margin: 0 auto; }
+.dashboard { display: grid; grid-template-columns: 1fr 1fr 1fr; gap: 20px; }
+.panel { background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+.panel-full { grid-column: 1 / -1; }
+.status { font-size: 18px; font-weight: bold; padding: 10px; border-radius: 4px; margin: 10px 0; }
+.connected { background: #d4edda; color: #155724; }
+.disconnected { background: #f8d7da; color: #721c24; }
+.degraded { background: #fff3cd; color: #856404; }
+button { padding: 10px 20px; margin: 5px; border: none; border-radius: 4px; cursor: pointer; font-size: 14px; }
+.btn-connect { background: #28a745; color: white; }
+.btn-connect:hover { background: #218838; }
+.btn-disconnect { background: #dc3545; color: white; }
+.btn-disconnect:hover { background: #c82333; }
+.btn-reconnect { background: #007bff; color: white; }
+.btn-reconnect:hover { background: #0056b3; }
+.info { background: #e7f3ff; padding: 10px; margin: 10px 0; border-left: 4px solid #007bff; }
+.logs { background: #f8f9fa; padding: 10px; border: 1px solid #dee2e6; border-radius: 4px; font-family: monospace; font-size: 12px; max-height: 400px; overflow-y: auto; white-space: pre-wrap; word-wrap: break-word; line-height: 1.4; }
+.settings { background: #fff3cd; padding: 10px; margin: 10px 0; border-left: 4px solid #ffc107; font-size: 13px; }
+.setting-row { display: flex; justify-content: space-between; padding: 5px 0; border-bottom: 1px solid #e0e0e0; }
+.setting-row:last-child { border-bottom: none; }
+.setting-key { font-weight: bold; color: #555; }
+.setting-value { color: #333; word-break: break-all; }
+.history-chart { width: 100%; height: 160px; background: #f8f9fa; border: 1px solid #dee2e6; border-radius: 4px; }
+.history-legend { font-size: 12px; color: #555; margin-top: 5px; }
+h2 { color: #333; border-bottom: 2px solid #007bff; padding-bottom: 10px; }
+a { color: #007bff; text-decoration: none; }
+a:hover { text-decoration: underline; }
+'''
+
+DASHBOARD_JS = '''
+let statusWaiters = [];
+let jobWaiters = [];
+let statusPoll = null;
+const STREAM_RETRY_MS = 30000;
+
+function renderStatus(data) {
+    const statusEl = document.getElementById('vpn-status');
+    const infoEl = document.getElementById('vpn-info');
+
+    if (data.vpn.connected) {
+        const degraded = data.vpn.state === 'degraded';
+        statusEl.textContent = degraded ? '⚠️ Status: Degraded' : '✅ Status: Connected';
+        statusEl.className = degraded ? 'status degraded' : 'status connected';
+        infoEl.innerHTML = `<strong>VPN IP:</strong> ${data.vpn.ip}<br><strong>DNS:</strong> ${data.vpn.dns.join(', ')}` +
+            `<br><strong>RTT:</strong> <span id="vpn-rtt">${formatHealth(data.vpn.health)}</span>`;
+    } else {
+        statusEl.textContent = '❌ Status: Disconnected';
+        statusEl.className = 'status disconnected';
+        infoEl.innerHTML = 'VPN is not connected';
+    }
+
+    // Update Guacamole status
+    updateGuacamoleStatus(data.guacamole);
+
+    // Resolve anyone awaiting a transition
+    statusWaiters = statusWaiters.filter(waiter => !waiter(data));
+}
+
+function formatHealth(health) {
+    if (!health || health.rtt_ms == null) {
+        return health && health.state === 'disabled' ? 'not monitored' : 'n/a';
+    }
+    const loss = health.loss ? `, ${Math.round(health.loss * 100)}% loss` : '';
+    return `${health.rtt_ms} ms${loss}`;
+}
+
+function updateStatus() {
+    fetch('/api/status')
+        .then(r => r.json())
+        .then(renderStatus);
+}
+
+function waitForStatus(predicate, timeoutMs) {
+    // Resolves true when a status event matches, false on timeout
+    return new Promise(resolve => {
+        const timer = setTimeout(() => {
+            statusWaiters = statusWaiters.filter(w => w !== waiter);
+            resolve(false);
+        }, timeoutMs);
+        const waiter = data => {
+            if (!predicate(data)) {
+                return false;
+            }
+            clearTimeout(timer);
+            resolve(true);
+            return true;
+        };
+        statusWaiters.push(waiter);
+    });
+}
+
+function startStatusStream() {
+    // Status changes are pushed by the server; poll slowly only without EventSource
+    if (!window.EventSource) {
+        updateStatus();
+        setInterval(updateStatus, 5000);
+        return;
+    }
+    const source = new EventSource('/api/events');
+    source.addEventListener('open', () => {
+        clearInterval(statusPoll);
+        statusPoll = null;
+    });
+    source.addEventListener('error', () => {
+        // Refused (503 once the server is at SSE_MAX_CLIENTS): poll until a retry gets a stream
+        if (source.readyState === EventSource.CLOSED) {
+            if (!statusPoll) {
+                updateStatus();
+                statusPoll = setInterval(updateStatus, 5000);
+            }
+            setTimeout(startStatusStream, STREAM_RETRY_MS);
+        }
+    });
+    source.addEventListener('status', e => renderStatus(JSON.parse(e.data)));
+    source.addEventListener('health', e => {
+        const rttEl = document.getElementById('vpn-rtt');
+        if (rttEl) {
+            rttEl.textContent = formatHealth(JSON.parse(e.data));
+        }
+    });
+    source.addEventListener('job', e => {
+        const job = JSON.parse(e.data);
+        jobWaiters = jobWaiters.filter(waiter => !waiter(job));
+    });
+}
+
+function waitForJob(jobId) {
+    // Resolves with the control job once it has succeeded or failed
+    return new Promise(resolve => {
+        jobWaiters.push(job => {
+            if (job.id !== jobId || (job.state !== 'succeeded' && job.state !== 'failed')) {
+                return false;
+            }
+            resolve(job);
+            return true;
+        });
+    });
+}
+
+function updateGuacamoleStatus(guacStatus) {
+    const statusEl = document.getElementById('guac-status');
+    const infoEl = document.getElementById('guac-info');
+
+    if (guacStatus.available) {
+        statusEl.textContent = `✅ Status: Running (Port ${guacStatus.port})`;
+        statusEl.className = 'status connected';
+        infoEl.innerHTML = `<strong>Status:</strong> Running<br><strong>Port:</strong> ${guacStatus.port}`;
+    } else {
+        statusEl.textContent = `❌ Status: ${guacStatus.status} (Port ${guacStatus.port})`;
+        statusEl.className = 'status disconnected';
+        infoEl.innerHTML = `<strong>Status:</strong> ${guacStatus.status}<br><strong>Port:</strong> ${guacStatus.port}`;
+    }
+}
+
+function connect() {
+    const btn = event.target;
+    const originalText = btn.textContent;
+    btn.textContent = 'Connecting...';
+    btn.disabled = true;
+
+    fetch('/api/connect', { method: 'POST' })
+        .then(r => r.json())
+        .then(data => {
+            if (!data.success) {
+                console.error('VPN connection error:', data.error);
+                return;
+            }
+            // The job runs server-side; wait for the pushed transition or a job failure
+            return Promise.race([
+                waitForStatus(status => status.vpn.connected, 60000),
+                waitForJob(data.job_id)
+            ]);
+        })
+        .then(outcome => {
+            if (outcome && outcome.state === 'failed') {
+                console.error('VPN connection error:', outcome.error);
+            } else if (outcome === false || (outcome && !outcome.superseded_by && !outcome.result.connected)) {
+                console.log('Connection timeout - check VPN credentials');
+            }
+        })
+        .catch(err => {
+            console.error('Connection request failed:', err);
+        })
+        .finally(() => {
+            btn.textContent = originalText;
+            btn.disabled = false;
+        });
+}
+
+function disconnect() {
+    if (confirm('Stop VPN connection?')) {
+        fetch('/api/disconnect', { method: 'POST' })
+            .then(r => r.json())
+            .then(data => {
+                alert(data.message || data.error);
+            });
+    }
+}
 
-                <!-- Guacamole Panel -->
-                <div class="panel">
-                    <h2>Guacamole</h2>
-                    <div id="guac-status" class="status disconnected">Status: Checking...</div>
-                    <div id="guac-info" class="info"></div>
-                    <p>
-                        <a id="guac-link" href="#" target="_blank">
-                            Open Guacamole →
-                        </a>
-                    </p>
+function reconnect() {
+    fetch('/api/reconnect', { method: 'POST' })
+        .then(r => r.json())
+        .then(data => {
+            alert(data.message || data.error);
+        });
+}
+
+const MAX_LOG_LINES = 500;
+let logLines = [];
+
+function renderLogs() {
+    const logsEl = document.getElementById('logs');
+    const atBottom = logsEl.scrollTop + logsEl.clientHeight >= logsEl.scrollHeight - 5;
+    logsEl.textContent = logLines.length ? logLines.join('\\n') : 'No logs available yet. Start VPN connection to generate logs.';
+    if (atBottom) {
+        logsEl.scrollTop = logsEl.scrollHeight;
+    }
+}
+
+function refreshLogs() {
+    fetch('/api/logs?lines=50')
+        .then(r => r.json())
+        .then(data => {
+            logLines = data.logs.split('\\n');
+            document.getElementById('logs').textContent = data.logs;
+        });
+}
+
+function startLogStream() {
+    // Fall back to a one-off fetch where EventSource is unavailable
+    if (!window.EventSource) {
+        refreshLogs();
+        return;
+    }
+    logLines = [];
+    const source = new EventSource('/api/logs/stream?backlog=50');
+    source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED) {
+            refreshLogs();
+            setTimeout(startLogStream, STREAM_RETRY_MS);
+        }
+    });
+    source.addEventListener('log', e => {
+        logLines.push(JSON.parse(e.data).line);
+        if (logLines.length > MAX_LOG_LINES) {
+            logLines.splice(0, logLines.length - MAX_LOG_LINES);
+        }
+        renderLogs();
+    });
+}
+
+function loadSettings() {
+    fetch('/api/settings')
+        .then(r => r.json())
+        .then(data => {
+            document.getElementById('setting-user').textContent = data.user || 'N/A';
+            document.getElementById('setting-server').textContent = data.server || 'N/A';
+            document.getElementById('setting-authgroup').textContent = data.authgroup || 'N/A';
+            document.getElementById('setting-duo').textContent = data.duo_method || 'N/A';
+            document.getElementById('setting-dns').textContent = data.dns_servers || 'N/A';
+        })
+        .catch(err => {
+            console.error('Failed to load settings:', err);
+            document.getElementById('setting-user').textContent = 'Error loading settings';
+        });
+}
+
+function setGuacamoleLink() {
+    // Set Guacamole link to use the current host instead of localhost
+    const host = window.location.hostname;
+    const guacLink = document.getElementById('guac-link');
+    guacLink.href = `http://${host}:8080/guacamole/`;
+}
+
+function formatRate(bps) {
+    if (bps >= 1048576) return `${(bps / 1048576).toFixed(1)} MB/s`;
+    if (bps >= 1024) return `${(bps / 1024).toFixed(1)} kB/s`;
+    return `${Math.round(bps)} B/s`;
+}
+
+function renderHistory(data) {
+    // Server-side buckets: one uptime bar per bucket, RTT and throughput as lines
+    const svg = document.getElementById('history-chart');
+    const width = 1000, height = 160, strip = 12;
+    const x = t => ((t - data.from) / (data.to - data.from)) * width;
+    const barWidth = Math.max(1, (data.step / (data.to - data.from)) * width);
+    const maxRtt = Math.max(1, ...data.points.map(p => p.rtt_ms ? p.rtt_ms.max : 0));
+    const maxRate = Math.max(1, ...data.points.map(p => Math.max(p.rx_bps ? p.rx_bps.max : 0, p.tx_bps ? p.tx_bps.max : 0)));
+    const line = (value, max, color) => {
+        const coords = data.points.filter(p => value(p) != null)
+            .map(p => `${x(p.t + data.step / 2).toFixed(1)},${(height - (value(p) / max) * (height - strip - 8)).toFixed(1)}`);
+        return coords.length ? `<polyline fill="none" stroke="${color}" stroke-width="1.5" points="${coords.join(' ')}"/>` : '';
+    };
+    const bars = data.points.map(p => {
+        const color = p.uptime === 0 ? '#dc3545' : (p.degraded > 0 || p.uptime < 1 ? '#ffc107' : '#28a745');
+        return `<rect x="${x(p.t).toFixed(1)}" y="0" width="${barWidth.toFixed(1)}" height="${strip}" fill="${color}"/>`;
+    }).join('');
+    svg.innerHTML = bars +
+        line(p => p.rx_bps && p.rx_bps.avg, maxRate, '#007bff') +
+        line(p => p.tx_bps && p.tx_bps.avg, maxRate, '#6f42c1') +
+        line(p => p.rtt_ms && p.rtt_ms.avg, maxRtt, '#fd7e14');
+    const reconnects = data.points.reduce((sum, p) => sum + p.reconnects, 0);
+    const samples = data.points.reduce((sum, p) => sum + p.samples, 0);
+    const uptime = samples ? data.points.reduce((sum, p) => sum + p.uptime * p.samples, 0) / samples : 0;
+    document.getElementById('history-summary').textContent = samples
+        ? `Uptime ${(uptime * 100).toFixed(1)}% · ${reconnects} reconnect(s) · peak RTT ${maxRtt.toFixed(0)} ms · peak throughput ${formatRate(maxRate)}`
+        : 'No history recorded yet';
+}
+
+function loadHistory() {
+    fetch('/api/history?from=-86400&step=300')
+        .then(r => r.json())
+        .then(renderHistory)
+        .catch(err => console.error('Failed to load history:', err));
+}
+
+// Status and logs are pushed over Server-Sent Events
+startStatusStream();
+startLogStream();
+loadSettings();
+setGuacamoleLink();
+loadHistory();
+setInterval(loadHistory, 300000);
+'''
+
+DASHBOARD_HTML = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>OpenConnect VPN + Guacamole</title>
+    <link rel="stylesheet" href="{{CSS_URL}}">
+</head>
+<body>
+    <div class="container">
+        <h1>🔒 OpenConnect VPN + Guacamole Dashboard</h1>
+
+        <div class="dashboard">
+            <!-- VPN Panel -->
+            <div class="panel">
+                <h2>VPN Connection</h2>
+                <div id="vpn-status" class="status disconnected">Status: Checking...</div>
+                <div id="vpn-info" class="info"></div>
+                <div>
+                    <button class="btn-connect" onclick="connect()">Connect</button>
+                    <button class="btn-disconnect" onclick="disconnect()">Disconnect</button>
+                    <button class="btn-reconnect" onclick="reconnect()">Reconnect</button>
                 </div>
+            </div>
+
+            <!-- Guacamole Panel -->
+            <div class="panel">
+                <h2>Guacamole</h2>
+                <div id="guac-status" class="status disconnected">Status: Checking...</div>
+                <div id="guac-info" class="info"></div>
+                <p>
+                    <a id="guac-link" href="#" target="_blank">
+                        Open Guacamole →
+                    </a>
+                </p>
+            </div>
 
-                <div class="panel">
-                    <h2>VPN Settings</h2>
-                    <div id="vpn-settings" class="settings">
-                        <div class="setting-row">
-                            <span class="setting-key">Username:</span>
-                            <span class="setting-value" id="setting-user">Loading...</span>
-                        </div>
-                        <div class="setting-row">
-                            <span class="setting-key">Server:</span>
-                            <span class="setting-value" id="setting-server">Loading...</span>
-                        </div>
-                        <div class="setting-row">
-                            <span class="setting-key">Auth Group:</span>
-                            <span class="setting-value" id="setting-authgroup">Loading...</span>
-                        </div>
-                        <div class="setting-row">
-                            <span class="setting-key">Duo Method:</span>
-                            <span class="setting-value" id="setting-duo">Loading...</span>
-                        </div>
-                        <div class="setting-row">
-                            <span class="setting-key">DNS Servers:</span>
-                            <span class="setting-value" id="setting-dns">Loading...</span>
-                        </div>
+            <div class="panel">
+                <h2>VPN Settings</h2>
+                <div id="vpn-settings" class="settings">
+                    <div class="setting-row">
+                        <span class="setting-key">Username:</span>
+                        <span class="setting-value" id="setting-user">Loading...</span>
+                    </div>
+                    <div class="setting-row">
+                        <span class="setting-key">Server:</span>
+                        <span class="setting-value" id="setting-server">Loading...</span>
+                    </div>
+                    <div class="setting-row">
+                        <span class="setting-key">Auth Group:</span>
+                        <span class="setting-value" id="setting-authgroup">Loading...</span>
+                    </div>
+                    <div class="setting-row">
+                        <span class="setting-key">Duo Method:</span>
+                        <span class="setting-value" id="setting-duo">Loading...</span>
+                    </div>
+                    <div class="setting-row">
+                        <span class="setting-key">DNS Servers:</span>
+                        <span class="setting-value" id="setting-dns">Loading...</span>
                     </div>
                 </div>
             </div>
+        </div>
 
-            <!-- Logs Panel -->
-            <div class="panel panel-full" style="margin-top: 20px;">
-                <h2>Recent Logs</h2>
-                <div id="logs" class="logs">Loading logs...</div>
-                <button onclick="refreshLogs()" style="margin-top: 10px;">Refresh Logs</button>
+        <!-- History Panel -->
+        <div class="panel panel-full" style="margin-top: 20px;">
+            <h2>Last 24 Hours</h2>
+            <svg id="history-chart" class="history-chart" viewBox="0 0 1000 160" preserveAspectRatio="none"></svg>
+            <div class="history-legend">
+                <span style="color: #28a745;">■ up</span> <span style="color: #ffc107;">■ degraded/flapping</span>
+                <span style="color: #dc3545;">■ down</span> <span style="color: #007bff;">― rx</span>
+                <span style="color: #6f42c1;">― tx</span> <span style="color: #fd7e14;">― RTT</span>
             </div>
+            <div id="history-summary" class="info">Loading history...</div>
         </div>
 
-        <script>
-            function updateStatus() {
-                fetch('/api/status')
-                    .then(r => r.json())
-                    .then(data => {
-                        const statusEl = document.getElementById('vpn-status');
-                        const infoEl = document.getElementById('vpn-info');
-                        
-                        if (data.vpn.connected) {
-                            statusEl.textContent = '✅ Status: Connected';
-                            statusEl.className = 'status connected';
-                            infoEl.innerHTML = `<strong>VPN IP:</strong> ${data.vpn.ip}<br><strong>DNS:</strong> ${data.vpn.dns.join(', ')}`;
-                        } else {
-                            statusEl.textContent = '❌ Status: Disconnected';
-                            statusEl.className = 'status disconnected';
-                            infoEl.innerHTML = 'VPN is not connected';
-                        }
-                        
-                        // Update Guacamole status
-                        updateGuacamoleStatus(data.guacamole);
-                    });
-            }
-            
-            function updateGuacamoleStatus(guacStatus) {
-                const statusEl = document.getElementById('guac-status');
-                const infoEl = document.getElementById('guac-info');
-                
-                if (guacStatus.available) {
-                    statusEl.textContent = `✅ Status: Running (Port ${guacStatus.port})`;
-                    statusEl.className = 'status connected';
-                    infoEl.innerHTML = `<strong>Status:</strong> Running<br><strong>Port:</strong> ${guacStatus.port}`;
-                } else {
-                    statusEl.textContent = `❌ Status: ${guacStatus.status} (Port ${guacStatus.port})`;
-                    statusEl.className = 'status disconnected';
-                    infoEl.innerHTML = `<strong>Status:</strong> ${guacStatus.status}<br><strong>Port:</strong> ${guacStatus.port}`;
-                }
-            }
+        <!-- Logs Panel -->
+        <div class="panel panel-full" style="margin-top: 20px;">
+            <h2>Recent Logs</h2>
+            <div id="logs" class="logs">Loading logs...</div>
+            <button onclick="refreshLogs()" style="margin-top: 10px;">Refresh Logs</button>
+        </div>
+    </div>
 
-            function connect() {
-                const btn = event.target;
-                const originalText = btn.textContent;
-                btn.textContent = 'Connecting...';
-                btn.disabled = true;
-                
-                fetch('/api/connect', { method: 'POST' })
-                    .then(r => r.json())
-                    .then(data => {
-                        // Don't show alert, just poll for status
-                        if (!data.success) {
-                            console.error('VPN connection error:', data.error);
-                        }
-                        // Poll more frequently while connecting
-                        pollForConnection(btn, originalText);
-                    })
-                    .catch(err => {
-                        console.error('Connection request failed:', err);
-                        btn.textContent = originalText;
-                        btn.disabled = false;
-                    });
-            }
-            
-            function pollForConnection(btn, originalText) {
-                let attempts = 0;
-                const maxAttempts = 60; // Try for up to 60 seconds
-                
-                const pollInterval = setInterval(() => {
-                    fetch('/api/status')
-                        .then(r => r.json())
-                        .then(data => {
-                            if (data.connected) {
-                                clearInterval(pollInterval);
-                                btn.textContent = originalText;
-                                btn.disabled = false;
-                                updateStatus(); // Update UI immediately
-                            } else {
-                                attempts++;
-                                if (attempts >= maxAttempts) {
-                                    clearInterval(pollInterval);
-                                    btn.textContent = originalText;
-                                    btn.disabled = false;
-                                    console.log('Connection timeout - check VPN credentials');
-                                }
-                            }
-                        });
-                }, 500); // Check every 500ms
-            }
+    <script src="{{JS_URL}}"></script>
+</body>
+</html>
+'''
 
-            function disconnect() {
-                if (confirm('Stop VPN connection?')) {
-                    fetch('/api/disconnect', { method: 'POST' })
-                        .then(r => r.json())
-                        .then(data => {
-                            alert(data.message || data.error);
-                            updateStatus();
-                        });
-                }
-            }
+class StaticAsset:
+    """A dashboard asset hashed and compressed once, by start_background
 
-            function reconnect() {
-                fetch('/api/reconnect', { method: 'POST' })
-                    .then(r => r.json())
-                    .then(data => {
-                        alert(data.message || data.error);
-                        setTimeout(updateStatus, 2000);
-                    });
-            }
+    Served under a content-hashed URL so browsers can cache it forever; the
+    strong ETag differs per encoding as required for compressed variants.
+    """
 
-            function refreshLogs() {
-                fetch('/api/logs?lines=50')
-                    .then(r => r.json())
-                    .then(data => {
-                        document.getElementById('logs').textContent = data.logs;
-                    });
-            }
+    def __init__(self, name, body, content_type, compressors):
+        self.name = name
+        self.content_type = content_type
+        self.body = body.encode('utf-8')
+        self.digest = hashlib.sha256(self.body).hexdigest()[:16]
+        self.encodings = {'identity': self.body}
+        for encoding, compress in compressors.items():
+            self.encodings[encoding] = compress(self.body)
 
-            function loadSettings() {
-                fetch('/api/settings')
-                    .then(r => r.json())
-                    .then(data => {
-                        document.getElementById('setting-user').textContent = data.user || 'N/A';
-                        document.getElementById('setting-server').textContent = data.server || 'N/A';
-                        document.getElementById('setting-authgroup').textContent = data.authgroup || 'N/A';
-                        document.getElementById('setting-duo').textContent = data.duo_method || 'N/A';
-                        document.getElementById('setting-dns').textContent = data.dns_servers || 'N/A';
-                    })
-                    .catch(err => {
-                        console.error('Failed to load settings:', err);
-                        document.getElementById('setting-user').textContent = 'Error loading settings';
-                    });
-            }
+    @property
+    def url(self):
+        base, _, ext = self.name.rpartition('.')
+        return f'/assets/{base}.{self.digest}.{ext}'
 
-            function setGuacamoleLink() {
-                // Set Guacamole link to use the current host instead of localhost
-                const host = window.location.hostname;
-                const guacLink = document.getElementById('guac-link');
-                guacLink.href = `http://${host}:8080/guacamole/`;
-            }
+    def _negotiate(self):
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encodings and request.accept_encodings[encoding] > 0:
+                return encoding
+        return 'identity'
 
-            // Update status every 5 seconds
-            updateStatus();
-            refreshLogs();
-            loadSettings();
-            setGuacamoleLink();
-            setInterval(updateStatus, 5000);
-        </script>
-    </body>
-    </html>
-    '''
+    def response(self, cache_control):
+        encoding = self._negotiate()
+        etag = self.digest if encoding == 'identity' else f'{self.digest}-{encoding}'
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(self.encodings[encoding], content_type=self.content_type)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
 
-if __name__ == '__main__':
-    # Install flask if not present
+def build_dashboard_assets():
+    """Hash and compress the dashboard CSS/JS, then the HTML that references them"""
+    import gzip
+    compressors = {'gzip': lambda body: gzip.compress(body, 9, mtime=0)}
     try:
-        import flask
+        import brotli  # optional: adds a `br` encoding
+        compressors['br'] = brotli.compress
     except ImportError:
-        subprocess.run(['pip3', 'install', 'flask'], check=True)
-    
-    app.run(host='0.0.0.0', port=9000)
+        pass
+    css = StaticAsset('dashboard.css', DASHBOARD_CSS, 'text/css; charset=utf-8', compressors)
+    js = StaticAsset('dashboard.js', DASHBOARD_JS, 'application/javascript; charset=utf-8', compressors)
+    html = DASHBOARD_HTML.replace('{{CSS_URL}}', css.url).replace('{{JS_URL}}', js.url)
+    page = StaticAsset('dashboard.html', html, 'text/html; charset=utf-8', compressors)
+    return page, {asset.url: asset for asset in (css, js)}
+
+@lru_cache(maxsize=None)
+def dashboard_assets():
+    """(page, assets); start_background builds them so no request pays for max-level compression"""
+    return build_dashboard_assets()
+
+def _stable_payload(value):
+    """Drop fields that change on every read (sample ages, timestamps) and bucket measurements before hashing"""
+    if isinstance(value, dict):
+        return {k: (round(v / API_ETAG_BUCKETS[k]) if k in API_ETAG_BUCKETS and isinstance(v, (int, float))
+                    else _stable_payload(v))
+                for k, v in value.items() if k not in API_VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_stable_payload(v) for v in value]
+    return value
+
+def conditional_json(payload):
+    """jsonify() with a weak ETag over the non-volatile part of the payload
+
+    Repeat polls that see no state change get a 304 from the after_request hook.
+    """
+    response = jsonify(payload)
+    stable = json.dumps(_stable_payload(payload), sort_keys=True, default=str)
+    response.set_etag(hashlib.sha1(stable.encode('utf-8')).hexdigest(), weak=True)
+    return response
+
+@app.after_request
+def _conditional_api_response(response):
+    """Give every JSON GET response an ETag and answer If-None-Match with 304"""
+    if (request.method in ('GET', 'HEAD') and response.status_code == 200
+            and response.mimetype == 'application/json' and not response.is_streamed):
+        if 'ETag' not in response.headers:
+            response.add_etag(weak=True)
+        response.headers.setdefault('Cache-Control', 'no-cache')
+        response.make_conditional(request)
+    return response
+
+@app.route('/dashboard')
+def dashboard():
+    """Web dashboard (HTML)"""
+    page, _ = dashboard_assets()
+    return page.response('no-cache')
+
+@app.route('/assets/<filename>')
+def dashboard_asset(filename):
+    """Versioned dashboard CSS/JS"""
+    _, assets = dashboard_assets()
+    asset = assets.get(f'/assets/{filename}')
+    if asset is None:
+        return jsonify({'success': False, 'error': 'Unknown asset'}), 404
+    return asset.response(f'public, max-age={ASSET_MAX_AGE}, immutable')
+
+_shutdown_lock = threading.Lock()
+_shutdown_done = False
+
+def shutdown_background():
+    """Stop background samplers, followers and executors (safe to call more than once)"""
+    global _shutdown_done
+    with _shutdown_lock:
+        if _shutdown_done:
+            return
+        _shutdown_done = True
+    status_sampler.stop()
+    log_follower.stop()
+    tunnel_watchdog.stop()
+    resolver_monitor.stop()
+    if dns_forwarder is not None:
+        dns_forwarder.stop()
+    job_runner.shutdown()
+    guacamole_prober.close()
+    history.close()
+
+def start_background():
+    """Start sampling (and log following, for connect timelines) right away instead of on the first request"""
+    status_sampler.start()
+    log_follower.start()
+    started = time.perf_counter()
+    dashboard_assets()
+    STARTUP_TIMING['assets_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    print(f"openconnect-web: imports {STARTUP_TIMING['imports_ms']} ms, "
+          f"init {STARTUP_TIMING['init_ms']} ms, assets {STARTUP_TIMING['assets_ms']} ms", flush=True)
+
+def _serve_gunicorn():
+    from gunicorn.app.base import BaseApplication
+
+    class EmbeddedGunicorn(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{WEB_HOST}:{WEB_PORT}')
+            self.cfg.set('workers', 1)
+            self.cfg.set('threads', WEB_THREADS)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('graceful_timeout', WEB_GRACEFUL_TIMEOUT)
+            self.cfg.set('keepalive', 5)
+            self.cfg.set('post_worker_init', lambda worker: start_background())
+            self.cfg.set('worker_exit', lambda server, worker: shutdown_background())
+
+        def load(self):
+            return app
+
+    EmbeddedGunicorn().run()
+
+def _serve_waitress():
+    from waitress import serve as waitress_serve
+    waitress_serve(app, host=WEB_HOST, port=WEB_PORT, threads=WEB_THREADS)
+
+def serve():
+    """Run the web UI with the server selected by WEB_SERVER"""
+    workers = os.environ.get('WEB_WORKERS', '1')
+    if workers != '1':
+        # The sampler, job queue, event streams, watchdog, DNS forwarder and
+        # history ring live in this process; a second worker could not see them
+        sys.exit(f'WEB_WORKERS={workers} is not supported: the web UI runs as one process, raise WEB_THREADS instead')
+    atexit.register(shutdown_background)
+    # Turn SIGTERM from supervisord into a normal exit so atexit hooks run
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    servers = {'gunicorn': _serve_gunicorn, 'waitress': _serve_waitress}
+    if WEB_SERVER != 'gunicorn':
+        start_background()
+    if WEB_SERVER in servers:
+        try:
+            servers[WEB_SERVER]()
+            return
+        except ImportError:
+            print(f'{WEB_SERVER} is not installed; falling back to the Flask development server', flush=True)
+    app.run(host=WEB_HOST, port=WEB_PORT, threaded=True)
+
+STARTUP_TIMING['init_ms'] = round((time.perf_counter() - _import_started) * 1000, 1)
+
+if __name__ == '__main__':
+    serve()
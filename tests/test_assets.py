@@ -0,0 +1,154 @@
+"""Dashboard assets (hashed URLs, precompressed variants) and JSON ETags"""
+
+import gzip
+import re
+import unittest
+
+from .webapp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class DashboardAssetTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = web.app.test_client()
+        self.page, self.assets = web.dashboard_assets()
+
+    def test_assets_are_built_once(self):
+        self.assertIs(web.dashboard_assets()[0], self.page)
+
+    def test_page_references_hashed_urls(self):
+        html = self.page.body.decode()
+        self.assertEqual(len(self.assets), 2)
+        for url, asset in self.assets.items():
+            self.assertRegex(url, r'^/assets/dashboard\.[0-9a-f]{16}\.(css|js)$')
+            self.assertIn(f'"{url}"', html)
+            self.assertIn(asset.digest, url)
+        self.assertNotIn('{{', html)
+
+    def asset_url(self, ext):
+        return next(url for url in self.assets if url.endswith(ext))
+
+    def test_encoding_negotiation(self):
+        url = self.asset_url('.js')
+        asset = self.assets[url]
+        plain = self.client.get(url, headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(plain.status_code, 200)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.data, asset.body)
+        self.assertIn('immutable', plain.headers['Cache-Control'])
+        self.assertEqual(plain.headers['Vary'], 'Accept-Encoding')
+
+        zipped = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(zipped.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(zipped.data), asset.body)
+        self.assertNotEqual(zipped.headers['ETag'], plain.headers['ETag'])
+
+        refused = self.client.get(url, headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', refused.headers)
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_preferred(self):
+        url = self.asset_url('.css')
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.data), self.assets[url].body)
+
+    def test_etag_is_per_encoding(self):
+        url = self.asset_url('.css')
+        gzip_etag = self.client.get(url, headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        identity_etag = self.client.get(url, headers={'Accept-Encoding': 'identity'}).headers['ETag']
+
+        cached = self.client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzip_etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.data, b'')
+        self.assertEqual(cached.headers['ETag'], gzip_etag)
+
+        # An identity copy does not satisfy a client that now gets gzip, and vice versa
+        self.assertEqual(self.client.get(url, headers={'Accept-Encoding': 'gzip',
+                                                       'If-None-Match': identity_etag}).status_code, 200)
+        self.assertEqual(self.client.get(url, headers={'Accept-Encoding': 'identity',
+                                                       'If-None-Match': gzip_etag}).status_code, 200)
+
+    def test_dashboard_page(self):
+        response = self.client.get('/dashboard', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        html = gzip.decompress(response.data).decode()
+        for url in self.assets:
+            self.assertIn(url, html)
+        again = self.client.get('/dashboard', headers={'Accept-Encoding': 'gzip',
+                                                       'If-None-Match': response.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_unknown_asset(self):
+        stale = re.sub(r'\.[0-9a-f]{16}\.', '.0000000000000000.', self.asset_url('.js'))
+        self.assertEqual(self.client.get(stale).status_code, 404)
+
+
+class ConditionalJsonTests(unittest.TestCase):
+
+    def respond(self, payload, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        with web.app.test_request_context('/api/status', headers=headers):
+            return web._conditional_api_response(web.conditional_json(payload))
+
+    def test_volatile_keys_do_not_change_the_etag(self):
+        first = self.respond({'vpn': {'status': 'connected', 'age': 0.1}, 'timestamp': 1, 'health': {'last_round': 5}})
+        second = self.respond({'vpn': {'status': 'connected', 'age': 0.9}, 'timestamp': 2, 'health': {'last_round': 9}})
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+        self.assertTrue(first.headers['ETag'].startswith('W/'))
+        self.assertEqual(first.headers['Cache-Control'], 'no-cache')
+
+    def test_probe_jitter_does_not_change_the_etag(self):
+        def status(rtt, loss, state='ok'):
+            return {'vpn': {'rtt_ms': rtt, 'health': {'state': state, 'rtt_ms': rtt, 'avg_rtt_ms': rtt,
+                                                      'jitter_ms': 2.5, 'loss': loss, 'sent': 20}}}
+        etag = self.respond(status(41.2, 0.0)).headers['ETag']
+        self.assertEqual(self.respond(status(44.9, 0.01)).headers['ETag'], etag)
+        self.assertNotEqual(self.respond(status(140.0, 0.0)).headers['ETag'], etag)
+        self.assertNotEqual(self.respond(status(41.2, 0.3)).headers['ETag'], etag)
+        self.assertNotEqual(self.respond(status(41.2, 0.0, 'degraded')).headers['ETag'], etag)
+        self.assertNotEqual(self.respond(status(None, None)).headers['ETag'], etag)
+
+    def test_state_change_changes_the_etag(self):
+        up = self.respond({'vpn': {'status': 'connected'}, 'items': [1, 2]})
+        down = self.respond({'vpn': {'status': 'disconnected'}, 'items': [1, 2]})
+        reordered = self.respond({'vpn': {'status': 'connected'}, 'items': [2, 1]})
+        self.assertEqual(len({up.headers['ETag'], down.headers['ETag'], reordered.headers['ETag']}), 3)
+
+    def test_matching_etag_gets_304(self):
+        etag = self.respond({'status': 'connected', 'age': 1}).headers['ETag']
+        cached = self.respond({'status': 'connected', 'age': 3}, etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.respond({'status': 'disconnected'}, etag).status_code, 200)
+
+    def test_status_endpoint_round_trip(self):
+        client = web.app.test_client()
+        first = client.get('/api/status')
+        self.assertEqual(first.status_code, 200)
+        cached = client.get('/api/status', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.data, b'')
+
+    def test_plain_json_gets_a_content_etag(self):
+        with web.app.test_request_context('/api/anything', headers={}):
+            response = web._conditional_api_response(web.jsonify({'a': 1}))
+        etag = response.headers['ETag']
+        with web.app.test_request_context('/api/anything', headers={'If-None-Match': etag}):
+            self.assertEqual(web._conditional_api_response(web.jsonify({'a': 1})).status_code, 304)
+
+    def test_errors_and_posts_are_left_alone(self):
+        with web.app.test_request_context('/api/x', method='POST'):
+            self.assertNotIn('ETag', web._conditional_api_response(web.jsonify({'a': 1})).headers)
+        with web.app.test_request_context('/api/x'):
+            response = web.jsonify({'error': 'nope'})
+            response.status_code = 500
+            self.assertNotIn('ETag', web._conditional_api_response(response).headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
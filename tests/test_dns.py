@@ -0,0 +1,268 @@
+"""DNS message parsing, error replies and the forwarder's reply cache"""
+
+import socket
+import struct
+import threading
+import unittest
+
+from .webapp import web
+
+NOW = 1_000_000.0
+
+
+def name(text):
+    labels = [label.encode() for label in text.strip('.').split('.') if label]
+    return b''.join(bytes([len(label)]) + label for label in labels) + b'\x00'
+
+
+def header(txid=0x1234, flags=0x8180, qd=1, an=0, ns=0, ar=0):
+    return struct.pack('!HHHHHH', txid, flags, qd, an, ns, ar)
+
+
+def question(text='Example.COM', qtype=web.DNS_TYPE_A):
+    return name(text) + struct.pack('!HH', qtype, 1)
+
+
+def record(owner, rtype, ttl, rdata, rclass=1):
+    return owner + struct.pack('!HHIH', rtype, rclass, ttl, len(rdata)) + rdata
+
+
+def a_record(ttl, address=b'\x0a\x00\x00\x01'):
+    return record(b'\xc0\x0c', web.DNS_TYPE_A, ttl, address)  # compressed: points at the question name
+
+
+def soa_record(ttl, minimum):
+    rdata = b'\xc0\x0c' + name('hostmaster.example.com') + struct.pack('!IIIII', 1, 7200, 900, 86400, minimum)
+    return record(b'\xc0\x0c', web.DNS_TYPE_SOA, ttl, rdata)
+
+
+def opt_record(udp_size):
+    return record(b'\x00', web.DNS_TYPE_OPT, 0, b'', rclass=udp_size)
+
+
+def query(text='Example.COM', txid=0x1234, edns=None):
+    ar = [opt_record(edns)] if edns else []
+    return header(txid, 0x0100, 1, 0, 0, len(ar)) + question(text) + b''.join(ar)
+
+
+def answer(ttls=(300,), txid=0x1234, text='Example.COM', flags=0x8180):
+    return header(txid, flags, 1, len(ttls)) + question(text) + b''.join(a_record(ttl) for ttl in ttls)
+
+
+def negative(rcode=3, ttl=3600, minimum=60):
+    return header(flags=0x8180 | rcode, ns=1) + question() + soa_record(ttl, minimum)
+
+
+class ParseDnsMessageTests(unittest.TestCase):
+
+    def test_query(self):
+        message = web.parse_dns_message(query())
+        self.assertEqual(message.question, question())
+        self.assertEqual(message.key, question().lower())
+        self.assertEqual((message.rcode, message.truncated, message.ancount, message.ttls), (0, False, 0, []))
+        self.assertEqual(message.udp_size, web.DNS_MIN_UDP)
+
+    def test_compressed_answers_and_ttl_offsets(self):
+        reply = answer((300, 60))
+        message = web.parse_dns_message(reply)
+        self.assertEqual(message.ancount, 2)
+        self.assertEqual([ttl for _, ttl in message.ttls], [300, 60])
+        for offset, ttl in message.ttls:
+            self.assertEqual(struct.unpack_from('!I', reply, offset)[0], ttl)
+
+    def test_uncompressed_owner_names(self):
+        reply = header(an=1) + question() + record(name('example.com'), web.DNS_TYPE_A, 42, b'\x01\x02\x03\x04')
+        offset, ttl = web.parse_dns_message(reply).ttls[0]
+        self.assertEqual(ttl, 42)
+        self.assertEqual(struct.unpack_from('!I', reply, offset)[0], 42)
+
+    def test_soa_minimum_in_authority(self):
+        self.assertEqual(web.parse_dns_message(negative(ttl=3600, minimum=60)).soa_minimum, 60)
+        self.assertEqual(web.parse_dns_message(negative(ttl=20, minimum=60)).soa_minimum, 20)
+        # an SOA in the answer section is an answer, not a negative-caching hint
+        reply = header(an=1) + question(qtype=web.DNS_TYPE_SOA) + soa_record(3600, 60)
+        self.assertIsNone(web.parse_dns_message(reply).soa_minimum)
+
+    def test_edns_udp_size(self):
+        self.assertEqual(web.parse_dns_message(query(edns=4096)).udp_size, 4096)
+        self.assertEqual(web.parse_dns_message(query(edns=100)).udp_size, web.DNS_MIN_UDP)
+        self.assertEqual(web.parse_dns_message(query(edns=4096)).ttls, [])
+
+    def test_truncated_flag(self):
+        self.assertTrue(web.parse_dns_message(answer(flags=0x8180 | web.DNS_FLAG_TC)).truncated)
+
+    def test_malformed_input_raises_value_error(self):
+        reply = answer((300,))
+        bad = {
+            'empty': b'',
+            'short header': reply[:11],
+            'header only': header(),
+            'cut in question': reply[:15],
+            'cut in qtype': reply[:12 + len(name('Example.COM')) + 2],
+            'cut in record header': reply[:-10],
+            'cut in rdata': reply[:-1],
+            'label past end': header() + b'\x3fabc',
+            'missing records': header(an=3) + question(),
+            'short SOA': header(ns=1) + question() + record(b'\xc0\x0c', web.DNS_TYPE_SOA, 60, b'\x00\x00\x00\x05'),
+        }
+        for label, data in bad.items():
+            with self.subTest(label), self.assertRaises(ValueError):
+                web.parse_dns_message(data)
+
+
+class ReplyBuilderTests(unittest.TestCase):
+
+    def test_error_reply_keeps_id_and_question_case(self):
+        reply = web.dns_error_reply(query('MiXeD.Example.COM', txid=0xBEEF, edns=4096))
+        message = web.parse_dns_message(reply)
+        self.assertEqual(reply[:2], b'\xbe\xef')
+        self.assertEqual(message.question, question('MiXeD.Example.COM'))
+        self.assertEqual(message.rcode, 2)
+        flags, qd, an, ns, ar = struct.unpack_from('!HHHHH', reply, 2)
+        self.assertTrue(flags & 0x8000)   # QR
+        self.assertTrue(flags & 0x0100)   # RD copied from the query
+        self.assertEqual((qd, an, ns, ar), (1, 0, 0, 0))
+        self.assertEqual(web.parse_dns_message(web.dns_error_reply(query(), rcode=5)).rcode, 5)
+
+    def test_error_reply_rejects_garbage(self):
+        with self.assertRaises(ValueError):
+            web.dns_error_reply(b'\x12\x34\x01')
+
+    def test_truncated_reply(self):
+        reply = web.dns_truncated_reply(answer((300, 300, 300)))
+        message = web.parse_dns_message(reply)
+        self.assertTrue(message.truncated)
+        self.assertEqual((message.ancount, message.rcode, message.question), (0, 0, question()))
+        self.assertEqual(reply, header(flags=0x8180 | web.DNS_FLAG_TC) + question())
+
+
+class DnsCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = web.DnsCache(size=2, min_ttl=0, max_ttl=3600, negative_ttl=30)
+
+    def test_miss_then_hit_with_query_id_and_aged_ttls(self):
+        self.assertIsNone(self.cache.get(query(), NOW))
+        self.assertEqual(self.cache.put(answer((300, 120)), NOW), 120)
+        hit = self.cache.get(query(txid=0x4321), NOW + 50)
+        self.assertEqual(hit[:2], b'\x43\x21')
+        self.assertEqual([ttl for _, ttl in web.parse_dns_message(hit).ttls], [250, 70])
+        self.assertEqual((self.cache.stats['hits'], self.cache.stats['misses']), (1, 1))
+
+    def test_key_is_case_insensitive(self):
+        self.cache.put(answer(text='Example.COM'), NOW)
+        hit = self.cache.get(query('example.com'), NOW)
+        self.assertIsNotNone(hit)
+        self.assertIsNone(self.cache.get(query('other.example.com'), NOW))
+
+    def test_expiry(self):
+        self.cache.put(answer((60,)), NOW)
+        self.assertIsNotNone(self.cache.get(query(), NOW + 59))
+        self.assertIsNone(self.cache.get(query(), NOW + 60))
+        self.assertEqual(self.cache.stats['expired'], 1)
+
+    def test_ttl_clamped(self):
+        cache = web.DnsCache(size=4, min_ttl=10, max_ttl=100, negative_ttl=30)
+        self.assertEqual(cache.put(answer((5,)), NOW), 10)
+        self.assertEqual(cache.put(answer((500,), text='b.example'), NOW), 100)
+
+    def test_zero_ttl_not_stored(self):
+        self.assertEqual(self.cache.put(answer((0,)), NOW), 0)
+        self.assertIsNone(self.cache.get(query(), NOW))
+
+    def test_negative_answers(self):
+        self.assertEqual(self.cache.put(negative(rcode=3, ttl=3600, minimum=60), NOW), 60)
+        self.assertEqual(web.parse_dns_message(self.cache.get(query(), NOW + 1)).rcode, 3)
+        # NODATA without an SOA falls back to the configured negative TTL
+        self.assertEqual(self.cache.put(header(flags=0x8180) + question('nodata.example'), NOW), 30)
+
+    def test_uncacheable_replies(self):
+        self.assertEqual(self.cache.put(answer(flags=0x8180 | web.DNS_FLAG_TC), NOW), 0)
+        self.assertEqual(self.cache.put(web.dns_error_reply(query()), NOW), 0)
+        self.assertEqual(self.cache.put(web.dns_error_reply(query(), rcode=5), NOW), 0)
+        self.assertIsNone(self.cache.get(query(), NOW))
+        with self.assertRaises(ValueError):
+            self.cache.put(answer()[:-3], NOW)
+
+    def test_lru_eviction(self):
+        self.cache.put(answer(text='a.example'), NOW)
+        self.cache.put(answer(text='b.example'), NOW)
+        self.assertIsNotNone(self.cache.get(query('a.example'), NOW))  # a is now most recent
+        self.cache.put(answer(text='c.example'), NOW)
+        self.assertIsNone(self.cache.get(query('b.example'), NOW))
+        self.assertIsNotNone(self.cache.get(query('a.example'), NOW))
+        self.assertEqual(self.cache.stats['evicted'], 1)
+
+    def test_sweep(self):
+        self.cache.put(answer((10,), text='a.example'), NOW)
+        self.cache.put(answer((100,), text='b.example'), NOW)
+        self.assertEqual(self.cache.sweep(NOW + 10), 1)
+        summary = self.cache.summary()
+        self.assertEqual((summary['size'], summary['expired'], summary['capacity']), (1, 1, 2))
+
+
+class Upstream:
+    """One-shot UDP nameserver that answers a query with canned replies built from it"""
+
+    def __init__(self, *builders):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.builders = builders
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        query, peer = self.sock.recvfrom(4096)
+        for build in self.builders:
+            self.sock.sendto(build(query), peer)
+
+    def ranked(self):
+        return ['127.0.0.1']
+
+    def close(self):
+        self.thread.join(2)
+        self.sock.close()
+
+
+class ResolveUpstreamTests(unittest.TestCase):
+
+    def resolve(self, *builders):
+        upstream = Upstream(*builders)
+        self.addCleanup(upstream.close)
+        self.cache = web.DnsCache(size=4, min_ttl=0, max_ttl=3600, negative_ttl=30)
+        self.forwarder = web.DnsForwarder('127.0.0.1:0', self.cache, upstream, workers=1, timeout=0.5)
+        return self.forwarder.resolve_upstream(query(txid=0x5151))
+
+    @staticmethod
+    def spoofed(query_bytes):
+        return query_bytes[:2] + answer(text='bank.example')[2:]
+
+    @staticmethod
+    def genuine(query_bytes):
+        return query_bytes[:2] + answer()[2:]
+
+    def test_reply_to_another_question_is_dropped(self):
+        self.assertIsNone(self.resolve(self.spoofed))
+        self.assertIsNone(self.cache.get(query('bank.example'), NOW))
+        self.assertEqual(self.cache.stats['stored'], 0)
+        self.assertEqual(self.forwarder.stats['upstream_failures'], 1)
+
+    def test_matching_reply_after_a_spoofed_one_is_used(self):
+        reply = self.resolve(self.spoofed, lambda q: b'\x00', self.genuine)
+        self.assertEqual(web.parse_dns_message(reply).key, question().lower())
+        self.assertIsNone(self.cache.get(query('bank.example')))
+        self.assertIsNotNone(self.cache.get(query()))
+
+    def test_reply_matching(self):
+        q = query(txid=0x5151)
+        key = web.parse_dns_message(q).key
+        self.assertTrue(web.dns_reply_matches(q, self.genuine(q), key))
+        self.assertTrue(web.dns_reply_matches(q, self.spoofed(q)))
+        self.assertFalse(web.dns_reply_matches(q, self.spoofed(q), key))
+        self.assertFalse(web.dns_reply_matches(q, b'\x51\x51\x81', key))
+        self.assertFalse(web.dns_reply_matches(q, answer(txid=0x1111), key))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""EventBroker fan-out, Last-Event-ID resume, slow clients and SSE framing"""
+
+import json
+import threading
+import time
+import unittest
+
+from .webapp import web
+
+
+def drain(subscriber, timeout=0):
+    return [(event, data) for _, event, data in subscriber.get(timeout)]
+
+
+class EventBrokerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = web.EventBroker(backlog=5, client_buffer=3)
+
+    def test_fan_out(self):
+        first, second = self.broker.subscribe(), self.broker.subscribe()
+        self.broker.publish('vpn', {'status': 'connected'})
+        self.assertEqual(drain(first), [('vpn', {'status': 'connected'})])
+        self.assertEqual(drain(second), [('vpn', {'status': 'connected'})])
+        self.assertEqual(self.broker.subscriber_count, 2)
+        self.broker.unsubscribe(first)
+        self.broker.publish('vpn', {'status': 'disconnected'})
+        self.assertEqual(drain(first), [])
+        self.assertEqual(self.broker.subscriber_count, 1)
+
+    def test_resume_from_last_event_id(self):
+        subscriber = self.broker.subscribe()
+        for i in range(3):
+            self.broker.publish('log', i)
+        ids = [event_id for event_id, _, _ in subscriber.get(0)]
+        self.broker.publish('log', 3)
+        resumed = self.broker.subscribe(ids[1])
+        self.assertEqual([data for _, data in drain(resumed)], [2, 3])
+        self.assertEqual(drain(self.broker.subscribe(f'{ids[1].split("-")[0]}-99')), [])
+
+    def test_resume_older_than_the_backlog_replays_all_of_it(self):
+        self.broker = web.EventBroker(backlog=5, client_buffer=10)
+        first_id = None
+        subscriber = self.broker.subscribe()
+        for i in range(8):
+            self.broker.publish('log', i)
+            if first_id is None:
+                first_id = subscriber.get(0)[0][0]
+        self.assertEqual([data for _, data in drain(self.broker.subscribe(first_id))], [3, 4, 5, 6, 7])
+
+    def test_stale_or_missing_id_gets_the_replay(self):
+        self.broker = web.EventBroker(backlog=5, client_buffer=10)
+        for i in range(4):
+            self.broker.publish('log', i)
+        self.assertEqual([data for _, data in drain(self.broker.subscribe('deadbeef-2', replay=2))], [2, 3])
+        self.assertEqual(drain(self.broker.subscribe('garbage', replay=0)), [])
+        self.assertEqual([data for _, data in drain(self.broker.subscribe(None, replay=10))], [0, 1, 2, 3])
+
+    def test_slow_subscriber_drops_oldest(self):
+        slow = self.broker.subscribe()
+        for i in range(5):
+            self.broker.publish('log', i)
+        self.assertEqual(slow.dropped, 2)
+        self.assertEqual([data for _, data in drain(slow)], [2, 3, 4])
+
+    def test_get_wakes_on_publish(self):
+        subscriber = self.broker.subscribe()
+        timer = threading.Timer(0.05, self.broker.publish, ('vpn', 'up'))
+        timer.start()
+        started = time.monotonic()
+        self.assertEqual(drain(subscriber, 2), [('vpn', 'up')])
+        self.assertLess(time.monotonic() - started, 1)
+        timer.join()
+
+
+class SseStreamTests(unittest.TestCase):
+
+    def test_framing_and_drop_notice(self):
+        broker = web.EventBroker(backlog=10, client_buffer=2)
+        subscriber = broker.subscribe()
+        stream = web.sse_stream(subscriber, heartbeat=0.01)
+        self.assertEqual(next(stream), 'retry: 3000\n\n')
+        self.assertEqual(next(stream), ': keepalive\n\n')
+        for i in range(3):
+            broker.publish('log', {'line': i})
+        chunk = next(stream)
+        self.assertTrue(chunk.startswith('event: dropped\ndata: {"count": 1}\n\n'))
+        events = chunk.split('\n\n')[1:-1]
+        self.assertEqual(len(events), 2)
+        event_id, event, data = events[0].split('\n')
+        self.assertRegex(event_id, r'^id: [0-9a-f]{8}-2$')
+        self.assertEqual((event, json.loads(data[len('data: '):])), ('event: log', {'line': 1}))
+        self.assertEqual(subscriber.dropped, 0)
+        stream.close()
+        self.assertEqual(broker.subscriber_count, 0)
+
+    def test_busy_response(self):
+        response = web.sse_busy()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], str(web.SSE_BUSY_RETRY))
+        self.assertEqual(response.get_data(as_text=True), f'retry: {web.SSE_BUSY_RETRY * 1000}\n\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
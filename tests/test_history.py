@@ -0,0 +1,204 @@
+"""HistoryRing: the memory-mapped status history"""
+
+import os
+import struct
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from .webapp import web
+
+START = 1_700_000_000.0
+
+
+def values(t):
+    return (t, 1, 1, 0, 0x0a000001, int(t) * 10, int(t) * 20, 12.5, 0.0)
+
+
+class HistoryRingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.scratch.name, 'sub', 'history.bin')
+        self.rings = []
+
+    def tearDown(self):
+        for ring in self.rings:
+            ring.close()
+        self.scratch.cleanup()
+
+    def ring(self, capacity=5, record=web.HISTORY_RECORD):
+        ring = web.HistoryRing(self.path, capacity, record)
+        self.rings.append(ring)
+        return ring
+
+    def fill(self, ring, count):
+        for i in range(count):
+            ring.append(values(START + i))
+
+    def times(self, ring, start=0, end=float('inf')):
+        return [record.time - START for record in ring.range(start, end)]
+
+    def test_empty(self):
+        ring = self.ring()
+        self.assertEqual(len(ring), 0)
+        self.assertEqual(ring.range(0, float('inf')), [])
+        self.assertEqual(os.path.getsize(self.path), ring.HEADER_SIZE + 5 * web.HISTORY_RECORD.size)
+
+    def test_append_and_decode(self):
+        ring = self.ring()
+        ring.append(values(START))
+        [record] = ring.range(0, float('inf'))
+        self.assertEqual(record, web.HistoryRecord(*values(START)))
+
+    def test_wraparound_keeps_newest_in_order(self):
+        ring = self.ring(capacity=5)
+        self.fill(ring, 12)
+        self.assertEqual(len(ring), 5)
+        self.assertEqual(self.times(ring), [7, 8, 9, 10, 11])
+
+    def test_range_bounds(self):
+        ring = self.ring(capacity=5)
+        self.fill(ring, 8)  # holds 3..7, wrapped after 4
+        self.assertEqual(self.times(ring, START + 4, START + 7), [4, 5, 6])
+        self.assertEqual(self.times(ring, START + 4.5, START + 6.5), [5, 6])
+        self.assertEqual(self.times(ring, START + 7, START + 100), [7])
+        self.assertEqual(self.times(ring, 0, START + 3), [])
+        self.assertEqual(self.times(ring, START + 8, START + 100), [])
+        self.assertEqual(self.times(ring, START + 6, START + 6), [])
+
+    def test_range_across_every_wrap_position(self):
+        for appended in range(1, 12):
+            with self.subTest(appended=appended):
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                ring = self.ring(capacity=4)
+                self.fill(ring, appended)
+                expected = list(range(max(0, appended - 4), appended))
+                self.assertEqual(self.times(ring), expected)
+                self.assertEqual(self.times(ring, START + expected[-1], START + 100), expected[-1:])
+                ring.close()
+
+    def test_reopen_keeps_records(self):
+        ring = self.ring(capacity=5)
+        self.fill(ring, 7)
+        ring.close()
+        reopened = self.ring(capacity=5)
+        self.assertEqual(self.times(reopened), [2, 3, 4, 5, 6])
+        reopened.append(values(START + 7))
+        self.assertEqual(self.times(reopened), [3, 4, 5, 6, 7])
+
+    def assertRecreated(self):
+        ring = self.ring(capacity=5)
+        self.assertEqual(len(ring), 0)
+        self.assertEqual(os.path.getsize(self.path), ring.HEADER_SIZE + 5 * web.HISTORY_RECORD.size)
+        ring.append(values(START))
+        self.assertEqual(self.times(ring), [0])
+
+    def write_header(self, magic=web.HISTORY_MAGIC, record_size=None, capacity=5, head=3, count=3):
+        ring = self.ring(capacity=5)
+        self.fill(ring, 3)
+        ring.close()
+        record_size = record_size or web.HISTORY_RECORD.size
+        with open(self.path, 'r+b') as f:
+            f.write(web.HistoryRing.HEADER.pack(magic, record_size, capacity, head, count))
+
+    def test_capacity_change_recreates(self):
+        ring = self.ring(capacity=3)
+        self.fill(ring, 3)
+        ring.close()
+        self.assertRecreated()
+
+    def test_record_layout_change_recreates(self):
+        ring = self.ring(capacity=5, record=struct.Struct('<dBBBxIQQf'))
+        ring.append(values(START)[:-1])
+        ring.close()
+        self.assertRecreated()
+
+    def test_bad_magic_recreates(self):
+        self.write_header(magic=b'NOTHIST1')
+        self.assertRecreated()
+
+    def test_untouched_header_is_kept(self):
+        self.write_header()
+        self.assertEqual(len(self.ring(capacity=5)), 3)
+
+    def test_corrupt_position_recreates(self):
+        for head, count in ((5, 5), (9, 2), (1, 6), (1, 3), (2**63, 5)):
+            with self.subTest(head=head, count=count):
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                self.write_header(head=head, count=count)
+                self.assertRecreated()
+
+    def test_truncated_file_recreates(self):
+        for size in (0, 10, web.HistoryRing.HEADER_SIZE + 2 * web.HISTORY_RECORD.size):
+            with self.subTest(size=size):
+                self.write_header()
+                with open(self.path, 'r+b') as f:
+                    f.truncate(size)
+                self.assertRecreated()
+                self.rings.pop().close()
+
+    def test_unwritable_path_disables_history(self):
+        blocker = os.path.join(self.scratch.name, 'file')
+        open(blocker, 'w').close()
+        ring = web.HistoryRing(os.path.join(blocker, 'history.bin'), 5)
+        self.assertFalse(ring.open())
+        ring.append(values(START))
+        self.assertEqual(len(ring), 0)
+        self.assertEqual(ring.range(0, float('inf')), [])
+        self.assertIn('history.bin', ring.error)
+
+
+class ApiHistoryTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.scratch = tempfile.TemporaryDirectory()
+        cls.ring = web.HistoryRing(os.path.join(cls.scratch.name, 'history.bin'), 100)
+        cls.now = time.time()
+        for age in (3 * 86400, 300, 200, 100):
+            cls.ring.append(values(cls.now - age))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ring.close()
+        cls.scratch.cleanup()
+
+    def setUp(self):
+        patcher = mock.patch.object(web, 'history', self.ring)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = web.app.test_client()
+
+    def samples(self, query):
+        response = self.client.get(f'/api/history?{query}')
+        self.assertEqual(response.status_code, 200, response.get_json())
+        data = response.get_json()
+        return sum(point['samples'] for point in data['points']), data
+
+    def test_default_is_the_last_day(self):
+        self.assertEqual(self.samples('')[0], 3)
+
+    def test_negative_bounds_count_back_from_now(self):
+        self.assertEqual(self.samples('from=-250')[0], 2)
+        self.assertEqual(self.samples('from=-250&to=-150')[0], 1)
+
+    def test_from_zero_is_everything(self):
+        count, data = self.samples('from=0')
+        self.assertEqual(count, 4)
+        self.assertEqual(data['from'], 0)
+        self.assertLessEqual(data['step'], (self.now - (self.now - 3 * 86400)) / web.HISTORY_MAX_POINTS + 1)
+
+    def test_absolute_bounds(self):
+        self.assertEqual(self.samples(f'from={self.now - 250}&to={self.now - 150}')[0], 1)
+
+    def test_empty_range_is_rejected(self):
+        self.assertEqual(self.client.get('/api/history?from=-100&to=-200').status_code, 400)
+        self.assertEqual(self.client.get('/api/history?to=0').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""Tunnel inspection: rtnetlink RTM_NEWADDR parsing and the `ip -o addr` fallback"""
+
+import socket
+import struct
+import unittest
+
+from .webapp import web
+
+SEQ = 4242
+
+
+def rtattr(kind, payload):
+    length = 4 + len(payload)
+    return struct.pack('=HH', length, kind) + payload + b'\0' * ((-length) % 4)
+
+
+def nlmsg(msg_type, payload, seq=SEQ):
+    length = 16 + len(payload)
+    return struct.pack('=IHHII', length, msg_type, 0, seq, 0) + payload + b'\0' * ((-length) % 4)
+
+
+def newaddr(index, family, address, prefixlen=32, scope=0, seq=SEQ, kind=web.IFA_LOCAL):
+    raw = socket.inet_pton(family, address) if isinstance(address, str) else address
+    body = struct.pack('=BBBBI', family, prefixlen, 0, scope, index) + rtattr(kind, raw)
+    return nlmsg(web.RTM_NEWADDR, body, seq)
+
+
+def done():
+    return nlmsg(web.NLMSG_DONE, struct.pack('=i', 0))
+
+
+class NetlinkAddressTests(unittest.TestCase):
+
+    def parse(self, data, indexes=None):
+        indexes = indexes or {7: 'tun0', 9: 'tun1'}
+        addresses = {name: {'inet': [], 'inet6': []} for name in indexes.values()}
+        finished = web.parse_netlink_addresses(data, SEQ, indexes, addresses)
+        return finished, addresses
+
+    def test_ipv4_and_ipv6_addresses(self):
+        data = (newaddr(7, socket.AF_INET, '10.1.2.3')
+                + newaddr(7, socket.AF_INET6, 'fe80::1', 64, 253)
+                + newaddr(9, socket.AF_INET6, '2001:db8::5', 128)
+                + done())
+        finished, addresses = self.parse(data)
+        self.assertTrue(finished)
+        self.assertEqual(addresses['tun0']['inet'], [{'address': '10.1.2.3', 'prefixlen': 32, 'scope': 'global'}])
+        self.assertEqual(addresses['tun0']['inet6'], [{'address': 'fe80::1', 'prefixlen': 64, 'scope': 'link'}])
+        self.assertEqual(addresses['tun1']['inet6'][0]['address'], '2001:db8::5')
+
+    def test_ifa_address_used_without_ifa_local(self):
+        _, addresses = self.parse(newaddr(7, socket.AF_INET, '10.9.9.9', kind=web.IFA_ADDRESS) + done())
+        self.assertEqual(addresses['tun0']['inet'][0]['address'], '10.9.9.9')
+
+    def test_other_interfaces_and_sequences_are_skipped(self):
+        data = newaddr(3, socket.AF_INET, '192.168.1.2') + newaddr(7, socket.AF_INET, '10.0.0.1', seq=SEQ + 1) + done()
+        _, addresses = self.parse(data)
+        self.assertEqual(addresses['tun0'], {'inet': [], 'inet6': []})
+
+    def test_dump_continues_until_done(self):
+        first = newaddr(7, socket.AF_INET, '10.1.2.3')
+        finished, addresses = self.parse(first)
+        self.assertFalse(finished)
+        self.assertEqual(len(addresses['tun0']['inet']), 1)
+        self.assertTrue(self.parse(done())[0])
+
+    def test_error_reply(self):
+        with self.assertRaises(OSError):
+            self.parse(nlmsg(web.NLMSG_ERROR, struct.pack('=i', -1) + b'\0' * 16))
+        self.assertTrue(self.parse(nlmsg(web.NLMSG_ERROR, struct.pack('=i', 0) + b'\0' * 16))[0])
+
+    def test_truncated_message_raises(self):
+        data = newaddr(7, socket.AF_INET, '10.1.2.3')
+        for cut in (len(data) - 1, 20, 17):
+            with self.subTest(cut=cut), self.assertRaises(ValueError):
+                self.parse(data[:cut])
+
+    def test_short_trailing_bytes_are_ignored(self):
+        finished, addresses = self.parse(newaddr(7, socket.AF_INET, '10.1.2.3') + b'\0' * 8)
+        self.assertFalse(finished)
+        self.assertEqual(len(addresses['tun0']['inet']), 1)
+
+    def test_bad_address_length_is_skipped(self):
+        _, addresses = self.parse(newaddr(7, socket.AF_INET, b'\x0a\x01\x02') + newaddr(7, socket.AF_INET6, b'\0' * 4) + done())
+        self.assertEqual(addresses['tun0'], {'inet': [], 'inet6': []})
+
+    def test_attribute_overrunning_its_message_is_dropped(self):
+        body = struct.pack('=BBBBI', socket.AF_INET, 32, 0, 0, 7) + struct.pack('=HH', 64, web.IFA_LOCAL) + b'\x0a\x01\x02\x03'
+        _, addresses = self.parse(nlmsg(web.RTM_NEWADDR, body) + done())
+        self.assertEqual(addresses['tun0']['inet'], [])
+
+    def test_rtattrs_alignment_and_zero_length(self):
+        data = rtattr(1, b'abc') + rtattr(2, b'\x01\x02\x03\x04\x05') + struct.pack('=HH', 0, 3) + rtattr(4, b'x')
+        self.assertEqual(web._parse_rtattrs(data, 0, len(data)), {1: b'abc', 2: b'\x01\x02\x03\x04\x05'})
+
+
+class IpAddrOutputTests(unittest.TestCase):
+
+    OUTPUT = '\n'.join([
+        '1: lo    inet 127.0.0.1/8 scope host lo\\       valid_lft forever preferred_lft forever',
+        '5: tun0    inet 10.1.2.3 peer 10.1.2.4/32 scope global tun0\\       valid_lft forever',
+        '5: tun0    inet6 fe80::abcd/64 scope link stable-privacy \\       valid_lft forever',
+        '6: tun1@NONE    inet 10.8.0.2/24 brd 10.8.0.255 scope global tun1',
+        '7: tun2    inet6 2001:db8::7 scope',
+        '8: tun3    inet 10.0.0.1/garbage scope global tun3',
+        '9: tun3    link/none',
+        'garbage',
+        '',
+    ])
+
+    def test_parses_requested_interfaces(self):
+        addresses = web.parse_ip_addr_output(self.OUTPUT, ['tun0', 'tun1', 'tun2', 'tun3'])
+        self.assertEqual(addresses['tun0']['inet'], [{'address': '10.1.2.3', 'prefixlen': 32, 'scope': 'global'}])
+        self.assertEqual(addresses['tun0']['inet6'], [{'address': 'fe80::abcd', 'prefixlen': 64, 'scope': 'link'}])
+        self.assertEqual(addresses['tun1']['inet'][0]['prefixlen'], 24)
+        self.assertEqual(addresses['tun2']['inet6'], [{'address': '2001:db8::7', 'prefixlen': 128, 'scope': 'global'}])
+        self.assertEqual(addresses['tun3'], {'inet': [], 'inet6': []})
+        self.assertNotIn('lo', addresses)
+
+    def test_primary_address_prefers_global(self):
+        addresses = web.parse_ip_addr_output(self.OUTPUT, ['tun0'])['tun0']
+        self.assertEqual(web.primary_address(addresses), '10.1.2.3')
+        self.assertEqual(web.primary_address({'inet': [], 'inet6': addresses['inet6']}), 'fe80::abcd')
+
+
+if __name__ == '__main__':
+    unittest.main()
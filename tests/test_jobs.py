@@ -0,0 +1,125 @@
+"""JobRunner: per-target command ordering, dedup and superseding"""
+
+import threading
+import time
+import unittest
+
+from .webapp import web
+
+
+def wait_until(predicate, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+class Step:
+    """A job body that issues its 'command', then waits until told to finish or superseded"""
+
+    def __init__(self, log, name):
+        self.log = log
+        self.name = name
+        self.issue = threading.Event()
+        self.finish = threading.Event()
+
+    def __call__(self, job):
+        self.issue.wait(2)
+        self.log.append(self.name)
+        job.release()
+        wait_until(lambda: self.finish.is_set() or job.superseded_by is not None)
+        return self.name
+
+
+class JobRunnerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = web.JobRunner(workers=4, history=10)
+        self.addCleanup(self.runner.shutdown)
+        self.log = []
+
+    def submit(self, action, target='vpn'):
+        step = Step(self.log, action)
+        job, created = self.runner.submit(action, target, step)
+        return job, created, step
+
+    def test_commands_for_a_target_go_out_in_order(self):
+        connect, _, first = self.submit('connect')
+        disconnect, _, second = self.submit('disconnect')
+        second.issue.set()
+        time.sleep(0.1)
+        self.assertEqual(disconnect.state, 'queued')  # still behind connect's command
+        first.issue.set()
+        self.assertTrue(wait_until(lambda: self.log == ['connect', 'disconnect']))
+        # connect stopped waiting as soon as its command was out: disconnect was next in line
+        self.assertEqual(connect.superseded_by, disconnect.id)
+        self.assertTrue(wait_until(lambda: connect.done))
+        second.finish.set()
+        self.assertTrue(wait_until(lambda: disconnect.done))
+
+    def test_conflicting_action_ends_a_pending_wait(self):
+        connect, _, first = self.submit('connect')
+        first.issue.set()
+        self.assertTrue(wait_until(lambda: self.log == ['connect']))
+        self.assertEqual(connect.state, 'running')
+        disconnect, created, second = self.submit('disconnect')
+        self.assertTrue(created)
+        self.assertEqual(connect.superseded_by, disconnect.id)
+        self.assertTrue(wait_until(lambda: connect.done))
+        self.assertEqual(connect.state, 'succeeded')
+        second.issue.set()
+        second.finish.set()
+        self.assertTrue(wait_until(lambda: disconnect.done))
+        self.assertIsNone(disconnect.superseded_by)
+
+    def test_same_action_is_deduplicated(self):
+        connect, created, first = self.submit('connect')
+        self.assertTrue(created)
+        again, created, _ = self.submit('connect')
+        self.assertIs(again, connect)
+        self.assertFalse(created)
+        first.issue.set()
+        self.assertTrue(wait_until(lambda: self.log == ['connect']))
+        # Still waiting for the transition: a second click joins the same job
+        self.assertIs(self.submit('connect')[0], connect)
+        first.finish.set()
+        self.assertTrue(wait_until(lambda: connect.done))
+        self.assertIsNot(self.submit('connect')[0], connect)
+
+    def test_targets_are_independent(self):
+        _, _, blocked = self.submit('connect', target='vpn-a')
+        other, _, free = self.submit('connect', target='vpn-b')
+        free.issue.set()
+        free.finish.set()
+        self.assertTrue(wait_until(lambda: other.done))
+        self.assertEqual(self.log, ['connect'])
+        blocked.issue.set()
+        blocked.finish.set()
+
+    def test_failure_is_recorded_and_releases_the_target(self):
+        def boom(job):
+            raise RuntimeError('supervisor said no')
+        failed, _ = self.runner.submit('connect', 'vpn', boom)
+        self.assertTrue(wait_until(lambda: failed.done))
+        self.assertEqual((failed.state, failed.error), ('failed', 'supervisor said no'))
+        after, _, step = self.submit('disconnect')
+        step.issue.set()
+        step.finish.set()
+        self.assertTrue(wait_until(lambda: after.state == 'succeeded'))
+        self.assertEqual(self.runner.get(failed.id).to_dict()['error'], 'supervisor said no')
+
+    def test_history_is_bounded(self):
+        jobs = []
+        for i in range(15):
+            job, _ = self.runner.submit(f'noop-{i}', 'vpn', lambda job: None)
+            jobs.append(job)
+        self.assertTrue(wait_until(lambda: all(job.done for job in jobs)))
+        self.runner.submit('noop-last', 'vpn', lambda job: None)
+        self.assertLessEqual(len(self.runner.recent()), 10)
+        self.assertIsNone(self.runner.get(jobs[0].id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+"""Log tailing, filtering and the /api/logs index"""
+
+import io
+import os
+import re
+import tempfile
+import time
+import unittest
+
+from .webapp import web
+
+
+class ReadLastLinesTests(unittest.TestCase):
+
+    def read(self, data, count, block_size=4):
+        return web.read_last_lines(io.BytesIO(data), len(data), count, block_size)
+
+    def test_lines_across_blocks(self):
+        data = b'one\ntwo\nthree\nfour\n'
+        self.assertEqual(self.read(data, 2), ([b'three', b'four'], b''))
+        self.assertEqual(self.read(data, 10), ([b'one', b'two', b'three', b'four'], b''))
+        self.assertEqual(self.read(data, 2, block_size=1024), ([b'three', b'four'], b''))
+
+    def test_partial_last_line(self):
+        self.assertEqual(self.read(b'one\ntwo\npart', 5), ([b'one', b'two'], b'part'))
+        self.assertEqual(self.read(b'no newline', 5), ([], b'no newline'))
+
+    def test_edge_cases(self):
+        self.assertEqual(self.read(b'', 5), ([], b''))
+        self.assertEqual(self.read(b'a\nb\n', 0), ([], b''))
+        self.assertEqual(self.read(b'\n\n', 5), ([b'', b''], b''))
+
+    def test_first_line_cut_by_the_block_boundary_is_dropped(self):
+        data = b'x' * 10 + b'\nlast\n'
+        self.assertEqual(self.read(data, 1, block_size=8), ([b'last'], b''))
+
+
+class LogTailTests(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(self.scratch.cleanup)
+        self.path = os.path.join(self.scratch.name, 'vpn.log')
+        self.tail = web.LogTail(self.path, capacity=5)
+        self.addCleanup(self.tail.close)
+
+    def write(self, data, mode='ab'):
+        with open(self.path, mode) as f:
+            f.write(data)
+
+    def test_missing_file(self):
+        self.assertEqual(self.tail.poll(), [])
+        self.assertEqual(self.tail.lines(10), [])
+        self.write(b'hello\n')
+        self.assertEqual(self.tail.poll(), ['hello'])
+
+    def test_initial_tail_then_appends(self):
+        self.write(b''.join(b'line %d\n' % i for i in range(8)))
+        self.assertEqual(self.tail.poll(), [f'line {i}' for i in range(3, 8)])
+        self.assertEqual(self.tail.poll(), [])
+        self.write(b'line 8\nline ')
+        self.assertEqual(self.tail.poll(), ['line 8'])
+        self.write(b'9\n')
+        self.assertEqual(self.tail.poll(), ['line 9'])
+        self.assertEqual(self.tail.lines(2), ['line 8', 'line 9'])
+
+    def test_lines_beyond_capacity_are_read_from_the_file(self):
+        self.write(b''.join(b'%d\n' % i for i in range(20)))
+        self.assertEqual(self.tail.lines(8), [str(i) for i in range(12, 20)])
+        self.assertEqual(self.tail.lines(0), [])
+
+    def test_invalid_utf8_is_replaced(self):
+        self.write(b'caf\xe9\n')
+        self.assertEqual(self.tail.poll(), ['caf\ufffd'])
+
+    def test_rotation_drains_the_old_file(self):
+        self.write(b'old 1\n')
+        self.tail.poll()
+        self.write(b'old 2\n')
+        os.rename(self.path, self.path + '.1')
+        self.write(b'new 1\n')
+        self.assertEqual(self.tail.poll(), ['old 2', 'new 1'])
+        self.write(b'new 2\n')
+        self.assertEqual(self.tail.poll(), ['new 2'])
+
+    def test_truncation_restarts(self):
+        self.write(b'a long first line\nsecond\n')
+        self.tail.poll()
+        self.write(b'fresh\n', 'wb')
+        self.assertEqual(self.tail.poll(), ['fresh'])
+        self.assertEqual(self.tail.lines(5), ['fresh'])
+
+    def test_removed_file_clears_the_tail(self):
+        self.write(b'gone\n')
+        self.tail.poll()
+        os.remove(self.path)
+        self.assertEqual(self.tail.lines(5), [])
+
+    def test_independent_cursors(self):
+        self.write(b'a\nb\n')
+        lines, first = self.tail.since(0)
+        self.assertEqual(lines, ['a', 'b'])
+        self.write(b'c\n')
+        self.assertEqual(self.tail.since(first), (['c'], 3))
+        self.assertEqual(self.tail.since(0), (['a', 'b', 'c'], 3))
+        self.write(b''.join(b'%d\n' % i for i in range(10)))
+        # A reader that fell behind by more than the capacity skips to what is still held
+        self.assertEqual(self.tail.since(first), ([str(i) for i in range(5, 10)], 13))
+
+
+class LogIndexTests(unittest.TestCase):
+
+    LINES = [
+        ('vpn', 'Connected as 10.1.2.3, using SSL'),
+        ('vpn', 'DTLS handshake failed: timeout'),
+        ('web', 'GET /api/status (1+1) 200'),
+        ('vpn', 'Error: connection refused'),
+        ('vpn', 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaab'),
+    ]
+
+    def setUp(self):
+        self.index = web.LogIndex(size=100)
+        for i, (stream, text) in enumerate(self.LINES):
+            self.index.add(stream, text, 1000.0 + i)
+
+    def texts(self, **query):
+        return [record.text for record in self.index.query(**query)]
+
+    def test_levels_and_since(self):
+        self.assertEqual(self.texts(level='error'), ['DTLS handshake failed: timeout', 'Error: connection refused'])
+        self.assertEqual(len(self.texts(level='warning')), 2)
+        self.assertEqual(self.texts(since=1002.5), ['Error: connection refused', self.LINES[-1][1]])
+        self.assertEqual(self.texts(limit=2), [self.LINES[-2][1], self.LINES[-1][1]])
+
+    def test_grep_is_a_case_insensitive_substring(self):
+        self.assertEqual(self.texts(grep='connected AS'), ['Connected as 10.1.2.3, using SSL'])
+        self.assertEqual(self.texts(grep='(1+1)'), ['GET /api/status (1+1) 200'])
+        self.assertEqual(self.texts(grep='10.1.2.'), ['Connected as 10.1.2.3, using SSL'])
+        self.assertEqual(self.texts(grep='10.1.2.x'), [])
+
+    def test_regex_is_opt_in(self):
+        self.assertEqual(self.texts(grep=r'^(connected|error)\b', regex=True),
+                         ['Connected as 10.1.2.3, using SSL', 'Error: connection refused'])
+        with self.assertRaises(re.error):
+            self.index.query(grep='(unclosed', regex=True)
+
+    def test_pattern_length_is_capped(self):
+        for regex in (False, True):
+            with self.subTest(regex=regex), self.assertRaises(re.error):
+                self.index.query(grep='a' * (web.LOG_GREP_MAX_LENGTH + 1), regex=regex)
+
+    def test_regex_only_sees_the_start_of_long_lines(self):
+        self.index.add('vpn', 'x' * web.LOG_GREP_REGEX_SPAN + 'needle', 2000.0)
+        self.assertEqual(self.texts(grep='needle', regex=True), [])
+        self.assertEqual(len(self.texts(grep='needle')), 1)
+
+    def test_catastrophic_pattern_stays_substring(self):
+        started = time.perf_counter()
+        self.assertEqual(self.texts(grep='(a+)+$'), [])
+        self.assertLess(time.perf_counter() - started, 1)
+
+
+class ApiLogsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = web.app.test_client()
+
+    def test_bad_patterns_are_rejected(self):
+        response = self.client.get('/api/logs?grep=(x&regex=1')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid grep pattern', response.get_json()['error'])
+        self.assertEqual(self.client.get('/api/logs?grep=' + 'a' * 200).status_code, 400)
+        self.assertEqual(self.client.get('/api/logs?grep=(x').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
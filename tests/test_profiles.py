@@ -0,0 +1,144 @@
+"""VPN profiles: loading the profiles file and per-profile status"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .webapp import web
+
+
+class LoadProfilesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(self.scratch.cleanup)
+        self.path = os.path.join(self.scratch.name, 'profiles.json')
+
+    def write(self, entries):
+        with open(self.path, 'w') as f:
+            f.write(entries if isinstance(entries, str) else json.dumps(entries))
+
+    def test_no_file_means_only_the_default(self):
+        profiles = web.load_profiles(self.path)
+        self.assertEqual(list(profiles), [web.DEFAULT_PROFILE])
+        default = profiles[web.DEFAULT_PROFILE]
+        self.assertEqual((default.interface, default.program), (web.VPN_INTERFACE, web.VPN_PROGRAM))
+
+    def test_profiles_inherit_the_environment(self):
+        self.write({'lab': {'server': 'lab.example.com', 'interface': 'tun1', 'name': 'ignored', 'bogus': 1},
+                    'dr': {'interface': 'tun2', 'program': 'dr-vpn', 'dns_servers': ['10.0.0.53']}})
+        profiles = web.load_profiles(self.path)
+        self.assertEqual(list(profiles), [web.DEFAULT_PROFILE, 'lab', 'dr'])
+        default, lab, dr = profiles.values()
+        self.assertEqual((lab.name, lab.server, lab.interface, lab.program),
+                         ('lab', 'lab.example.com', 'tun1', 'openconnect-vpn-lab'))
+        self.assertEqual((lab.user, lab.authgroup), (default.user, default.authgroup))
+        self.assertEqual((dr.server, dr.program, dr.dns_servers), (default.server, 'dr-vpn', ['10.0.0.53']))
+
+    def test_default_can_be_overridden_in_place(self):
+        self.write({web.DEFAULT_PROFILE: {'server': 'other.example.com'}})
+        default = web.load_profiles(self.path)[web.DEFAULT_PROFILE]
+        self.assertEqual(default.server, 'other.example.com')
+
+    def test_invalid_files(self):
+        cases = {
+            'bad name': {'../etc': {'interface': 'tun1'}},
+            'no interface': {'lab': {'server': 'lab.example.com'}},
+            'shared interface': {'lab': {'interface': web.VPN_INTERFACE}},
+            'duplicate interface': {'a': {'interface': 'tun1'}, 'b': {'interface': 'tun1'}},
+        }
+        for label, entries in cases.items():
+            with self.subTest(label):
+                self.write(entries)
+                with self.assertRaises(ValueError):
+                    web.load_profiles(self.path)
+
+    def test_broken_file_keeps_the_default_tunnel(self):
+        for content in ('{not json', '["a list"]', json.dumps({'lab': 'not an object'}),
+                        json.dumps({'lab': {'server': 'no interface'}})):
+            with self.subTest(content=content):
+                self.write(content)
+                registry = web.ProfileRegistry(self.path)
+                self.assertEqual(registry.names(), [web.DEFAULT_PROFILE])
+                self.assertTrue(registry.error.startswith(self.path))
+
+    def test_registry(self):
+        self.write({'lab': {'interface': 'tun1'}})
+        registry = web.ProfileRegistry(self.path)
+        self.assertIsNone(registry.error)
+        self.assertEqual(registry.names(), [web.DEFAULT_PROFILE, 'lab'])
+        self.assertEqual(registry.get('lab').interface, 'tun1')
+        self.assertEqual([profile.name for profile in registry.all()], registry.names())
+        self.assertIsNone(registry.get('missing'))
+
+
+class ProfileStatusTests(unittest.TestCase):
+
+    def setUp(self):
+        self.lab = web.default_profile()._replace(name='lab', interface='tun1', program='openconnect-vpn-lab')
+        registry = mock.Mock(all=mock.Mock(return_value=[web.default_profile(), self.lab]))
+        patcher = mock.patch.object(web, 'profile_registry', registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def interfaces(self, names):
+        up = {'exists': True, 'operstate': 'unknown', 'stats': {'rx_bytes': 1, 'tx_bytes': 2},
+              'inet': [{'address': '10.8.0.2', 'prefixlen': 32, 'scope': 'global'}], 'inet6': []}
+        down = {'exists': False, 'inet': [], 'inet6': []}
+        return {name: dict(up) if name == 'tun1' else dict(down) for name in names}
+
+    def status(self, processes):
+        client = mock.Mock()
+        if isinstance(processes, Exception):
+            client.all_process_info.side_effect = processes
+        else:
+            client.all_process_info.return_value = processes
+        with mock.patch.object(web, 'inspect_interfaces', self.interfaces), \
+                mock.patch.object(web, 'supervisor_client', client):
+            return web.get_profiles_status()
+
+    def process(self, name, state, pid=0):
+        return {'name': name, 'statename': state, 'pid': pid, 'start': 1000 if pid else 0, 'exitstatus': 0,
+                'spawnerr': '', 'description': ''}
+
+    def test_one_batched_status(self):
+        status = self.status([self.process(web.VPN_PROGRAM, 'STOPPED'),
+                              self.process('openconnect-vpn-lab', 'RUNNING', 42)])
+        self.assertEqual(status[web.DEFAULT_PROFILE]['vpn']['status'], 'disconnected')
+        self.assertEqual(status['lab']['vpn']['ip'], '10.8.0.2')
+        self.assertEqual(status['lab']['process']['pid'], 42)
+        self.assertEqual(web.default_profile_state(status, 'process')['state'], 'STOPPED')
+
+    def test_supervisor_down(self):
+        status = self.status(ConnectionRefusedError('refused'))
+        self.assertEqual(status['lab']['process'], {'available': False, 'error': 'refused'})
+        self.assertEqual(status['lab']['vpn']['status'], 'connected')
+
+    def test_missing_program(self):
+        status = self.status([self.process(web.VPN_PROGRAM, 'RUNNING', 7)])
+        self.assertFalse(status['lab']['process']['available'])
+        self.assertIn('openconnect-vpn-lab', status['lab']['process']['error'])
+
+    def test_default_state_without_a_sample(self):
+        self.assertEqual(web.default_profile_state({}, 'vpn')['status'], 'error')
+        self.assertFalse(web.default_profile_state({'error': 'boom'}, 'process')['available'])
+
+    def test_payload_and_failure_detection(self):
+        status = self.status([self.process('openconnect-vpn-lab', 'RUNNING', 42)])
+        snapshot = {'profiles': web.ProbeSample(status, 5000.0)}
+        payload = web.profile_status(snapshot, self.lab, now=5010.0)
+        self.assertTrue(payload['connected'])
+        self.assertEqual((payload['age'], payload['process']['uptime']), (10.0, 4010.0))
+        self.assertFalse(web.profile_failed(snapshot, 'lab'))
+        self.assertEqual(web.profile_status({}, self.lab)['ip'], 'N/A')
+
+        failed = self.status([self.process('openconnect-vpn-lab', 'FATAL')])
+        snapshot = {'profiles': web.ProbeSample(failed, 5000.0)}
+        self.assertTrue(web.profile_failed(snapshot, 'lab', since=4999))
+        self.assertFalse(web.profile_failed(snapshot, 'lab', since=5001))  # sample predates the command
+
+
+if __name__ == '__main__':
+    unittest.main()
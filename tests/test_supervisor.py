@@ -0,0 +1,182 @@
+"""SupervisorClient and supervisor_command against a stub supervisord XML-RPC server"""
+
+import socket
+import socketserver
+import threading
+import time
+import unittest
+import xmlrpc.client
+from unittest import mock
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+from .webapp import web
+
+
+class _KeepAliveHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = 'HTTP/1.1'  # like supervisord: connections stay open between calls
+    rpc_paths = ('/RPC2',)
+
+    def setup(self):
+        super().setup()
+        self.server.connections.append(self.connection)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubSupervisor(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    """The few supervisor.* methods the web UI calls, for one or more programs"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _KeepAliveHandler, logRequests=False, allow_none=True)
+        self.connections = []
+        self.calls = []
+        self.running = set()
+        self.delay = 0
+        for name in ('startProcess', 'stopProcess', 'getProcessInfo', 'getAllProcessInfo'):
+            self.register_function(getattr(self, name), f'supervisor.{name}')
+        self.thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/RPC2'
+
+    def _info(self, name):
+        up = name in self.running
+        return {'name': name, 'group': name, 'statename': 'RUNNING' if up else 'STOPPED',
+                'pid': 4242 if up else 0, 'start': 1000 if up else 0, 'exitstatus': 0,
+                'spawnerr': '', 'description': 'pid 4242' if up else 'Not started'}
+
+    def startProcess(self, name, wait=True):
+        self.calls.append(('start', name))
+        time.sleep(self.delay)
+        if name in self.running:
+            raise xmlrpc.client.Fault(web.SUPERVISOR_FAULT_ALREADY_STARTED, f'ALREADY_STARTED: {name}')
+        self.running.add(name)
+        return True
+
+    def stopProcess(self, name, wait=True):
+        self.calls.append(('stop', name))
+        if name not in self.running:
+            raise xmlrpc.client.Fault(web.SUPERVISOR_FAULT_NOT_RUNNING, f'NOT_RUNNING: {name}')
+        self.running.discard(name)
+        return True
+
+    def getProcessInfo(self, name):
+        self.calls.append(('info', name))
+        return self._info(name)
+
+    def getAllProcessInfo(self):
+        return [self._info(name) for name in sorted(self.running)]
+
+    def drop_connections(self):
+        """Close every kept-alive connection, as supervisord does with idle ones"""
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+def refused_url():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f'http://127.0.0.1:{port}/RPC2'
+
+
+class SupervisorClientTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubSupervisor()
+        self.addCleanup(self.stub.close)
+        self.client = web.SupervisorClient(self.stub.url, pool_size=2, timeout=2)
+
+    def test_start_stop_and_info(self):
+        self.assertFalse(self.client.start('openconnect-vpn'))
+        self.assertTrue(self.client.start('openconnect-vpn'))  # already running
+        status = web.process_status(self.client.process_info('openconnect-vpn'))
+        self.assertEqual((status['state'], status['pid']), ('RUNNING', 4242))
+        self.assertFalse(self.client.stop('openconnect-vpn'))
+        self.assertTrue(self.client.stop('openconnect-vpn'))  # already stopped
+        self.assertEqual(web.process_status(self.client.process_info('openconnect-vpn'))['pid'], None)
+
+    def test_other_faults_are_raised(self):
+        with self.assertRaises(xmlrpc.client.Fault):
+            self.client.call('noSuchMethod')
+        self.assertEqual(self.client.process_info('x')['name'], 'x')  # the connection survives a fault
+
+    def test_connection_is_reused(self):
+        for _ in range(5):
+            self.client.process_info('openconnect-vpn')
+        self.assertEqual(len(self.stub.connections), 1)
+
+    def test_dropped_idle_connection_is_retried_once(self):
+        self.client.process_info('openconnect-vpn')
+        self.stub.drop_connections()
+        time.sleep(0.1)
+        self.assertFalse(self.client.start('openconnect-vpn'))
+        self.assertEqual(self.stub.calls.count(('start', 'openconnect-vpn')), 1)
+        self.assertEqual(len(self.stub.connections), 2)
+
+    def test_timeout_is_not_retried(self):
+        client = web.SupervisorClient(self.stub.url, timeout=0.3)
+        self.stub.delay = 1
+        with self.assertRaises(OSError):
+            client.start('openconnect-vpn')
+        time.sleep(1)
+        self.assertEqual(self.stub.calls.count(('start', 'openconnect-vpn')), 1)
+
+
+class SupervisorCommandTests(unittest.TestCase):
+
+    def use(self, url, timeout=2):
+        patcher = mock.patch.object(web, 'supervisor_client', web.SupervisorClient(url, timeout=timeout))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ctl = mock.patch.object(web, 'supervisorctl', return_value=(True, 'from supervisorctl'))
+        self.supervisorctl = ctl.start()
+        self.addCleanup(ctl.stop)
+
+    def test_commands_over_rpc(self):
+        stub = StubSupervisor()
+        self.addCleanup(stub.close)
+        self.use(stub.url)
+        self.assertEqual(web.supervisor_command('stop'), (True, 'openconnect-vpn: not running'))
+        self.assertEqual(web.supervisor_command('start'), (True, 'openconnect-vpn: starting'))
+        self.assertEqual(web.supervisor_command('start'), (True, 'openconnect-vpn: already started'))
+        self.assertEqual(web.supervisor_command('restart'), (True, 'openconnect-vpn: restarting'))
+        self.assertEqual(stub.calls[-2:], [('stop', 'openconnect-vpn'), ('start', 'openconnect-vpn')])
+        self.supervisorctl.assert_not_called()
+        with self.assertRaises(ValueError):
+            web.supervisor_command('reload')
+
+    def test_falls_back_to_supervisorctl_when_rpc_is_down(self):
+        self.use(refused_url())
+        self.assertEqual(web.supervisor_command('restart'), (True, 'from supervisorctl'))
+        self.supervisorctl.assert_called_once_with('restart', 'openconnect-vpn')
+        self.use('unix:///nonexistent/supervisor.sock')
+        web.supervisor_command('start')
+        self.supervisorctl.assert_called_once_with('start', 'openconnect-vpn')
+
+    def test_no_fallback_after_a_timeout(self):
+        stub = StubSupervisor()
+        self.addCleanup(stub.close)
+        stub.delay = 1
+        self.use(stub.url, timeout=0.3)
+        ok, message = web.supervisor_command('start')
+        self.assertFalse(ok)
+        self.assertIn('did not answer start', message)
+        self.supervisorctl.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""ConnectTimeline: phase markers from openconnect log lines"""
+
+import time
+import unittest
+
+from .webapp import web
+
+T0 = time.mktime((2024, 5, 1, 9, 0, 0, 0, 0, -1))
+
+SUCCESS = [
+    (0, 'OpenConnect VPN Client version v9.12'),
+    (0, 'POST https://vpn.example.com/'),
+    (1, 'Connected to 203.0.113.10:443'),
+    (2, 'Connected to HTTPS on vpn.example.com with ciphersuite TLS1.3'),
+    (3, 'Password:'),
+    (5, 'Password:'),
+    (15, 'Got CONNECT response: HTTP/1.1 200 OK'),
+    (16, 'CSTP connected. DPD 30, Keepalive 20'),
+    (16, 'Connected as 10.8.0.2, using SSL, with DTLS in progress'),
+    (17, 'Established DTLS connection (using GnuTLS). Ciphersuite (DTLS1.2)-(ECDHE-RSA)-(AES-256-GCM).'),
+]
+
+
+def lines(entries, base=T0):
+    return [time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(base + offset)) + ' ' + text
+            for offset, text in entries]
+
+
+class ConnectTimelineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.timeline = web.ConnectTimeline(history=10, attempt_timeout=60, dtls_grace=10)
+
+    def feed(self, entries, now=None, base=T0):
+        self.timeline.feed(lines(entries, base), now if now is not None else base + entries[-1][0])
+
+    def test_successful_attempt(self):
+        self.feed(SUCCESS)
+        self.assertIsNone(self.timeline.current(T0 + 17))
+        [attempt] = self.timeline.recent()
+        self.assertEqual(attempt['outcome'], 'connected')
+        self.assertEqual(attempt['elapsed'], 17)
+        self.assertEqual(attempt['phases'], {'dns_tcp': 1, 'tls': 1, 'credentials': 3, 'duo': 10, 'cstp': 1,
+                                             'dtls': 1, 'tunnel_setup': 0, 'total': 16})
+        self.assertEqual(attempt['marks']['password_prompt'], 3)
+        self.assertEqual(attempt['marks']['duo_prompt'], 5)
+
+    def test_lines_can_arrive_in_pieces(self):
+        for entry in SUCCESS:
+            self.feed([entry])
+        self.assertEqual(self.timeline.recent()[0]['phases']['duo'], 10)
+
+    def test_connected_attempt_waits_for_dtls(self):
+        self.feed(SUCCESS[:-1])
+        current = self.timeline.current(T0 + 18)
+        self.assertEqual(current['outcome'], 'in_progress')
+        self.timeline.feed([], T0 + 16 + 11)
+        self.assertIsNone(self.timeline.current(T0 + 27))
+        [attempt] = self.timeline.recent()
+        self.assertEqual((attempt['outcome'], attempt['finished']), ('connected', T0 + 16))
+        self.assertNotIn('dtls', attempt['phases'])
+
+    def test_dtls_failure_settles_the_attempt(self):
+        self.feed(SUCCESS[:-1] + [(18, 'DTLS handshake failed: Resource temporarily unavailable, try again.')])
+        [attempt] = self.timeline.recent()
+        self.assertEqual(attempt['outcome'], 'connected')
+        self.assertIn('dtls_failed', attempt['marks'])
+
+    def test_interface_up_counts_after_cstp(self):
+        self.feed(SUCCESS[:8])
+        self.timeline.interface_up(T0 + 16.5)
+        self.assertEqual(self.timeline.current(T0 + 17)['outcome'], 'in_progress')  # DTLS pending
+        self.feed([(17, 'Established DTLS connection')])
+        self.assertEqual(self.timeline.recent()[0]['phases']['tunnel_setup'], 0.5)
+
+    def test_login_failure(self):
+        self.feed(SUCCESS[:5] + [(8, 'Login failed.')])
+        [attempt] = self.timeline.recent()
+        self.assertEqual((attempt['outcome'], attempt['error']), ('failed', 'Login failed.'))
+
+    def test_new_attempt_abandons_the_old_one(self):
+        self.feed(SUCCESS[:4])
+        self.feed(SUCCESS, base=T0 + 100)
+        newest, oldest = self.timeline.recent()
+        self.assertEqual(oldest['outcome'], 'abandoned')
+        self.assertEqual(newest['outcome'], 'connected')
+        self.assertEqual(newest['id'], oldest['id'] + 1)
+
+    def test_timeout(self):
+        self.feed(SUCCESS[:5])
+        self.timeline.feed([], T0 + 61)
+        self.assertEqual(self.timeline.recent()[0]['outcome'], 'timeout')
+
+    def test_lines_outside_an_attempt_are_ignored(self):
+        self.feed([(0, 'Connected as 10.8.0.2'), (1, 'Login failed')])
+        self.assertEqual(self.timeline.recent(), [])
+        self.assertIsNone(self.timeline.current(T0))
+
+    def test_percentiles(self):
+        for i in range(3):
+            self.feed(SUCCESS, base=T0 + i * 100)
+        stats = self.timeline.percentiles()
+        self.assertEqual(stats['duo'], {'count': 3, 'p50': 10, 'p90': 10, 'p95': 10, 'max': 10})
+        self.assertNotIn('nonexistent', stats)
+
+
+class NearestRankTests(unittest.TestCase):
+
+    def test_nearest_rank(self):
+        values = list(range(1, 11))
+        self.assertEqual([web.nearest_rank(values, p) for p in (50, 90, 95, 100)], [5, 9, 10, 10])
+        self.assertEqual(web.nearest_rank([7], 95), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
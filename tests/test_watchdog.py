@@ -0,0 +1,69 @@
+"""TunnelWatchdog: probe rounds, dead-tunnel detection and reconnect gating"""
+
+import socket
+import unittest
+
+from .webapp import web
+
+CONNECTED = {'vpn': web.ProbeSample({'status': 'connected'}, 0)}
+
+
+def closed_udp_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class UnboundProbeTests(unittest.TestCase):
+
+    INTERFACE = 'ocwtest0'  # does not exist, so SO_BINDTODEVICE always fails
+
+    def setUp(self):
+        self.watchdog = web.TunnelWatchdog([f'127.0.0.1:{closed_udp_port()}'], interface=self.INTERFACE,
+                                           interval=0.1, timeout=0.2, reconnect=True)
+        self.addCleanup(self.watchdog.stop)
+        self.addCleanup(web.probe_bind_errors.pop, self.INTERFACE, None)
+
+    def test_bind_failure_is_reported(self):
+        self.assertTrue(self.watchdog.summary()['bound'])
+        self.watchdog.check(CONNECTED)
+        summary = self.watchdog.summary()
+        self.assertFalse(summary['bound'])
+        self.assertTrue(summary['bind_error'])
+
+    def test_dead_but_unbound_tunnel_is_not_reconnected(self):
+        for _ in range(web.HEALTH_DEAD_ROUNDS):
+            state = self.watchdog.check(CONNECTED)
+        self.assertEqual(state, 'dead')
+        self.assertIsNone(self.watchdog.maybe_reconnect())
+        self.assertEqual(self.watchdog.reconnects, 0)
+
+    def test_idle_while_disconnected(self):
+        self.assertEqual(self.watchdog.check({}), 'idle')
+        self.assertEqual(self.watchdog.summary()['sent'], 0)
+
+
+class EvaluateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.watchdog = web.TunnelWatchdog(['127.0.0.1'], reconnect=False)
+        self.addCleanup(self.watchdog.stop)
+
+    def summary(self, rtts):
+        window = web.HealthWindow(20)
+        for rtt in rtts:
+            window.add(rtt)
+        return window.summary()
+
+    def test_states(self):
+        self.assertEqual(self.watchdog.evaluate(self.summary([0.01] * 5)), 'ok')
+        self.assertEqual(self.watchdog.evaluate(self.summary([0.01, None])), 'degraded')
+        self.assertEqual(self.watchdog.evaluate(self.summary([0.01] + [None] * web.HEALTH_DEAD_ROUNDS)), 'dead')
+        slow = web.HEALTH_RTT_DEGRADED_MS / 1000 * 2
+        self.assertEqual(self.watchdog.evaluate(self.summary([slow] * 5)), 'degraded')
+
+
+if __name__ == '__main__':
+    unittest.main()
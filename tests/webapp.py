@@ -0,0 +1,41 @@
+"""Load openconnect-web.py once for the tests
+
+The module's file name is not importable, and importing it builds the
+sampler, registries and history ring, so everything that would touch the
+container (logs, history file, supervisor, profiles) is pointed at a
+scratch directory first. Nothing is started until a test asks for it.
+"""
+
+import atexit
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = 'openconnect_web'
+
+
+def load():
+    if MODULE in sys.modules:
+        return sys.modules[MODULE]
+    scratch = tempfile.mkdtemp(prefix='openconnect-web-tests-')
+    atexit.register(shutil.rmtree, scratch, True)
+    os.environ.update({
+        'LOG_DIR': scratch,
+        'HISTORY_FILE': os.path.join(scratch, 'history.bin'),
+        'VPN_PROFILES_FILE': os.path.join(scratch, 'profiles.json'),
+        'SUPERVISOR_URL': 'http://127.0.0.1:1/RPC2',
+        'HEALTH_TARGETS': '',
+        'DNS_CACHE': 'false',
+    })
+    spec = importlib.util.spec_from_file_location(MODULE, os.path.join(ROOT, 'openconnect-web.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[MODULE] = module
+    spec.loader.exec_module(module)
+    atexit.register(module.shutdown_background)
+    return module
+
+
+web = load()